@@ -0,0 +1,200 @@
+"""
+Асинхронные версии читающих маршрутов API для запуска под ASGI.
+
+Аутентификация, права, согласование формата, фильтры, пагинация, кэш
+страниц рецептов и сборка рецептов из api.projections - те же, что и у
+синхронных viewset'ов, поэтому ответы совпадают байт в байт. Отличие в
+том, что ожидание базы не занимает поток воркера, а независимые запросы
+одного ответа (страница рецептов и подписки читателя, затем теги,
+ингредиенты и признаки рецептов страницы) идут одновременно.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import re_path
+from rest_framework.response import Response
+
+from recipes.models import Recipe
+
+from .cache import (get_page_versions, get_personal_flags,
+                    get_recipe_page_key)
+from .middleware import enter_thread_hooks
+from .projections import (build_recipes, recipe_ingredients, recipe_tags,
+                          recipe_values)
+from .subscriptions import get_followed_ids
+
+
+# У каждого потока своё соединение с базой: размер пула ограничивает
+# число одновременных запросов к ней от одного процесса.
+executor = ThreadPoolExecutor(
+    settings.ASYNC_DB_THREADS, thread_name_prefix='async-db'
+)
+
+
+def in_thread(func):
+    """
+    Синхронную функцию (ORM, кэш) превращает в корутину, выполняемую в
+    пуле потоков. В Django 3.2 нет асинхронного ORM, а отдельный поток
+    даёт каждому вызову своё соединение с базой: несколько таких корутин
+    под asyncio.gather выполняют запросы одновременно. Соединения потоков
+    живут DB_CONN_MAX_AGE секунд, а не закрываются после каждого вызова.
+    Замеры запроса (thread_hooks) охватывают и запросы потока пула.
+    """
+    def call(*args, **kwargs):
+        with ExitStack() as stack:
+            enter_thread_hooks(stack)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                close_old_connections()
+    return sync_to_async(call, thread_sensitive=False, executor=executor)
+
+
+def fetch_page(view, queryset):
+    """Страница (или весь список без пагинации) и признак пагинации."""
+    page = view.paginate_queryset(queryset)
+    if page is None:
+        return list(queryset), False
+    return page, True
+
+
+async def build(rows, followed_ids, request=None):
+    """
+    build_recipes: теги и ингредиенты строк загружаются одновременно, а
+    с request - ещё и признаки is_favorited и is_in_shopping_cart.
+    """
+    ids = [row['id'] for row in rows]
+    loaders = [
+        in_thread(recipe_tags)(ids),
+        in_thread(recipe_ingredients)(ids),
+    ]
+    if request is not None:
+        loaders.append(in_thread(get_personal_flags)(request, ids))
+    tags, ingredients, *flags = await asyncio.gather(*loaders)
+    if flags:
+        for row in rows:
+            row['is_favorited'], row['is_in_shopping_cart'] = (
+                flags[0].get(row['id'], (False, False))
+            )
+    return build_recipes(rows, tags, ingredients, followed_ids)
+
+
+async def offload(view, request, *args, **kwargs):
+    """Действие viewset целиком, но в пуле потоков, а не в воркере."""
+    return await in_thread(getattr(view, view.action))(
+        request, *args, **kwargs
+    )
+
+
+async def recipe_list(view, request, *args, **kwargs):
+    """
+    RecipeViewSet.list: общая страница из кэша RecipeListCacheMixin или
+    страница из базы. Признаки is_favorited и is_in_shopping_cart
+    читаются по id рецептов страницы одновременно с их тегами и
+    ингредиентами, а не подзапросами EXISTS в запросе страницы.
+    """
+    key = get_recipe_page_key(request)
+    if key is not None:
+        versions = await in_thread(get_page_versions)(request)
+        data = await in_thread(view.get_cached_page)(request, key, versions)
+        if data is not None:
+            return Response(data)
+
+    queryset = await in_thread(view.filter_queryset)(
+        recipe_values(Recipe.objects.order_by('-id'))
+    )
+    (rows, paginated), followed_ids = await asyncio.gather(
+        in_thread(fetch_page)(view, queryset),
+        in_thread(get_followed_ids)(request),
+    )
+    data = await build(rows, followed_ids, request)
+    response = (
+        view.get_paginated_response(data) if paginated else Response(data)
+    )
+    if key is not None:
+        await in_thread(view.cache_page)(key, response, versions, rows)
+    return response
+
+
+async def recipe_detail(view, request, *args, **kwargs):
+    """RecipeViewSet.retrieve: рецепт и подписки читателя одновременно."""
+    row, followed_ids = await asyncio.gather(
+        in_thread(view.get_object)(),
+        in_thread(get_followed_ids)(request),
+    )
+    return Response((await build([row], followed_ids))[0])
+
+
+# Имя маршрута роутера -> обработчик GET в асинхронном view.
+ASYNC_HANDLERS = {
+    'recipes-list': recipe_list,
+    'recipes-detail': recipe_detail,
+    'recipes-feed': offload,
+    'recipes-similar': offload,
+    'tags-list': offload,
+    'tags-detail': offload,
+    'ingredients-list': offload,
+    'ingredients-detail': offload,
+    'users-subscriptions': offload,
+}
+
+
+def async_read_view(sync_view, handler):
+    """
+    Асинхронный view вместо sync_view, созданного роутером DRF. Для GET
+    проходит те же шаги, что APIView.dispatch, и вызывает их у самого
+    viewset'а: в DRF нет асинхронного dispatch. Остальные методы
+    передаёт sync_view.
+    """
+    viewset = sync_view.cls
+
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            # Не sync_to_async по умолчанию: под ASGI в Django 3.2 такие
+            # вызовы всех запросов выполняются в одном потоке по очереди.
+            return await in_thread(sync_view)(request, *args, **kwargs)
+        self = viewset(**sync_view.initkwargs)
+        self.action_map = sync_view.actions
+        for method, action in sync_view.actions.items():
+            setattr(self, method, getattr(self, action))
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await in_thread(self.initial)(request, *args, **kwargs)
+            response = await handler(self, request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+    view.cls = viewset
+    view.initkwargs = sync_view.initkwargs
+    view.actions = sync_view.actions
+    # CSRF проверяет сам DRF, как и у синхронного view.
+    view.csrf_exempt = True
+    return view
+
+
+def async_read_urls(urls):
+    """
+    Маршруты роутера, где view из ASYNC_HANDLERS заменены асинхронными.
+    Порядок сохраняется: действия вроде recipes/download_shopping_cart/
+    должны проверяться раньше recipes/<pk>/.
+    """
+    return [
+        re_path(
+            str(url.pattern),
+            async_read_view(url.callback, ASYNC_HANDLERS[url.name]),
+            name=url.name,
+        ) if url.name in ASYNC_HANDLERS else url
+        for url in urls
+    ]
@@ -0,0 +1,299 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, F, OuterRef, Value
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from recipes.models import DataVersion, Favorite, Recipe, ShoppingCart
+
+from .projections import RECIPE_VALUES
+from .subscriptions import get_followed_ids
+
+
+def get_reference_version():
+    """
+    Версия справочников (тегов и ингредиентов) из базы: во всех
+    процессах одна и та же, даже если кэш у каждого свой. Время её
+    изменения - Last-Modified.
+    """
+    return DataVersion.current(DataVersion.REFERENCE)
+
+
+def bump_reference_version():
+    DataVersion.bump(DataVersion.REFERENCE)
+
+
+class ReferenceDataCacheMixin:
+    """
+    Отдаёт справочные данные из кэша уже отрендеренными и сжатыми
+    байтами с ETag и Last-Modified, отвечая 304, если клиент прислал
+    актуальные If-None-Match или If-Modified-Since. Ключ кэша включает
+    версию справочников из базы и тип ответа с параметрами (indent),
+    поэтому изменения сбрасывают его сами во всех процессах, а ETag у
+    одинаковых байтов один и тот же.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, view_method, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return view_method(request, *args, **kwargs)
+        version = get_reference_version()
+        last_modified = int(version.modified.timestamp())
+        key = 'reference:{}:{}:{}'.format(
+            version.version,
+            last_modified,
+            hashlib.md5(repr((
+                request.accepted_media_type, request.get_full_path()
+            )).encode()).hexdigest()
+        )
+        entry = cache.get(key)
+        if entry is None:
+            response = view_method(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = request.accepted_renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context(),
+            )
+            entry = {
+                'content': content,
+                'gzip': gzip.compress(content),
+                'digest': hashlib.sha1(content).hexdigest(),
+            }
+            cache.set(key, entry, settings.REFERENCE_CACHE_TIMEOUT)
+
+        use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        etag = '"{}{}"'.format(entry['digest'], '-gzip' if use_gzip else '')
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            content_type = request.accepted_media_type
+            if request.accepted_renderer.charset:
+                content_type = '{}; charset={}'.format(
+                    content_type, request.accepted_renderer.charset
+                )
+            response = HttpResponse(
+                entry['gzip'] if use_gzip else entry['content'],
+                content_type=content_type,
+            )
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
+
+PERSONAL_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+FALSE_VALUES = ('', '0', 'false', 'False')
+# Версии состава страниц списка рецептов (DataVersion): добавление и
+# удаление любых рецептов, изменения, от которых зависят фильтры по
+# тегам, тексту и ингредиентам, и добавление и удаление рецептов автора.
+RECIPES_VERSION = 'recipes'
+RECIPES_CONTENT_VERSION = 'recipes:content'
+AUTHOR_VERSION = 'recipes:author:{}'
+CONTENT_FILTERS = ('tags', 'search', 'have')
+# Поля строки рецепта, по которым проверяется страница из кэша: сам
+# рецепт (modified меняется при любом его изменении) и его автор.
+STAMP_FIELDS = ('modified',) + tuple(
+    name for name in RECIPE_VALUES if name.startswith('author__')
+)
+
+
+def bump_recipe_versions(*names):
+    for name in names:
+        DataVersion.bump(name)
+
+
+def bump_all_recipe_versions():
+    """После массовой загрузки рецептов устаревают все страницы."""
+    bump_recipe_versions(RECIPES_VERSION, RECIPES_CONTENT_VERSION)
+    DataVersion.objects.filter(
+        name__startswith=AUTHOR_VERSION.format('')
+    ).update(version=F('version') + 1)
+
+
+def get_page_version_names(request):
+    """
+    Версии, от которых зависит состав страницы: справочники и либо
+    рецепты автора из ?author=, либо все рецепты, а с фильтрами по
+    содержимому - ещё и любые их изменения.
+    """
+    params = request.query_params
+    names = [DataVersion.REFERENCE]
+    if any(name in params for name in CONTENT_FILTERS):
+        return names + [RECIPES_VERSION, RECIPES_CONTENT_VERSION]
+    try:
+        return names + [AUTHOR_VERSION.format(int(params['author']))]
+    except (KeyError, ValueError):
+        return names + [RECIPES_VERSION]
+
+
+def get_page_versions(request):
+    """Номера версий страницы одним запросом; нет строки - версия 0."""
+    versions = dict.fromkeys(get_page_version_names(request), 0)
+    versions.update(DataVersion.objects.filter(
+        name__in=versions
+    ).values_list('name', 'version'))
+    return versions
+
+
+def get_recipe_page_key(request):
+    """
+    Ключ общей для всех пользователей страницы списка рецептов или None,
+    если страница зависит от пользователя (фильтры избранного и корзины).
+    """
+    params = []
+    for name, values in sorted(request.query_params.lists()):
+        if name in PERSONAL_FILTERS:
+            if any(value not in FALSE_VALUES for value in values):
+                return None
+            continue
+        if name != 'format':
+            params.append((name, sorted(values)))
+    return 'recipe-page:{}'.format(hashlib.md5(repr((
+        request.accepted_media_type, request.get_host(), params
+    )).encode()).hexdigest())
+
+
+def get_stamps(rows):
+    return {
+        row['id']: tuple(row[name] for name in STAMP_FIELDS)
+        for row in rows
+    }
+
+
+class RecipeListCacheMixin:
+    """
+    Кэширует данные страницы списка рецептов, не зависящие от
+    пользователя. Страница из кэша проверяется по базе, поэтому
+    изменения видны во всех процессах сразу: версии состава страницы
+    (get_page_version_names) - одним запросом, а рецепты страницы и их
+    авторы - вторым, который заодно читает признаки is_favorited и
+    is_in_shopping_cart текущего пользователя. Изменение рецепта, не
+    попавшего на страницу, её не сбрасывает.
+    """
+
+    def list(self, request, *args, **kwargs):
+        key = get_recipe_page_key(request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+        # Версии читаются до страницы: если она изменится, пока строится
+        # ответ, в кэше окажется уже устаревшая версия.
+        versions = get_page_versions(request)
+        data = self.get_cached_page(request, key, versions)
+        if data is not None:
+            return Response(data)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset if page is None else page)
+        data = self.get_serializer(rows, many=True).data
+        response = (
+            Response(data) if page is None
+            else self.get_paginated_response(data)
+        )
+        self.cache_page(key, response, versions, rows)
+        return response
+
+    def get_cached_page(self, request, key, versions):
+        """
+        Страница из кэша с признаками текущего пользователя или None,
+        если её нет или она устарела.
+        """
+        entry = cache.get(key)
+        if entry is None or entry['versions'] != versions:
+            return None
+        states = get_recipe_states(request, entry['stamps'])
+        if {pk: state[0] for pk, state in states.items()} != (
+            entry['stamps']
+        ):
+            return None
+        data = entry['data']
+        apply_personal_flags(
+            get_results(data),
+            {pk: state[1:] for pk, state in states.items()},
+            get_followed_ids(request),
+        )
+        return data
+
+    @staticmethod
+    def cache_page(key, response, versions, rows):
+        if response.status_code == 200:
+            cache.set(key, {
+                'data': response.data,
+                'versions': versions,
+                'stamps': get_stamps(rows),
+            }, settings.RECIPE_CACHE_TIMEOUT)
+
+
+def get_results(data):
+    return data['results'] if isinstance(data, dict) else data
+
+
+def get_recipe_states(request, ids):
+    """
+    Словарь id рецепта -> (поля STAMP_FIELDS, is_favorited,
+    is_in_shopping_cart) одним запросом; у анонимного признаки False.
+    """
+    if not ids:
+        return {}
+    queryset = Recipe.objects.filter(id__in=ids)
+    flags = ('is_favorited', 'is_in_shopping_cart')
+    if request.user.is_authenticated:
+        queryset = queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=request.user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=request.user, recipe=OuterRef('pk')
+            )),
+        )
+    else:
+        queryset = queryset.annotate(
+            is_favorited=Value(False), is_in_shopping_cart=Value(False)
+        )
+    return {
+        row['id']: (
+            tuple(row[name] for name in STAMP_FIELDS),
+            *(row[name] for name in flags),
+        )
+        for row in queryset.values('id', *STAMP_FIELDS, *flags)
+    }
+
+
+def get_personal_flags(request, ids):
+    """
+    Словарь id рецепта -> (is_favorited, is_in_shopping_cart) для
+    текущего пользователя одним запросом.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    return {
+        pk: state[1:]
+        for pk, state in get_recipe_states(request, ids).items()
+    }
+
+
+def apply_personal_flags(results, flags, followed_ids):
+    for recipe in results:
+        recipe['is_favorited'], recipe['is_in_shopping_cart'] = (
+            flags.get(recipe['id'], (False, False))
+        )
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in followed_ids
+        )
@@ -1,7 +1,12 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
+from django.db.models import Case, FloatField, Value, When
 from django_filters.rest_framework import FilterSet, filters
 
+from recipes.coverage import recipe_coverage_index
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 User = get_user_model()
 
@@ -14,6 +19,10 @@ class IngredientFilter(FilterSet):
         fields = ['name']
 
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
@@ -24,11 +33,12 @@ class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    have = NumberInFilter(method='filter_have')
 
     class Meta:
         model = Recipe
         fields = ['tags', 'author']
-        ordering = ['-id']
 
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -41,3 +51,27 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(cart__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_have(self, queryset, name, value):
+        """
+        Рецепты, которые можно приготовить из ингредиентов value (id
+        через запятую): по индексу в памяти, по убыванию доли имеющихся
+        ингредиентов рецепта.
+        """
+        found = defaultdict(list)
+        for coverage, recipe_id in recipe_coverage_index.search(
+            int(pk) for pk in value
+        ):
+            found[coverage].append(recipe_id)
+        if not found:
+            return queryset.none()
+        return queryset.filter(
+            id__in=[pk for ids in found.values() for pk in ids]
+        ).alias(coverage=Case(
+            *(When(id__in=ids, then=Value(coverage))
+              for coverage, ids in found.items()),
+            output_field=FloatField(),
+        )).order_by('-coverage', '-id')
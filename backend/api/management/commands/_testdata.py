@@ -0,0 +1,16 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def test_database():
+    """Временная тестовая база: создаётся перед блоком и удаляется после."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
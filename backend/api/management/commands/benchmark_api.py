@@ -0,0 +1,434 @@
+import base64
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from io import BytesIO, StringIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                            RecipeImageUpload, ShoppingCart, Tag)
+from users.models import Subscribe
+
+from ._testdata import test_database
+
+User = get_user_model()
+
+# Сценарий - один запрос к API. path и data могут быть функциями от
+# номера итерации, cleanup вызывается после каждого запроса и в замер
+# не входит. Без content_type data отправляется как JSON.
+Scenario = namedtuple(
+    'Scenario', 'name method path data status cleanup content_type',
+    defaults=(None, 200, None, None)
+)
+
+
+def tiny_png():
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), (200, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def tiny_image():
+    return 'data:image/png;base64,' + base64.b64encode(tiny_png()).decode()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percent / 100 * len(values)))]
+
+
+def build_scenarios(reader):
+    """
+    Маршруты api.urls с данными, подобранными для пользователя reader.
+    Сценариям добавления нужны чужой рецепт не из избранного и корзины
+    reader и автор, на которого он не подписан. При малом --scale
+    таких может не быть: тогда один рецепт и один автор освобождаются,
+    база всё равно временная.
+    """
+    others = Recipe.objects.exclude(author=reader).order_by('pk')
+    other_recipe = others.exclude(favorites__user=reader).exclude(
+        cart__user=reader
+    ).first() or others.first()
+    own_recipe = Recipe.objects.filter(author=reader).order_by('pk').first()
+    authors = User.objects.exclude(pk=reader.pk).order_by('pk')
+    author = authors.exclude(
+        subscribing__follower=reader
+    ).first() or authors.first()
+    if None in (other_recipe, own_recipe, author):
+        raise CommandError(
+            'Для сценариев нужны рецепты читателя и других авторов: '
+            'увеличьте --scale.'
+        )
+    Favorite.objects.filter(user=reader, recipe=other_recipe).delete()
+    ShoppingCart.objects.filter(user=reader, recipe=other_recipe).delete()
+    Subscribe.objects.filter(follower=reader, following=author).delete()
+    tag = Tag.objects.order_by('pk').first()
+    have = ','.join(str(pk) for pk in AmountIngredient.objects.filter(
+        recipe=other_recipe
+    ).order_by('pk').values_list('ingredient_id', flat=True)[:5])
+    word = other_recipe.name.split()[0]
+    ingredients = list(
+        Ingredient.objects.order_by('pk').values_list('pk', flat=True)[:10]
+    )
+    recipe_body = {
+        'ingredients': [{'id': pk, 'amount': 2} for pk in ingredients],
+        'tags': [tag.pk],
+        'image': tiny_image(),
+        'name': 'Рецепт для замера',
+        'text': 'Описание',
+        'cooking_time': 15,
+    }
+
+    patch_body = {
+        key: value for key, value in recipe_body.items() if key != 'image'
+    }
+
+    def delete_created(response):
+        Recipe.objects.filter(pk=response.json()['id']).delete()
+
+    def remove(model, **lookup):
+        return lambda response: model.objects.filter(**lookup).delete()
+
+    # Фронтенд всегда запрашивает списки рецептов страницами по 6.
+    return (
+        Scenario('recipe_list', 'get', '/api/recipes/?limit=6'),
+        Scenario('recipe_list_page', 'get', '/api/recipes/?page=3&limit=6'),
+        Scenario('recipe_list_cursor', 'get', '/api/recipes/?cursor=&limit=6'),
+        Scenario(
+            'recipe_list_tags', 'get', f'/api/recipes/?limit=6&tags={tag.slug}'
+        ),
+        Scenario(
+            'recipe_list_author', 'get',
+            f'/api/recipes/?limit=6&author={other_recipe.author_id}'
+        ),
+        Scenario(
+            'recipe_list_search', 'get',
+            '/api/recipes/?' + urlencode({'limit': 6, 'search': word})
+        ),
+        Scenario(
+            'recipe_list_have', 'get',
+            '/api/recipes/?' + urlencode({'limit': 6, 'have': have})
+        ),
+        Scenario(
+            'recipe_list_favorited', 'get',
+            '/api/recipes/?limit=6&is_favorited=1'
+        ),
+        Scenario(
+            'recipe_list_in_cart', 'get',
+            '/api/recipes/?limit=6&is_in_shopping_cart=1'
+        ),
+        Scenario('recipe_detail', 'get', f'/api/recipes/{other_recipe.pk}/'),
+        Scenario(
+            'recipe_similar', 'get',
+            f'/api/recipes/{other_recipe.pk}/similar/'
+        ),
+        Scenario('feed', 'get', '/api/recipes/feed/?limit=6'),
+        Scenario(
+            'image_upload', 'post', '/api/recipes/images/', tiny_png(), 201,
+            lambda response: RecipeImageUpload.objects.filter(
+                pk=response.json()['id']
+            ).delete(),
+            content_type='image/png',
+        ),
+        Scenario(
+            'recipe_create', 'post', '/api/recipes/', recipe_body, 201,
+            delete_created
+        ),
+        Scenario(
+            'recipe_patch', 'patch', f'/api/recipes/{own_recipe.pk}/',
+            lambda i: dict(patch_body, name=f'Рецепт {i}')
+        ),
+        Scenario(
+            'favorite_add', 'post',
+            f'/api/recipes/{other_recipe.pk}/favorite/', status=201,
+            cleanup=remove(Favorite, user=reader, recipe=other_recipe)
+        ),
+        Scenario(
+            'shopping_cart_add', 'post',
+            f'/api/recipes/{other_recipe.pk}/shopping_cart/', status=201,
+            cleanup=remove(ShoppingCart, user=reader, recipe=other_recipe)
+        ),
+        Scenario(
+            'download_txt', 'get',
+            '/api/recipes/download_shopping_cart/?format=txt'
+        ),
+        Scenario(
+            'download_csv', 'get',
+            '/api/recipes/download_shopping_cart/?format=csv'
+        ),
+        Scenario(
+            'download_pdf', 'get',
+            '/api/recipes/download_shopping_cart/?format=pdf'
+        ),
+        Scenario(
+            'subscriptions', 'get', '/api/users/subscriptions/?limit=6'
+        ),
+        Scenario(
+            'subscribe', 'post', f'/api/users/{author.pk}/subscribe/',
+            status=201,
+            cleanup=remove(Subscribe, follower=reader, following=author)
+        ),
+        Scenario('user_list', 'get', '/api/users/?limit=6'),
+        Scenario('user_me', 'get', '/api/users/me/'),
+        Scenario('user_detail', 'get', f'/api/users/{author.pk}/'),
+        Scenario('tag_list', 'get', '/api/tags/'),
+        Scenario('ingredient_list', 'get', '/api/ingredients/'),
+        Scenario(
+            'ingredient_search', 'get',
+            '/api/ingredients/?' + urlencode({'name': 'ингредиент 1'})
+        ),
+    )
+
+
+def run(client, scenario, iteration):
+    send = getattr(client, scenario.method)
+    data = scenario.data
+    if callable(data):
+        data = data(iteration)
+    if data is None:
+        response = send(scenario.path)
+    elif scenario.content_type:
+        response = send(
+            scenario.path, data, content_type=scenario.content_type
+        )
+    else:
+        response = send(scenario.path, data, format='json')
+    # Потоковые ответы вычитываются целиком, чтобы замер их учитывал.
+    if response.streaming:
+        response.getvalue()
+    return response
+
+
+def measure(client, scenario, iterations, warmup):
+    """
+    Прогоняет сценарий: warmup запросов без замера, iterations замеров
+    времени и ещё один запрос под tracemalloc для пикового потребления
+    памяти и числа SQL-запросов.
+    """
+    timings = []
+    for iteration in range(warmup + iterations):
+        started = time.perf_counter()
+        response = run(client, scenario, iteration)
+        elapsed = time.perf_counter() - started
+        if response.status_code != scenario.status:
+            raise CommandError(
+                f'{scenario.name}: ожидался статус {scenario.status}, '
+                f'получен {response.status_code}: {response.content[:300]}'
+            )
+        if scenario.cleanup:
+            scenario.cleanup(response)
+        if iteration >= warmup:
+            timings.append(elapsed * 1000)
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        response = run(client, scenario, warmup + iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if scenario.cleanup:
+        scenario.cleanup(response)
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'queries': len(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(report, baseline, thresholds):
+    """Список регрессий относительно базового отчёта."""
+    regressions = []
+    for name, result in report['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if (result[metric] > base[metric] * thresholds['latency']
+                    and result[metric] - base[metric]
+                    > thresholds['latency_floor_ms']):
+                regressions.append(
+                    f'{name}: {metric} {base[metric]} -> {result[metric]}'
+                )
+        if result['queries'] > base['queries'] + thresholds['queries']:
+            regressions.append(
+                f'{name}: запросов {base["queries"]} -> {result["queries"]}'
+            )
+        if result['peak_kib'] > base['peak_kib'] * thresholds['memory']:
+            regressions.append(
+                f'{name}: память {base["peak_kib"]} KiB -> '
+                f'{result["peak_kib"]} KiB'
+            )
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет временную базу данными и замеряет маршруты API: p50/p95 '
+        'времени ответа, число SQL-запросов и пик памяти. Пишет JSON-отчёт '
+        'и сравнивает его с сохранённым базовым отчётом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--only', nargs='+', metavar='NAME',
+            help='Замерить только перечисленные сценарии.'
+        )
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Отключить кэш, чтобы замерять сами view и сериализаторы.'
+        )
+        parser.add_argument(
+            '--report', default=os.path.join(
+                settings.BASE_DIR, 'benchmark_report.json'
+            )
+        )
+        parser.add_argument(
+            '--baseline', default=os.path.join(
+                settings.BASE_DIR, 'benchmark_baseline.json'
+            )
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Сохранить отчёт как базовый вместо сравнения.'
+        )
+        parser.add_argument(
+            '--latency-threshold', type=float, default=1.25,
+            help='Допустимый рост p50/p95 во сколько раз.'
+        )
+        parser.add_argument(
+            '--latency-floor', type=float, default=1.0,
+            help='Рост времени меньше этого числа мс не считается.'
+        )
+        parser.add_argument(
+            '--queries-threshold', type=int, default=0,
+            help='Сколько лишних SQL-запросов допустимо.'
+        )
+        parser.add_argument(
+            '--memory-threshold', type=float, default=1.5,
+            help='Допустимый рост пика памяти во сколько раз.'
+        )
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        cache_backend = (
+            'django.core.cache.backends.dummy.DummyCache'
+            if options['no_cache']
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        )
+        # Отдельный кэш и каталог медиа, чтобы не задеть рабочие данные.
+        # Копии фото строятся синхронно: фоновые процессы искажали бы
+        # замеры остальных маршрутов.
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            CACHES={'default': {
+                'BACKEND': cache_backend, 'LOCATION': 'benchmark'
+            }},
+            IMAGE_RENDITION_WORKERS=0,
+        )
+        try:
+            with overrides, test_database():
+                caches['default'].clear()
+                report = self.benchmark(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        target = options['baseline'] if options['save_baseline'] else (
+            options['report']
+        )
+        with open(target, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Отчёт записан в {target}')
+        if options['save_baseline']:
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(
+                'Базовый отчёт не найден, сравнение пропущено. Сохраните '
+                'его флагом --save-baseline.'
+            )
+            return
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        for key in ('vendor', 'dataset', 'cache'):
+            if baseline['meta'][key] != report['meta'][key]:
+                self.stdout.write(self.style.WARNING(
+                    f'Базовый отчёт снят с другим {key}: '
+                    f'{baseline["meta"][key]}, сравнение неточно.'
+                ))
+        regressions = compare(report, baseline, {
+            'latency': options['latency_threshold'],
+            'latency_floor_ms': options['latency_floor'],
+            'queries': options['queries_threshold'],
+            'memory': options['memory_threshold'],
+        })
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            raise CommandError(f'Найдено регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def benchmark(self, options):
+        dataset = {key: options[key] for key in ('scale', 'seed')}
+        started = time.monotonic()
+        call_command('generate_data', stdout=StringIO(), **dataset)
+        call_command('build_similar_recipes', stdout=StringIO())
+        self.stdout.write(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'
+        )
+        # Читатель - автор с самой большой корзиной: ему есть что
+        # редактировать и что выгружать в список покупок.
+        reader = User.objects.filter(recipes_count__gt=0).annotate(
+            cart_size=Count('shoppingcart')
+        ).order_by('-cart_size', 'pk').first()
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(
+            HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=reader).key
+        )
+        scenarios = build_scenarios(reader)
+        if options['only']:
+            scenarios = [s for s in scenarios if s.name in options['only']]
+        endpoints = {}
+        self.stdout.write(
+            f'{"сценарий":<24}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"запросов":>10}{"пик, KiB":>12}'
+        )
+        for scenario in scenarios:
+            result = measure(
+                client, scenario, options['iterations'], options['warmup']
+            )
+            endpoints[scenario.name] = result
+            self.stdout.write(
+                f'{scenario.name:<24}{result["p50_ms"]:>10}'
+                f'{result["p95_ms"]:>10}{result["queries"]:>10}'
+                f'{result["peak_kib"]:>12}'
+            )
+        return {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'dataset': dataset,
+                'iterations': options['iterations'],
+                'cache': not options['no_cache'],
+            },
+            'endpoints': endpoints,
+        }
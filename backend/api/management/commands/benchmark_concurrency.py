@@ -0,0 +1,329 @@
+import asyncio
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from io import StringIO
+from types import ModuleType
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import include, path
+from rest_framework.authtoken.models import Token
+
+from api.urls import get_urls
+from recipes.models import Favorite, Ingredient, Recipe
+
+from ._testdata import test_database
+from .benchmark_api import percentile
+
+User = get_user_model()
+
+# Режимы: синхронный gunicorn с --workers процессами, ASGI с прежними
+# синхронными view и ASGI с асинхронными view на чтение.
+MODES = ('wsgi', 'asgi-sync', 'asgi')
+
+
+def build_urlconf(async_views):
+    """Модуль URL, как api.urls с ASYNC_READ_ENDPOINTS и без."""
+    module = ModuleType(f'benchmark_urls_{int(async_views)}')
+    module.urlpatterns = [
+        path('api/', include((get_urls(async_views), 'api')))
+    ]
+    return module
+
+
+def build_paths(reader):
+    recipe = Recipe.objects.exclude(author=reader).order_by('pk').first()
+    favorited = Favorite.objects.filter(user=reader).exists()
+    prefix = Ingredient.objects.order_by('pk').first().name[:2]
+    return {
+        'recipes': '/api/recipes/?limit=6',
+        'recipes-favorited': '/api/recipes/?limit=6&is_favorited={}'.format(
+            int(favorited)
+        ),
+        'recipe-detail': f'/api/recipes/{recipe.pk}/',
+        'tags': '/api/tags/',
+        'ingredients-search': '/api/ingredients/?' + urlencode(
+            {'name': prefix}
+        ),
+        'subscriptions': '/api/users/subscriptions/?limit=6',
+    }
+
+
+class DatabaseLatency:
+    """
+    Добавляет к каждому SQL-запросу паузу, как сетевой обмен с
+    PostgreSQL на отдельном сервере. Пауза отпускает GIL, как и
+    настоящее ожидание сокета. Считает и открытые соединения: с сетевой
+    базой каждое стоит нескольких обменов.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.opened = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def add(self, sender, connection, **kwargs):
+        if sender is not None:
+            self.opened += 1
+        # Повторно открытое соединение - тот же объект с теми же обёртками.
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        # Потоки пулов открывают свои соединения уже во время замеров.
+        connection_created.connect(self.add)
+        for connection in connections.all():
+            self.add(None, connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.add)
+        for connection in connections.all():
+            connection.execute_wrappers.remove(self)
+
+
+def wsgi_get(handler, url, token):
+    parts = urlsplit(url)
+    request = RequestFactory().get(
+        parts.path, QUERY_STRING=parts.query, SERVER_NAME='localhost',
+        HTTP_AUTHORIZATION=f'Token {token}',
+    )
+    status = []
+    body = b''.join(handler(
+        request.environ,
+        lambda status_line, headers: status.append(int(status_line[:3])),
+    ))
+    return status[0], body
+
+
+async def asgi_get(application, url, token):
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'authorization', f'Token {token}'.encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status'], b''.join(
+        message.get('body', b'') for message in messages[1:]
+    )
+
+
+def run_wsgi(url, token, requests, concurrency, workers):
+    """
+    concurrency клиентов шлют запросы друг за другом, обрабатывают их
+    workers синхронных воркеров, как у gunicorn: время ответа включает
+    ожидание свободного воркера.
+    """
+    handler = WSGIHandler()
+    free_workers = threading.Semaphore(workers)
+    latencies, responses = [], []
+
+    def client(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            with free_workers:
+                responses.append(wsgi_get(handler, url, token))
+            latencies.append(time.perf_counter() - started)
+        connections.close_all()
+
+    threads = [
+        threading.Thread(target=client, args=(count,))
+        for count in split(requests, concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, responses
+
+
+def run_asgi(url, token, requests, concurrency):
+    """concurrency клиентов в одном цикле событий, как у uvicorn."""
+    application = get_asgi_application()
+    latencies, responses = [], []
+
+    async def client(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            responses.append(await asgi_get(application, url, token))
+            latencies.append(time.perf_counter() - started)
+
+    async def clients():
+        await asyncio.gather(*(
+            client(count) for count in split(requests, concurrency)
+        ))
+
+    started = time.perf_counter()
+    asyncio.run(clients())
+    return time.perf_counter() - started, latencies, responses
+
+
+def split(total, parts):
+    return [total // parts + (i < total % parts) for i in range(parts)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность читающих маршрутов под '
+        'синхронным WSGI и под ASGI с синхронными и асинхронными view при '
+        'одновременных запросах и проверяет, что ответы совпадают.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help='Сколько клиентов шлют запросы одновременно.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число синхронных воркеров в режиме wsgi.'
+        )
+        parser.add_argument(
+            '--db-latency', type=float, default=1.0,
+            help='Задержка каждого SQL-запроса в мс, как у сетевой базы.'
+        )
+        parser.add_argument(
+            '--only', nargs='+', metavar='NAME',
+            help='Замерить только перечисленные сценарии.'
+        )
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Отключить кэш, чтобы замерять сами запросы к базе.'
+        )
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        cache_backend = (
+            'django.core.cache.backends.dummy.DummyCache'
+            if options['no_cache']
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        )
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            CACHES={'default': {
+                'BACKEND': cache_backend, 'LOCATION': 'benchmark'
+            }},
+            IMAGE_RENDITION_WORKERS=0,
+            SQL_INSTRUMENTATION=False,
+        )
+        try:
+            with overrides, test_database():
+                self.benchmark(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def benchmark(self, options):
+        call_command(
+            'generate_data', stdout=StringIO(),
+            scale=options['scale'], seed=options['seed'],
+        )
+        reader = User.objects.annotate(
+            follows=Count('subscriber')
+        ).order_by('-follows', 'pk').first()
+        token = Token.objects.create(user=reader).key
+        paths = build_paths(reader)
+        if options['only']:
+            paths = {
+                name: url for name, url in paths.items()
+                if name in options['only']
+            }
+        self.stdout.write(
+            f'{options["concurrency"]} клиентов, {options["requests"]} '
+            f'запросов на сценарий, задержка базы '
+            f'{options["db_latency"]} мс, wsgi-воркеров '
+            f'{options["workers"]}'
+        )
+        self.stdout.write(
+            f'{"сценарий":<20}{"режим":<11}{"запр/с":>9}'
+            f'{"p50, мс":>10}{"p95, мс":>10}{"x к wsgi":>10}'
+            f'{"соедин.":>8}'
+        )
+        mismatches = []
+        latency = DatabaseLatency(options['db_latency'] / 1000)
+        with latency:
+            for name, url in paths.items():
+                if not self.compare_modes(name, url, token, options, latency):
+                    mismatches.append(name)
+        if mismatches:
+            raise CommandError(
+                'Ответы асинхронных view отличаются от синхронных: '
+                + ', '.join(mismatches)
+            )
+        self.stdout.write(self.style.SUCCESS('Ответы всех режимов совпадают.'))
+
+    def compare_modes(self, name, url, token, options, latency):
+        """Замер одного сценария во всех режимах; True, если ответы равны."""
+        bodies = {}
+        for mode in MODES:
+            caches['default'].clear()
+            opened = latency.opened
+            urlconf = build_urlconf(async_views=mode == 'asgi')
+            with override_settings(ROOT_URLCONF=urlconf):
+                if mode == 'wsgi':
+                    elapsed, latencies, responses = run_wsgi(
+                        url, token, options['requests'],
+                        options['concurrency'], options['workers'],
+                    )
+                else:
+                    elapsed, latencies, responses = run_asgi(
+                        url, token, options['requests'],
+                        options['concurrency'],
+                    )
+            statuses = {status for status, _ in responses}
+            if statuses != {200}:
+                raise CommandError(
+                    f'{name} ({mode}): ответы со статусами {statuses}'
+                )
+            bodies[mode] = {body for _, body in responses}
+            throughput = len(responses) / elapsed
+            if mode == 'wsgi':
+                baseline = throughput
+            self.stdout.write(
+                f'{name:<20}{mode:<11}{throughput:>9.1f}'
+                f'{statistics.median(latencies) * 1000:>10.1f}'
+                f'{percentile(latencies, 95) * 1000:>10.1f}'
+                f'{throughput / baseline:>10.2f}'
+                f'{latency.opened - opened:>8}'
+            )
+        return len(set.union(*bodies.values())) == 1
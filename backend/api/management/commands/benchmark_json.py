@@ -0,0 +1,170 @@
+import datetime
+import os
+import timeit
+import uuid
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import IngredientSerializer, TagSerializer
+from recipes.models import Ingredient, Recipe, Tag
+
+from ._testdata import test_database
+
+User = get_user_model()
+
+
+def types_payload():
+    """Все типы, которые встречаются в ответах API, и особые символы."""
+    now = timezone.now()
+    return {
+        'decimal': [Decimal('12.50'), Decimal('0.00001'), Decimal('1E+20')],
+        'datetime': [now, now.replace(microsecond=0), timezone.localtime(
+            now, datetime.timezone(datetime.timedelta(hours=3))
+        ), datetime.datetime(2023, 1, 2, 3, 4, 5)],
+        'date': datetime.date(2023, 1, 2),
+        'time': datetime.time(12, 30),
+        'timedelta': datetime.timedelta(minutes=90),
+        'uuid': uuid.UUID(int=1),
+        'lazy': gettext_lazy('Рецепт'),
+        'text': 'Щи да каша "</script>" \\ \t\x01\x7f',
+        'errors': ValidationError({'name': ['Обязательное поле.']}).detail,
+        'set': {1},
+        'tuple': (1, 'два', None, True, 2.5),
+        'ints': [0, -1, 2 ** 63 - 1, 2 ** 64],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает FastJSONRenderer и FastJSONParser со стандартными '
+        'JSONRenderer и JSONParser на настоящих ответах API: проверяет, '
+        'что байты совпадают, и замеряет время.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--catalogue', default=os.path.join(
+                os.path.dirname(settings.BASE_DIR), 'data',
+                'ingredients.csv',
+            ),
+            help='Справочник ингредиентов, загружаемый в базу замера.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз повторить замер; берётся лучший.'
+        )
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен: быстрые классы используют json.'
+            ))
+        overrides = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark',
+        }}, IMAGE_RENDITION_WORKERS=0)
+        with overrides, test_database():
+            call_command(
+                'generate_data', stdout=StringIO(),
+                scale=options['scale'], seed=options['seed'],
+            )
+            if os.path.exists(options['catalogue']):
+                call_command(
+                    'load_catalogue', options['catalogue'],
+                    stdout=StringIO(),
+                )
+            payloads = self.payloads()
+        self.stdout.write(
+            f'{"данные":<20}{"KiB":>8}{"json, мс":>11}{"orjson, мс":>12}'
+            f'{"x":>7}{"разбор json":>13}{"orjson":>9}{"x":>7}'
+        )
+        mismatches = []
+        for name, data in payloads.items():
+            expected = JSONRenderer().render(data)
+            if FastJSONRenderer().render(data) != expected:
+                mismatches.append(f'{name}: рендеринг')
+            parsed = JSONParser().parse(BytesIO(expected))
+            if FastJSONParser().parse(BytesIO(expected)) != parsed:
+                mismatches.append(f'{name}: разбор')
+            render = self.measure(
+                lambda renderer: renderer.render(data),
+                JSONRenderer(), FastJSONRenderer(), options['repeat'],
+            )
+            parse = self.measure(
+                lambda parser: parser.parse(BytesIO(expected)),
+                JSONParser(), FastJSONParser(), options['repeat'],
+            )
+            self.stdout.write(
+                f'{name:<20}{len(expected) / 1024:>8.1f}'
+                f'{render[0]:>11.3f}{render[1]:>12.3f}'
+                f'{render[0] / render[1]:>7.1f}'
+                f'{parse[0]:>13.3f}{parse[1]:>9.3f}'
+                f'{parse[0] / parse[1]:>7.1f}'
+            )
+        if mismatches:
+            raise CommandError(
+                'Результат отличается от стандартного: '
+                + ', '.join(mismatches)
+            )
+        self.stdout.write(self.style.SUCCESS('Результаты совпадают.'))
+
+    @staticmethod
+    def measure(call, standard, fast, repeat):
+        """Лучшее время одного вызова в мс для стандартного и быстрого."""
+        result = []
+        for instance in (standard, fast):
+            timer = timeit.Timer(lambda: call(instance))
+            number, _ = timer.autorange()
+            result.append(
+                min(timer.repeat(repeat, number)) / number * 1000
+            )
+        return result
+
+    def payloads(self):
+        """Данные ответов API до рендеринга, как их получает рендерер."""
+        reader = User.objects.annotate(
+            follows=Count('subscriber')
+        ).order_by('-follows', 'pk').first()
+        client = APIClient(SERVER_NAME='localhost')
+        client.credentials(
+            HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=reader).key
+        )
+        recipe = Recipe.objects.order_by('pk').first()
+        # Справочники отдаются из кэша готовыми байтами, поэтому их
+        # данные строятся сериализаторами напрямую.
+        payloads = {
+            'ingredients': IngredientSerializer(
+                Ingredient.objects.all(), many=True
+            ).data,
+            'tags': TagSerializer(Tag.objects.all(), many=True).data,
+        }
+        for name, url in (
+            ('recipes-page', '/api/recipes/?limit=6'),
+            ('recipes-100', '/api/recipes/?limit=100'),
+            ('recipe-detail', f'/api/recipes/{recipe.pk}/'),
+            ('subscriptions', '/api/users/subscriptions/?limit=6'),
+        ):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: статус {response.status_code}')
+            payloads[name] = response.data
+        payloads['types'] = types_payload()
+        return payloads
@@ -0,0 +1,132 @@
+import shutil
+import tempfile
+import timeit
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Exists, OuterRef
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from api.projections import RecipeProjectionSerializer, recipe_values
+from api.serializers import RecipeSerializer
+from api.views import recipes_with_related
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+from ._testdata import test_database
+
+User = get_user_model()
+
+
+def flags(user):
+    """Признаки читателя, как в RecipeViewSet.get_queryset."""
+    return {
+        'is_favorited': Exists(Favorite.objects.filter(
+            user=user.id, recipe=OuterRef('pk')
+        )),
+        'is_in_shopping_cart': Exists(ShoppingCart.objects.filter(
+            user=user.id, recipe=OuterRef('pk')
+        )),
+    }
+
+
+def build_request(user):
+    request = RequestFactory().get('/api/recipes/')
+    request.user = user
+    return request
+
+
+def drop_renditions():
+    """generate_data даёт копии фото всем рецептам: у части их убираем."""
+    ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+    Recipe.objects.filter(pk__in=list(ids[::2])).update(renditions={})
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время сборки рецептов через RecipeSerializer и через '
+        'values() (api.projections). Совпадение ответов проверяет '
+        'api.tests.RecipeProjectionTests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[6, 20, 100],
+            help='Размеры страниц для замера.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз повторить замер; берётся лучший.'
+        )
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'benchmark',
+            }},
+            IMAGE_RENDITION_WORKERS=0,
+            SQL_INSTRUMENTATION=False,
+        )
+        try:
+            with overrides, test_database():
+                caches['default'].clear()
+                call_command(
+                    'generate_data', stdout=StringIO(),
+                    scale=options['scale'], seed=options['seed'],
+                )
+                drop_renditions()
+                reader = User.objects.annotate(
+                    follows=Count('subscriber')
+                ).order_by('-follows', 'pk').first()
+                self.benchmark(reader, options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def benchmark(self, reader, options):
+        self.stdout.write(
+            f'{"рецептов":>9}{"serializer, мс":>16}{"values(), мс":>14}'
+            f'{"x":>6}{"мкс/рецепт":>12}{"мкс/рецепт":>12}'
+        )
+        request = build_request(reader)
+        for size in options['sizes']:
+            models = recipes_with_related().annotate(**flags(reader))[:size]
+            rows = recipe_values(
+                Recipe.objects.order_by('-id'), **flags(reader)
+            )[:size]
+
+            def serializer():
+                request._followed_ids = None
+                return RecipeSerializer(
+                    list(models.all()), many=True,
+                    context={'request': request},
+                ).data
+
+            def projection():
+                request._followed_ids = None
+                return RecipeProjectionSerializer(
+                    list(rows.all()), many=True,
+                    context={'request': request},
+                ).data
+
+            times = []
+            for call in (serializer, projection):
+                timer = timeit.Timer(call)
+                number, _ = timer.autorange()
+                times.append(
+                    min(timer.repeat(options['repeat'], number)) / number
+                )
+            count = len(projection())
+            self.stdout.write(
+                f'{count:>9}{times[0] * 1000:>16.2f}'
+                f'{times[1] * 1000:>14.2f}{times[0] / times[1]:>6.1f}'
+                f'{times[0] / count * 1e6:>12.0f}'
+                f'{times[1] / count * 1e6:>12.0f}'
+            )
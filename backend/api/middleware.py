@@ -0,0 +1,202 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('api.sql')
+
+# Сколько раз должен повториться один и тот же запрос, чтобы считаться
+# дублем (типичный признак N+1).
+DUPLICATE_THRESHOLD = 3
+# Списки параметров разной длины в IN (...) - один и тот же запрос.
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+# Замеры текущего запроса для потоков пула асинхронных view: фабрики
+# контекстных менеджеров, в которые входит каждый вызов in_thread. У
+# потока пула свои соединения, обёртки потока запроса их не видят.
+thread_hooks = ContextVar('thread_hooks', default=())
+
+
+@contextmanager
+def thread_hook(hook):
+    """Пока блок выполняется, вызовы in_thread входят в hook()."""
+    token = thread_hooks.set(thread_hooks.get() + (hook,))
+    try:
+        yield
+    finally:
+        thread_hooks.reset(token)
+
+
+def enter_thread_hooks(stack):
+    for hook in thread_hooks.get():
+        stack.enter_context(hook())
+
+
+def wrap_connections(wrapper):
+    """wrapper на всех соединениях текущего потока, пока открыт стек."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+class RequestQueries:
+    """
+    Обёртка execute_wrapper: считает запросы и время в базе. Запросы
+    одного ответа могут идти одновременно из потоков пула асинхронных
+    view, поэтому счётчики меняются под блокировкой.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.shapes = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            with self.lock:
+                self.duration += duration
+                self.count += 1
+                self.shapes[IN_LIST.sub('IN (...)', sql)] += 1
+
+    def duplicates(self):
+        return {
+            sql: count for sql, count in self.shapes.most_common()
+            if count >= DUPLICATE_THRESHOLD
+        }
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Для каждого запроса считает SQL-запросы, время в базе, повторяющиеся
+    запросы и время view и рендеринга ответа. Отдаёт их в заголовке
+    Server-Timing и строкой JSON в логгер api.sql, а при превышении
+    SQL_QUERY_BUDGETS пишет предупреждение.
+
+    Включается SQL_INSTRUMENTATION=True; выключенный middleware Django
+    исключает из цепочки и он ничего не стоит. DEBUG не нужен: запросы
+    перехватываются через connection.execute_wrapper.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = RequestQueries()
+        request._timings = timings = {}
+        started = time.perf_counter()
+        stack = ExitStack()
+        with stack:
+            stack.enter_context(wrap_connections(queries))
+            with thread_hook(partial(wrap_connections, queries)):
+                response = self.get_response(request)
+            if response.streaming:
+                # Потоковый ответ читает базу уже после выхода из
+                # middleware: замер продолжается до конца тела ответа.
+                response.streaming_content = self.measure_stream(
+                    request, response, response.streaming_content,
+                    queries, timings, started, stack.pop_all()
+                )
+                self.set_header(response, queries, timings)
+                return response
+        timings['total'] = time.perf_counter() - started
+        self.set_header(response, queries, timings)
+        self.log(request, response, queries, timings)
+        return response
+
+    def measure_stream(self, request, response, content, queries, timings,
+                       started, stack):
+        with stack:
+            yield from content
+        timings['total'] = time.perf_counter() - started
+        self.log(request, response, queries, timings)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timings['view_started'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после выхода из view: время view
+        # включает построение serializer.data, время render - JSON.
+        timings = request._timings
+        timings['render_started'] = time.perf_counter()
+
+        def rendered(response):
+            timings['rendered'] = time.perf_counter()
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def get_budget(request, view_name):
+        budgets = settings.SQL_QUERY_BUDGETS
+        return budgets.get(
+            f'{request.method} {view_name}',
+            budgets.get(view_name, settings.SQL_QUERY_BUDGET)
+        )
+
+    @staticmethod
+    def get_metrics(queries, timings):
+        metrics = {'db': queries.duration}
+        view_started = timings.get('view_started')
+        render_started = timings.get('render_started')
+        if view_started and render_started:
+            metrics['view'] = render_started - view_started
+            metrics['render'] = timings.get('rendered', render_started) - (
+                render_started
+            )
+        if 'total' in timings:
+            metrics['total'] = timings['total']
+        return metrics
+
+    def set_header(self, response, queries, timings):
+        metrics = self.get_metrics(queries, timings)
+        duplicates = queries.duplicates()
+        response['Server-Timing'] = ', '.join(
+            [f'db;dur={metrics.pop("db") * 1000:.1f};'
+             f'desc="{queries.count} SQL"']
+            + [
+                f'{name};dur={value * 1000:.1f}'
+                for name, value in metrics.items()
+            ]
+            + ([f'dup;desc="{sum(duplicates.values())} SQL"']
+               if duplicates else [])
+        )
+
+    def log(self, request, response, queries, timings):
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        budget = self.get_budget(request, view_name)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': queries.count,
+            'budget': budget,
+            'duplicates': queries.duplicates(),
+        }
+        record.update(
+            (f'{name}_ms', round(value * 1000, 1))
+            for name, value in self.get_metrics(queries, timings).items()
+        )
+        logger.info(json.dumps(record, ensure_ascii=False))
+        if queries.count > budget:
+            logger.warning(
+                'Превышен бюджет SQL-запросов %s %s: %s из %s',
+                request.method, view_name, queries.count, budget
+            )
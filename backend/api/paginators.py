@@ -1,5 +1,80 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по стабильному ключу сортировки: страница
+    выбирается условием по ключу вместо OFFSET и без COUNT(*). Больший
+    limit уменьшается до max_page_size.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = '-id'
 
 
 class PageLimitPagination(PageNumberPagination):
+    """
+    Пагинация ?page=&limit=. Если в запросе есть параметр cursor
+    (для первой страницы - пустой), ответ строится курсорной
+    пагинацией с непрозрачными ссылками next/previous и без count.
+    """
     page_size_query_param = 'limit'
+    cursor_pagination_class = LimitCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedCursorPagination(LimitCursorPagination):
+    """
+    Курсорная пагинация ленты подписок. Страница - не queryset, а id
+    рецептов, которые возвращает fetch(limit, before): курсор хранит id
+    последнего рецепта страницы, ссылки ведут только вперёд.
+    """
+
+    def paginate_feed(self, fetch, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        before = None
+        if cursor is not None and cursor.position is not None:
+            try:
+                before = int(cursor.position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+        recipe_ids = fetch(self.page_size + 1, before)
+        self.next_position = None
+        if len(recipe_ids) > self.page_size:
+            self.next_position = recipe_ids[self.page_size - 1]
+        return recipe_ids[:self.page_size]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=str(self.next_position)
+        ))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
@@ -0,0 +1,36 @@
+import codecs
+from io import BytesIO
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import FastJSONRenderer, orjson
+
+# Целые длиннее 64 бит orjson читает как float, json - как int. Такие
+# тела ищутся по 20 цифрам подряд: translate оставляет только цифры
+# (как 0) и быстрее регулярного выражения в разы.
+DIGITS_ONLY = bytes(48 if 48 <= byte <= 57 else 32 for byte in range(256))
+LONG_NUMBER = b'0' * 20
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser на orjson, если он установлен. Тело, которое orjson не
+    принял, разбирает JSONParser: ошибки и их тексты остаются прежними,
+    как и разбор того, что json принимает, а orjson нет (числа больше
+    64 бит, 1e400, одиночные суррогаты).
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if body.translate(DIGITS_ONLY).find(LONG_NUMBER) == -1:
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(BytesIO(body), media_type, parser_context)
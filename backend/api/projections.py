@@ -0,0 +1,120 @@
+"""
+Быстрый путь чтения рецептов: ответ RecipeSerializer из строк values()
+без объектов моделей и вложенных сериализаторов. Рецепты с авторами -
+одна строка на рецепт, теги и ингредиенты страницы - по одному запросу
+плоских кортежей. Ключи берутся из Meta.fields сериализаторов, поэтому
+порядок полей в ответе тот же; совпадение байт в байт проверяет
+api.tests.RecipeProjectionTests.
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from recipes.models import AmountIngredient, Recipe
+from recipes.renditions import rendition_urls
+
+from .serializers import (AmountIngredientSerializer, TagSerializer,
+                          UserSerializer)
+from .subscriptions import get_followed_ids
+
+AUTHOR_FIELDS = tuple(
+    name for name in UserSerializer.Meta.fields if name != 'is_subscribed'
+)
+TAG_FIELDS = tuple(TagSerializer().fields)
+INGREDIENT_FIELDS = AmountIngredientSerializer.Meta.fields
+# Поля values() для строки рецепта: сам рецепт и его автор. modified
+# в ответ не попадает, по нему проверяется кэш страниц (api.cache).
+RECIPE_VALUES = (
+    'id', 'name', 'image', 'renditions', 'text', 'cooking_time',
+    'modified',
+) + tuple(f'author__{name}' for name in AUTHOR_FIELDS)
+
+image_storage = Recipe._meta.get_field('image').storage
+
+
+def recipe_values(queryset, **expressions):
+    """Строки рецептов для build_recipes; expressions - признаки."""
+    return queryset.values(*RECIPE_VALUES, **expressions)
+
+
+def recipe_tags(ids):
+    """Словарь id рецепта -> список тегов, теги по возрастанию id."""
+    tags = defaultdict(list)
+    for recipe_id, *values in Recipe.tags.through.objects.filter(
+        recipe_id__in=ids
+    ).order_by('tag_id').values_list(
+        'recipe_id', *(f'tag__{name}' for name in TAG_FIELDS)
+    ):
+        tags[recipe_id].append(dict(zip(TAG_FIELDS, values)))
+    return tags
+
+
+def recipe_ingredients(ids):
+    """Словарь id рецепта -> ингредиенты в порядке добавления."""
+    ingredients = defaultdict(list)
+    for recipe_id, *values in AmountIngredient.objects.filter(
+        recipe_id__in=ids
+    ).order_by('pk').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurument_unit', 'amount',
+    ):
+        ingredients[recipe_id].append(dict(zip(INGREDIENT_FIELDS, values)))
+    return ingredients
+
+
+def build_recipes(rows, tags, ingredients, followed_ids):
+    """
+    Словари ответа RecipeSerializer. В строках rows должны быть
+    is_favorited и is_in_shopping_cart.
+    """
+    author_values = tuple(f'author__{name}' for name in AUTHOR_FIELDS)
+    result = []
+    for row in rows:
+        author = dict(zip(
+            AUTHOR_FIELDS, [row[name] for name in author_values]
+        ))
+        author['is_subscribed'] = author['id'] in followed_ids
+        image_url = image_storage.url(row['image'])
+        result.append({
+            'id': row['id'],
+            'tags': tags.get(row['id'], []),
+            'author': author,
+            'ingredients': ingredients.get(row['id'], []),
+            'is_favorited': bool(row['is_favorited']),
+            'is_in_shopping_cart': bool(row['is_in_shopping_cart']),
+            'name': row['name'],
+            'image': image_url,
+            'images': rendition_urls(
+                image_url, row['image'], row['renditions']
+            ),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        })
+    return result
+
+
+def project_recipes(rows, request):
+    ids = [row['id'] for row in rows]
+    return build_recipes(
+        rows, recipe_tags(ids), recipe_ingredients(ids),
+        get_followed_ids(request),
+    )
+
+
+class RecipeProjectionListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        return project_recipes(list(data), self.context['request'])
+
+
+class RecipeProjectionSerializer(serializers.BaseSerializer):
+    """
+    Только для чтения: тот же ответ, что у RecipeSerializer, но из строк
+    recipe_values(). Список строится сразу для всей страницы.
+    """
+
+    class Meta:
+        list_serializer_class = RecipeProjectionListSerializer
+
+    def to_representation(self, instance):
+        return project_recipes([instance], self.context['request'])[0]
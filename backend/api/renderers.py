@@ -0,0 +1,110 @@
+from decimal import Decimal
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Дата и время - через кодировщик DRF: orjson пишет UTC как +00:00,
+# а DRF как Z.
+ORJSON_OPTIONS = orjson and (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+# Числа с плавающей точкой в этом диапазоне orjson и json записывают
+# одинаково; вне его у orjson другая запись порядка (1e-5, 1e16).
+SAME_FLOAT_RANGE = (1e-4, 1e16)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если он установлен. Байты ответа те же:
+    UTF-8 без экранирования, компактные разделители, экранированные
+    U+2028 и U+2029, а типы, которых orjson не знает (Decimal, дата и
+    время, ленивые строки), переводит кодировщик DRF.
+
+    Отступы (browsable API, ?indent=) и всё, что orjson не смог
+    записать, рендерит JSONRenderer. Обычные float вне SAME_FLOAT_RANGE
+    и NaN orjson записал бы иначе, но таких полей в API нет.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data, default=self.get_default(), option=ORJSON_OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
+
+    def get_default(self):
+        encode = self.encoder_class().default
+
+        def default(obj):
+            if isinstance(obj, Decimal) and obj and not (
+                obj.is_finite()
+                and SAME_FLOAT_RANGE[0] <= abs(obj) < SAME_FLOAT_RANGE[1]
+            ):
+                # Ошибка вернёт рендеринг JSONRenderer.
+                raise TypeError
+            return encode(obj)
+        return default
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """
+    Рендерер выгрузки списка покупок. Файл формирует сама view,
+    через рендерер проходят только ответы с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return JSONRenderer().render(data)
+
+
+class TxtRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CsvRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PdfRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class ShoppingCartContentNegotiation(DefaultContentNegotiation):
+    """
+    Формат выгрузки задаётся только параметром ?format=,
+    без него отдаётся txt независимо от заголовка Accept.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        export_format = format_suffix or request.query_params.get(
+            self.settings.URL_FORMAT_OVERRIDE
+        )
+        if export_format:
+            renderers = self.filter_renderers(renderers, export_format)
+        return renderers[0], renderers[0].media_type
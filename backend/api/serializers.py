@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import (
     UserCreateSerializer as DjoserUserCreateSerializer
@@ -8,12 +9,26 @@ from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 
 from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
-                            ShoppingCart, Tag)
+                            RecipeImageUpload, ShoppingCart, Tag)
+from recipes.renditions import get_rendition_urls
 from users.models import Subscribe
 
+from .subscriptions import get_followed_ids
+
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    """Проверяет параметр recipes_limit один раз на запрос."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if not recipes_limit:
+        return None
+    if not recipes_limit.isdigit():
+        message = 'Параметр recipes_limit должен быть числом'
+        raise serializers.ValidationError(message)
+    return int(recipes_limit)
+
+
 class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -29,15 +44,16 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class AmountIngredientSerializer(serializers.ModelSerializer):
-    amount = serializers.SerializerMethodField()
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurument_unit = serializers.ReadOnlyField(
+        source='ingredient.measurument_unit'
+    )
 
     class Meta:
-        model = Ingredient
+        model = AmountIngredient
         fields = ('id', 'name', 'measurument_unit', 'amount')
 
-    def get_amount(self, obj):
-        return obj.ingredient.values('amount')[0]['amount']
-
 
 class UserSerializer(serializers.ModelSerializer):
     # is_subscribed = serializers.BooleanField(read_only=True)
@@ -49,26 +65,27 @@ class UserSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(follower=user, following=obj).exists()
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return obj.id in get_followed_ids(self.context.get('request'))
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
     tags = TagSerializer(many=True)
-    ingredients = AmountIngredientSerializer(many=True)
+    ingredients = AmountIngredientSerializer(many=True, source='recipe')
     author = UserSerializer(read_only=True)
     image = serializers.SerializerMethodField(
         method_name='get_image_url',
     )
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
+                  'is_in_shopping_cart', 'name', 'image', 'images', 'text',
                   'cooking_time')
         read_only_fields = (
             'is_favorite',
@@ -78,12 +95,19 @@ class RecipeSerializer(serializers.ModelSerializer):
     def get_image_url(self, obj):
         return obj.image.url
 
+    def get_images(self, obj):
+        return get_rendition_urls(obj)
+
+
+class RecipeImageUploadSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = RecipeImageUpload
+        fields = ('id', 'image')
+
 
 class IngredientsAmountSerializer(serializers.ModelSerializer):
-    id = serializers.SlugRelatedField(
-        slug_field='id',
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
 
     class Meta:
         fields = ('id', 'amount')
@@ -98,7 +122,13 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         many=True,
         queryset=Tag.objects.all()
     )
-    image = Base64ImageField()
+    image = Base64ImageField(required=False)
+    image_id = serializers.PrimaryKeyRelatedField(
+        queryset=RecipeImageUpload.objects.all(),
+        source='image_upload',
+        write_only=True,
+        required=False,
+    )
 
     class Meta:
         model = Recipe
@@ -106,6 +136,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'ingredients',
             'tags',
             'image',
+            'image_id',
             'name',
             'text',
             'cooking_time',
@@ -113,10 +144,35 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('author',)
 
+    def validate_ingredients(self, value):
+        ingredients = Ingredient.objects.in_bulk(
+            [ingredient['id'] for ingredient in value]
+        )
+        for ingredient in value:
+            if ingredient['id'] not in ingredients:
+                raise serializers.ValidationError(
+                    f'Ингредиента с id={ingredient["id"]} не существует.'
+                )
+            ingredient['id'] = ingredients[ingredient['id']]
+        return value
+
+    def validate_image_id(self, value):
+        if value.owner != self.context.get('request').user:
+            raise serializers.ValidationError(
+                'Фото загружено другим пользователем.'
+            )
+        return value
+
     def validate(self, data):
         ingredients = data.get('ingredients')
         tags = data.get('tags')
         cooking_time = data.get('cooking_time')
+        if self.instance is None and not (
+                data.get('image') or data.get('image_upload')):
+            raise serializers.ValidationError(
+                'Добавьте фото рецепта: image в base64 или image_id '
+                'загруженного файла.'
+            )
         if len(ingredients) == 0:
             raise serializers.ValidationError(
                 'Необходимо указать ингредиенты для рецепта.'
@@ -132,63 +188,80 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             set_ingr.add(ingredient)
         if len(tags) == 0:
             raise serializers.ValidationError('Укажите теги рецепта')
-
-        for tag in tags:
-            if tag not in Tag.objects.all():
-                raise serializers.ValidationError(
-                    'Такого тега не существует!'
-                )
         if cooking_time <= 0:
             raise serializers.ValidationError(
                 'Время приготовления не может быть 0 или меньше.'
             )
         return data
 
-    # @transaction.atomic()
-    # def create(self, validated_data):
-    #     ingredients = validated_data.pop('ingredients')
-    #     tags = validated_data.pop('tags')
-    #     image = validated_data.pop('image')
-    #     recipe = Recipe.objects.create(image=image, **validated_data)
-    #     create_ingredients = [AmountIngredient(
-    #         recipe=recipe,
-    #         ingredient=ingredient['id'],
-    #         amount=ingredient['amount']
-    #         )
-    #         for ingredient in ingredients
-    #     ]
-    #     AmountIngredient.objects.bulk_create(
-    #         create_ingredients
-    #     )
-    #     recipe.tags.set(tags)
-    #     return recipe
-
     def add_ingredients(self, instance, ingrs_data):
-        for ingredients in ingrs_data:
-            ingridient, amount = ingredients.values()
-            through = AmountIngredient(
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(
                 recipe=instance,
-                ingredient=ingridient,
-                amount=amount,
+                ingredient=ingredient['id'],
+                amount=ingredient['amount'],
             )
-            through.save()
+            for ingredient in ingrs_data
+        )
         return instance
 
+    def update_ingredients(self, instance, ingrs_data):
+        """
+        Приводит ингредиенты рецепта к ingrs_data: добавляет новые,
+        обновляет изменившиеся количества и удаляет лишние строки,
+        не более чем за четыре запроса.
+        """
+        current = {
+            amount.ingredient_id: amount
+            for amount in AmountIngredient.objects.filter(recipe=instance)
+        }
+        new_amounts = []
+        changed_amounts = []
+        for ingredient in ingrs_data:
+            amount = current.pop(ingredient['id'].id, None)
+            if amount is None:
+                new_amounts.append(ingredient)
+            elif amount.amount != ingredient['amount']:
+                amount.amount = ingredient['amount']
+                changed_amounts.append(amount)
+        if current:
+            # Без сигналов post_delete, как bulk_create и bulk_update:
+            # рецепт сохраняется в той же транзакции, его сигналы уже
+            # обновили версии кэша и индекс. Иначе delete() читал бы
+            # строки заново и обновлял рецепт за каждую из них.
+            deleted = AmountIngredient.objects.filter(
+                id__in=[amount.id for amount in current.values()]
+            )
+            deleted._raw_delete(deleted.db)
+        if changed_amounts:
+            AmountIngredient.objects.bulk_update(changed_amounts, ['amount'])
+        return self.add_ingredients(instance, new_amounts)
+
+    def attach_uploaded_image(self, validated_data):
+        upload = validated_data.pop('image_upload', None)
+        if upload is None:
+            return
+        # Строка удаляется раньше, чем рецепт сошлётся на файл: если её
+        # уже удалила purge_image_uploads, файла тоже нет.
+        if not RecipeImageUpload.objects.filter(pk=upload.pk).delete()[0]:
+            raise serializers.ValidationError(
+                {'image_id': 'Загруженное фото устарело, загрузите его снова.'}
+            )
+        validated_data['image'] = upload.image.name
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
+        self.attach_uploaded_image(validated_data)
         instance = super().create(validated_data)
         return self.add_ingredients(instance, ingredients_data)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
+        self.attach_uploaded_image(validated_data)
         super().update(instance, validated_data)
-        instance.ingredients.clear()
-        self.add_ingredients(
-            instance, ingredients_data
-        )
-        instance.tags.set(tags)
-        instance.save()
+        self.update_ingredients(instance, ingredients_data)
         return instance
 
 
@@ -268,7 +341,6 @@ class CartRecipeSerializer(AddDeleteMixin):
 
 class UserSubscribtionsSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -276,26 +348,17 @@ class UserSubscribtionsSerializer(UserSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        recipes_limit = self.context.get(
-            'request').query_params.get('recipes_limit')
-        if recipes_limit:
-            if not recipes_limit.isdigit():
-                message = 'Параметр recipes_limit должен быть числом'
-                raise serializers.ValidationError(message)
-            recipes_limit = int(recipes_limit)
-            if recipes_limit < 0:
-                message = 'Параметр recipes_limit должен быть больше 0'
-                raise serializers.ValidationError(message)
-
+        recipes = getattr(obj, 'recent_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.order_by('-id')[
+                :self.context.get('recipes_limit')
+            ]
         serializer = UserRecipeSerializer(
-            obj.recipes.all()[:recipes_limit],
+            recipes,
             many=True,
         )
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class SubscribeAddDeleteSerializer(serializers.ModelSerializer):
 
@@ -0,0 +1,143 @@
+import csv
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.http import FileResponse, StreamingHttpResponse
+
+from recipes.models import AmountIngredient
+
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+PDF_SPOOL_SIZE = 1024 * 1024
+PDF_TRUNCATED = 'Список не поместился, полностью он есть в txt и CSV.'
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def get_ingredients(user):
+    """
+    Суммарное количество каждого ингредиента из корзины пользователя
+    в стабильном порядке: по названию, затем по единице измерения.
+    """
+    return AmountIngredient.objects.filter(
+        recipe__cart__user=user
+    ).values(
+        ingridient=F('ingredient__name'),
+        measure=F('ingredient__measurument_unit'),
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by('ingridient', 'measure')
+
+
+def iter_txt(user, ingredients):
+    yield f'Список покупок для: {user.first_name}\n\n'
+    for ing in ingredients:
+        yield (
+            f'{ing["ingridient"].capitalize()}'
+            f'({ing["measure"]}): - {ing["amount"]} \n'
+        )
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(ingredients):
+    writer = csv.writer(Echo())
+    # BOM нужен, чтобы Excel открывал кириллицу в UTF-8.
+    yield '\ufeff' + writer.writerow(
+        ('Ингредиент', 'Единица измерения', 'Количество')
+    )
+    for ing in ingredients:
+        yield writer.writerow(
+            (ing['ingridient'].capitalize(), ing['measure'], ing['amount'])
+        )
+
+
+def get_pdf_font():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        try:
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT)
+            )
+        except Exception:
+            # Без TTF-шрифта кириллица не отобразится, но файл соберётся.
+            return 'Helvetica'
+    return PDF_FONT_NAME
+
+
+def build_pdf(user, ingredients):
+    """
+    Рисует список постранично. reportlab держит все страницы в памяти до
+    pdf.save(), поэтому их не больше SHOPPING_CART_PDF_MAX_PAGES: в
+    списке по строке на ингредиент, и обрезается он только при
+    небывалом числе ингредиентов в корзине, о чём говорит последняя
+    строка. Готовый файл небольшим остаётся в памяти, большим
+    сбрасывается на диск.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = SpooledTemporaryFile(max_size=PDF_SPOOL_SIZE)
+    font = get_pdf_font()
+    _, height = A4
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    pdf.setFont(font, PDF_FONT_SIZE)
+    y = height - PDF_MARGIN
+    pages = 1
+    for line in iter_txt(user, ingredients):
+        line = line.strip()
+        if y < PDF_MARGIN:
+            if pages == settings.SHOPPING_CART_PDF_MAX_PAGES:
+                # Последняя строка - в нижнем поле страницы.
+                pdf.drawString(PDF_MARGIN, y, PDF_TRUNCATED)
+                break
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+            pages += 1
+        pdf.drawString(PDF_MARGIN, y, line)
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    buffer.seek(0)
+    return buffer
+
+
+def shopping_cart_response(user, export_format):
+    """
+    Файл со списком покупок. Строки списка читаются из базы до ответа:
+    под ASGI тело StreamingHttpResponse перебирается в цикле событий, где
+    ORM недоступен. Строк не больше, чем разных ингредиентов в корзине, а
+    текст из них по-прежнему формируется по мере отправки.
+    """
+    ingredients = list(get_ingredients(user))
+    filename = f'{user.username}_shopping_cart.{export_format}'
+    if export_format == 'pdf':
+        return FileResponse(
+            build_pdf(user, ingredients),
+            as_attachment=True,
+            filename=filename,
+            content_type=CONTENT_TYPES['pdf'],
+        )
+    content = (
+        iter_csv(ingredients) if export_format == 'csv'
+        else iter_txt(user, ingredients)
+    )
+    response = StreamingHttpResponse(
+        content, content_type=CONTENT_TYPES[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
@@ -0,0 +1,72 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
+from recipes.signals import catalogue_loaded
+
+from .cache import (AUTHOR_VERSION, RECIPES_CONTENT_VERSION, RECIPES_VERSION,
+                    bump_all_recipe_versions, bump_recipe_versions,
+                    bump_reference_version)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(catalogue_loaded, sender=Tag)
+@receiver(catalogue_loaded, sender=Ingredient)
+def reference_data_changed(sender, **kwargs):
+    # Версия в базе меняется в одной транзакции со справочником: после
+    # коммита её видят все процессы, при откате она откатится с ним.
+    bump_reference_version()
+
+
+# Версии состава страниц меняются в одной транзакции с рецептами, как
+# и версия справочников. Содержимое страниц из кэша проверяется по
+# modified рецептов и полям их авторов.
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_recipe_versions(
+            RECIPES_VERSION, AUTHOR_VERSION.format(instance.author_id)
+        )
+    else:
+        bump_recipe_versions(RECIPES_CONTENT_VERSION)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    bump_recipe_versions(
+        RECIPES_VERSION, AUTHOR_VERSION.format(instance.author_id)
+    )
+
+
+# Ингредиенты и теги API сохраняет вместе с рецептом, его modified уже
+# новый; изменения в обход рецепта (админка, shell) обновляют его сами.
+@receiver(post_save, sender=AmountIngredient)
+@receiver(post_delete, sender=AmountIngredient)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    touch_recipes([instance.recipe_id])
+    bump_recipe_versions(RECIPES_CONTENT_VERSION)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        touch_recipes([instance.pk])
+    elif pk_set:
+        touch_recipes(pk_set)
+    bump_recipe_versions(RECIPES_CONTENT_VERSION)
+
+
+@receiver(catalogue_loaded, sender=Recipe)
+def recipes_loaded(sender, **kwargs):
+    bump_all_recipe_versions()
+
+
+def touch_recipes(ids):
+    Recipe.objects.filter(id__in=ids).update(modified=timezone.now())
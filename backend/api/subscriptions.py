@@ -0,0 +1,18 @@
+from users.models import Subscribe
+
+
+def get_followed_ids(request):
+    """
+    Множество id авторов, на которых подписан текущий пользователь.
+    Загружается одним запросом и запоминается на время запроса.
+    """
+    followed_ids = getattr(request, '_followed_ids', None)
+    if followed_ids is None:
+        user = request.user
+        followed_ids = set() if user.is_anonymous else set(
+            Subscribe.objects.filter(
+                follower=user
+            ).values_list('following_id', flat=True)
+        )
+        request._followed_ids = followed_ids
+    return followed_ids
@@ -0,0 +1,1944 @@
+import base64
+import copy
+import csv
+import gzip
+import json
+import math
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from datetime import time as dt_time
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import urlencode
+from uuid import UUID
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection, connections
+from django.db.models import Count, Exists, OuterRef
+from django.db.models.signals import post_save
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from profiler.models import RequestProfile
+from profiler.sampling import StackSampler
+from recipes.autocomplete import ingredient_index
+from recipes.coverage import recipe_coverage_index
+from recipes.feed import follow, unfollow
+from recipes.management.commands.reconcile_counters import (COUNTERS,
+                                                            actual_count)
+from recipes.models import (AmountIngredient, DataVersion, Favorite,
+                            FeedItem, Ingredient, Recipe, RecipeImageUpload,
+                            RecipeSimilarity, ShoppingCart, Tag)
+from recipes.renditions import FORMATS as RENDITION_FORMATS
+from recipes.renditions import (RENDITION_LABELS, RENDITIONS,
+                                build_renditions, save_renditions)
+from recipes.similarity import RecipeMatrix
+from users.models import Subscribe
+
+from . import async_views, renderers
+from .cache import get_results
+from .paginators import LimitCursorPagination
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .serializers import RecipeCreateUpdateSerializer, RecipeSerializer
+from .urls import get_urls
+from .views import recipes_with_related
+
+User = get_user_model()
+
+
+class GeneratedDataTestCase(TestCase):
+    """
+    Данные generate_data на 100 рецептов. Фото рецептов пишутся во
+    временный MEDIA_ROOT, кэш - локальный и очищается перед каждым
+    тестом.
+    """
+    client_class = APIClient
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='foodgram-tests-')
+        cls.test_settings = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'tests',
+            }},
+            IMAGE_RENDITION_WORKERS=0,
+            SQL_INSTRUMENTATION=False,
+        )
+        cls.test_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.test_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_data', scale=0.01, stdout=StringIO())
+        # Читатель с подписками, избранным и корзиной.
+        cls.reader = User.objects.annotate(
+            follows=Count('subscriber')
+        ).filter(
+            Exists(Favorite.objects.filter(user=OuterRef('pk'))),
+            Exists(ShoppingCart.objects.filter(user=OuterRef('pk'))),
+        ).order_by('-follows', 'pk').first()
+        cls.token = Token.objects.create(user=cls.reader).key
+        cls.recipe = Recipe.objects.order_by('pk').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+
+class GenerateDataTests(GeneratedDataTestCase):
+
+    def test_sequences_reset(self):
+        # На SQLite команд сброса нет: проверяется, что они выполняются.
+        statement = 'SELECT 1 AS sequence_reset'
+        with mock.patch.object(
+            connection.ops, 'sequence_reset_sql', return_value=[statement]
+        ) as reset, CaptureQueriesContext(connection) as queries:
+            call_command('generate_data', scale=0.01, stdout=StringIO())
+        self.assertEqual(
+            set(reset.call_args.args[1]), {User, Tag, Ingredient, Recipe}
+        )
+        self.assertIn(statement, [query['sql'] for query in queries])
+
+    def test_new_rows_after_generated(self):
+        for model, values in (
+            (Tag, {'name': 'Новый', 'slug': 'new', 'color': '#000000'}),
+            (Ingredient, {'name': 'новый', 'measurument_unit': 'г'}),
+            (User, {'username': 'new', 'email': 'new@example.com'}),
+        ):
+            with self.subTest(model=model):
+                last = model.objects.order_by('pk').last()
+                self.assertGreater(model.objects.create(**values).pk, last.pk)
+
+
+class ReferenceDataCacheTests(GeneratedDataTestCase):
+    """
+    Справочники из кэша: ETag, Last-Modified, ответы 304 и сброс кэша
+    при изменении справочников, в том числе другим процессом.
+    """
+    URL = '/api/tags/'
+
+    def test_not_modified(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': etag},
+            {'HTTP_IF_MODIFIED_SINCE': last_modified},
+        ):
+            with self.subTest(headers=headers):
+                response = self.client.get(self.URL, **headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+    def test_gzip(self):
+        plain = self.client.get(self.URL)
+        compressed = self.client.get(self.URL, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed['ETag'], plain['ETag'][:-1] + '-gzip"')
+        self.assertEqual(self.client.get(
+            self.URL, HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=compressed['ETag'],
+        ).status_code, 304)
+
+    def test_change_invalidates(self):
+        response = self.client.get(self.URL)
+        tag = Tag.objects.order_by('pk').first()
+        tag.name = 'Переименованный тег'
+        tag.save()
+        changed = self.client.get(
+            self.URL, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertGreater(
+            parse_http_date(changed['Last-Modified']),
+            parse_http_date(response['Last-Modified']),
+        )
+        self.assertIn(tag.name, {item['name'] for item in changed.json()})
+
+    def test_change_in_other_process(self):
+        self.client.get(self.URL)
+        # Другой процесс меняет базу и версию, но не этот кэш.
+        Tag.objects.filter(
+            pk=Tag.objects.order_by('pk').first().pk
+        ).update(name='Из другого процесса')
+        DataVersion.bump(DataVersion.REFERENCE)
+        response = self.client.get(self.URL)
+        self.assertIn(
+            'Из другого процесса', {item['name'] for item in response.json()}
+        )
+
+    def test_same_etag_in_every_process(self):
+        response = self.client.get(self.URL)
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'other-worker',
+        }}):
+            other = self.client.get(self.URL)
+        self.assertEqual(other['ETag'], response['ETag'])
+        self.assertEqual(other['Last-Modified'], response['Last-Modified'])
+
+    def test_media_type_parameters(self):
+        compact = self.client.get(self.URL)
+        indented = self.client.get(
+            self.URL, HTTP_ACCEPT='application/json; indent=4'
+        )
+        self.assertEqual(indented.json(), compact.json())
+        self.assertIn(b'\n    ', indented.content)
+        self.assertNotEqual(indented['ETag'], compact['ETag'])
+        self.assertEqual(self.client.get(self.URL).content, compact.content)
+
+
+class RecipePageCacheTests(GeneratedDataTestCase):
+    """
+    Страница списка рецептов из кэша проверяется по базе: изменения
+    рецептов страницы, её состава и авторов видны сразу, в том числе
+    сделанные другим процессом, а изменения других рецептов страницу
+    из кэша не сбрасывают.
+    """
+    URL = '/api/recipes/?limit=6'
+    # Версии состава страницы и рецепты страницы с авторами.
+    HIT_QUERIES = 2
+
+    def get_page(self, url=URL):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assert_cached(self, url=URL):
+        expected = self.get_page(url)
+        with self.assertNumQueries(self.HIT_QUERIES):
+            self.assertEqual(self.get_page(url), expected)
+
+    def create_recipe(self, author):
+        recipe = Recipe.objects.create(
+            author=author, name='Новый рецепт', text='Описание',
+            image=self.recipe.image.name, cooking_time=10,
+        )
+        recipe.tags.set([Tag.objects.order_by('pk').first()])
+        return recipe
+
+    def test_hit(self):
+        self.get_page()
+        self.assert_cached()
+
+    def test_recipe_change(self):
+        recipe = Recipe.objects.get(pk=self.get_page()['results'][0]['id'])
+        recipe.name = 'Изменённый рецепт'
+        recipe.save()
+        self.assertEqual(
+            self.get_page()['results'][0]['name'], 'Изменённый рецепт'
+        )
+
+    def test_change_in_other_process(self):
+        first = self.get_page()['results'][0]
+        # Другой процесс: база меняется без сигналов этого процесса.
+        Recipe.objects.filter(pk=first['id']).update(
+            name='Из другого процесса', modified=timezone.now()
+        )
+        User.objects.filter(pk=first['author']['id']).update(
+            first_name='Переименованный'
+        )
+        result = self.get_page()['results'][0]
+        self.assertEqual(result['name'], 'Из другого процесса')
+        self.assertEqual(result['author']['first_name'], 'Переименованный')
+
+    def test_new_recipe(self):
+        self.get_page()
+        recipe = self.create_recipe(self.reader)
+        self.assertEqual(self.get_page()['results'][0]['id'], recipe.pk)
+
+    def test_unrelated_changes(self):
+        page = self.get_page()
+        ids = [recipe['id'] for recipe in page['results']]
+        other = Recipe.objects.exclude(id__in=ids).order_by('pk').first()
+        other.name = 'Не на этой странице'
+        other.save()
+        Favorite.objects.filter(recipe=other).delete()
+        Favorite.objects.create(user=self.reader, recipe=other)
+        self.reader.last_login = timezone.now()
+        self.reader.save(update_fields=['last_login'])
+        with self.assertNumQueries(self.HIT_QUERIES):
+            self.assertEqual(self.get_page(), page)
+
+    def test_author_page(self):
+        author = self.recipe.author
+        url = f'{self.URL}&author={author.pk}'
+        self.get_page(url)
+        # Новый рецепт другого автора меняет общую страницу, но не эту.
+        other_author = User.objects.exclude(pk=author.pk).first()
+        self.create_recipe(other_author)
+        self.assert_cached(url)
+        recipe = self.create_recipe(author)
+        self.assertEqual(self.get_page(url)['results'][0]['id'], recipe.pk)
+
+    def test_tag_page(self):
+        tag = Tag.objects.order_by('pk').last()
+        url = f'{self.URL}&tags={tag.slug}'
+        page = self.get_page(url)
+        recipe = Recipe.objects.exclude(tags=tag).order_by('-pk').first()
+        recipe.tags.add(tag)
+        self.assertNotEqual(self.get_page(url), page)
+        self.assertIn(recipe.pk, {
+            result['id'] for result in self.get_page(f'{url}&limit=100')[
+                'results'
+            ]
+        })
+
+    def test_media_type_parameters(self):
+        compact = self.client.get(self.URL)
+        indented = self.client.get(
+            self.URL, HTTP_ACCEPT='application/json; indent=4'
+        )
+        self.assertEqual(indented.json(), compact.json())
+        self.assertIn(b'\n    ', indented.content)
+        self.assertEqual(self.client.get(self.URL).content, compact.content)
+
+
+class RecipeCoverageTests(GeneratedDataTestCase):
+    """
+    Поиск по имеющимся ингредиентам (?have=): доли и порядок совпадают
+    с прямым подсчётом по базе, индекс следует за изменениями рецептов
+    и ингредиентов.
+    """
+
+    def setUp(self):
+        super().setUp()
+        recipe_coverage_index.invalidate()
+        self.addCleanup(recipe_coverage_index.invalidate)
+
+    def get_expected(self, have):
+        """(доля, id) по убыванию доли, при равной доле - новые первыми."""
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in AmountIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ):
+            ingredients[recipe_id].add(ingredient_id)
+        return sorted((
+            (len(ids & have) / len(ids), recipe_id)
+            for recipe_id, ids in ingredients.items()
+            if ids & have
+            and len(ids & have) >= settings.RECIPE_COVERAGE_MIN * len(ids)
+        ), reverse=True)[:settings.RECIPE_COVERAGE_LIMIT]
+
+    def get_have(self):
+        return set(AmountIngredient.objects.filter(
+            recipe__in=Recipe.objects.order_by('pk')[:3]
+        ).values_list('ingredient_id', flat=True))
+
+    def create_ingredients(self, count):
+        return [
+            Ingredient.objects.create(
+                name=f'ингредиент покрытия {number}', measurument_unit='г'
+            ).pk
+            for number in range(count)
+        ]
+
+    def create_recipe(self, ingredient_ids):
+        recipe = Recipe.objects.create(
+            author=self.reader, name='Рецепт покрытия', text='Описание',
+            image=self.recipe.image.name, cooking_time=10,
+        )
+        for ingredient_id in ingredient_ids:
+            AmountIngredient.objects.create(
+                recipe=recipe, ingredient_id=ingredient_id, amount=1
+            )
+        return recipe.pk
+
+    def search(self, have):
+        return recipe_coverage_index.search(have)
+
+    def test_ranking(self):
+        have = self.get_have()
+        expected = self.get_expected(have)
+        self.assertGreater(len(expected), 6)
+        self.assertEqual(self.search(have), expected)
+        response = self.client.get('/api/recipes/', {
+            'have': ','.join(map(str, sorted(have))), 'limit': 100,
+        })
+        self.assertEqual(response.data['count'], len(expected))
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe_id for _, recipe_id in expected][:100],
+        )
+
+    def test_ties(self):
+        one, two, three, four, five, six = self.create_ingredients(6)
+        with self.captureOnCommitCallbacks(execute=True):
+            half_of_two = self.create_recipe([one, two])
+            half_of_four = self.create_recipe([one, three, four, five])
+            two_of_three = self.create_recipe([one, three, six])
+        # Доля важнее числа недостающих, при равной доле - новые первыми.
+        self.assertEqual(self.search({one, three}), [
+            (2 / 3, two_of_three), (0.5, half_of_four), (0.5, half_of_two),
+        ])
+
+    @override_settings(RECIPE_COVERAGE_LIMIT=3)
+    def test_limit(self):
+        have = self.get_have()
+        self.assertEqual(self.search(have), self.get_expected(have))
+        self.assertEqual(len(self.search(have)), 3)
+        response = self.client.get('/api/recipes/', {
+            'have': ','.join(map(str, sorted(have))), 'limit': 10,
+        })
+        self.assertEqual(response.data['count'], 3)
+
+    def test_recipe_and_ingredient_changes(self):
+        one, two, three = self.create_ingredients(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.create_recipe([one, two, three])
+        self.assertEqual(self.search({one}), [])
+        # Правка рецепта через API: ингредиентов стало два.
+        self.login()
+        Recipe.objects.filter(pk=recipe_id).update(author=self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/', {
+                    'ingredients': [
+                        {'id': one, 'amount': 1}, {'id': two, 'amount': 1},
+                    ],
+                    'tags': [Tag.objects.order_by('pk').first().pk],
+                    'name': 'Рецепт покрытия', 'text': 'Описание',
+                    'cooking_time': 10,
+                }, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search({one}), [(0.5, recipe_id)])
+        # Удаление ингредиента удаляет его из рецептов.
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(pk=two).delete()
+        self.assertEqual(self.search({one}), [(1.0, recipe_id)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(pk=recipe_id).delete()
+        self.assertEqual(self.search({one}), [])
+
+    def test_ttl(self):
+        one, two = self.create_ingredients(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_id = self.create_recipe([one, two])
+        self.assertEqual(self.search({one}), [(0.5, recipe_id)])
+        # Другой процесс с отдельным кэшем: сигналы и журнал не дойдут.
+        AmountIngredient.objects.filter(
+            recipe_id=recipe_id, ingredient_id=two
+        ).delete()
+        self.assertEqual(self.search({one}), [(0.5, recipe_id)])
+        with mock.patch(
+            'recipes.coverage.time.monotonic',
+            return_value=time.monotonic() + settings.RECIPE_COVERAGE_TTL + 1,
+        ):
+            self.assertEqual(self.search({one}), [(1.0, recipe_id)])
+
+
+class SimilarRecipesTests(GeneratedDataTestCase):
+    """
+    Соседи из RecipeMatrix совпадают с прямым подсчётом косинусной меры,
+    а запуск build_similar_recipes после правок и удалений даёт те же
+    строки RecipeSimilarity, что и --full.
+    """
+
+    def get_expected(self, recipe_id, count):
+        """(сходство, id) по убыванию сходства, при равном - новые первыми."""
+        features = defaultdict(set)
+        for similar_id, ingredient_id in AmountIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ):
+            features[similar_id].add(ingredient_id)
+        own = features[recipe_id]
+        return sorted((
+            (len(own & ingredients) / math.sqrt(len(own) * len(ingredients)),
+             similar_id)
+            for similar_id, ingredients in features.items()
+            if similar_id != recipe_id and own & ingredients
+        ), reverse=True)[:count]
+
+    def get_rows(self):
+        return set(RecipeSimilarity.objects.values_list(
+            'recipe_id', 'similar_id', 'score'
+        ))
+
+    def build(self, *args):
+        call_command('build_similar_recipes', *args, stdout=StringIO())
+
+    @override_settings(RECIPE_SIMILARITY_TAGS=False)
+    def test_scores(self):
+        matrix = RecipeMatrix.load()
+        count = settings.RECIPE_SIMILAR_COUNT
+        for recipe_id in Recipe.objects.values_list('id', flat=True):
+            self.assertEqual(
+                matrix.nearest(recipe_id, count),
+                self.get_expected(recipe_id, count),
+            )
+
+    @override_settings(RECIPE_SIMILARITY_TAGS=False)
+    def test_similar_order(self):
+        self.build()
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/similar/')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data],
+            [similar_id for _, similar_id in self.get_expected(
+                self.recipe.pk, settings.RECIPE_SIMILAR_COUNT
+            )],
+        )
+
+    def test_incremental_matches_full(self):
+        self.build()
+        recipes = list(Recipe.objects.order_by('pk')[:4])
+        ingredients = list(Ingredient.objects.order_by('pk')[:5])
+        # Правки после прошлого запуска: новый ингредиент, удалённый
+        # ингредиент, рецепт без ингредиентов, удалённый и новый рецепты.
+        AmountIngredient.objects.get_or_create(
+            recipe=recipes[0], ingredient=ingredients[0],
+            defaults={'amount': 1},
+        )
+        AmountIngredient.objects.filter(recipe=recipes[1]).order_by(
+            'pk'
+        ).first().delete()
+        AmountIngredient.objects.filter(recipe=recipes[2]).delete()
+        recipes[3].delete()
+        recipe = Recipe.objects.create(
+            author=self.reader, name='Новый рецепт', text='Описание',
+            image=self.recipe.image.name, cooking_time=10,
+        )
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        self.build()
+        incremental = self.get_rows()
+        self.build('--full')
+        self.assertEqual(incremental, self.get_rows())
+        self.assertFalse(RecipeSimilarity.objects.filter(
+            recipe=recipes[2]
+        ).exists())
+        self.assertTrue(RecipeSimilarity.objects.filter(
+            recipe=recipe
+        ).exists())
+
+
+class RecipeIngredientsWriteTests(GeneratedDataTestCase):
+    """
+    Ингредиенты рецепта пишутся пачками: число запросов не зависит от
+    числа ингредиентов, а ошибка откатывает рецепт вместе с ними.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.ingredients = list(Ingredient.objects.order_by('pk')[:6])
+        self.tag = Tag.objects.order_by('pk').first()
+
+    def get_data(self, amounts, **fields):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        return {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts
+            ],
+            'tags': [self.tag.pk],
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                buffer.getvalue()
+            ).decode(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            **fields,
+        }
+
+    def get_amounts(self, recipe_id):
+        return dict(AmountIngredient.objects.filter(
+            recipe=recipe_id
+        ).values_list('ingredient_id', 'amount'))
+
+    def create(self, amounts):
+        response = self.client.post(
+            '/api/recipes/', self.get_data(amounts), format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def update(self, recipe_id, amounts, **fields):
+        response = self.client.patch(
+            f'/api/recipes/{recipe_id}/',
+            self.get_data(amounts, **fields), format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def count_queries(self, action, *args):
+        with CaptureQueriesContext(connection) as queries:
+            action(*args)
+        return len(queries)
+
+    def test_create_queries(self):
+        one, two, three, four, five, six = self.ingredients
+        # Первый рецепт автора ещё создаёт строки версий кэша.
+        self.create([(one, 1)])
+        self.assertEqual(
+            self.count_queries(self.create, [(one, 1)]),
+            self.count_queries(self.create, [
+                (one, 1), (two, 2), (three, 3), (four, 4), (five, 5),
+                (six, 6),
+            ]),
+        )
+        recipe = Recipe.objects.create(
+            author=self.reader, name='Рецепт', text='Описание',
+            image=self.recipe.image.name, cooking_time=10,
+        )
+        with self.assertNumQueries(1):
+            RecipeCreateUpdateSerializer().add_ingredients(recipe, [
+                {'id': ingredient, 'amount': 1}
+                for ingredient in self.ingredients
+            ])
+        self.assertEqual(
+            self.get_amounts(recipe),
+            {ingredient.pk: 1 for ingredient in self.ingredients},
+        )
+
+    def test_update_queries(self):
+        one, two, three, four, five, six = self.ingredients
+        recipe_id = self.create([(one, 1), (two, 1), (three, 1), (four, 1)])
+        serializer = RecipeCreateUpdateSerializer()
+        recipe = Recipe.objects.get(pk=recipe_id)
+        # Чтение, удаление, обновление и вставка - по запросу на всё.
+        with self.assertNumQueries(4):
+            serializer.update_ingredients(recipe, [
+                {'id': one, 'amount': 1}, {'id': two, 'amount': 5},
+                {'id': five, 'amount': 2}, {'id': six, 'amount': 3},
+            ])
+        self.assertEqual(self.get_amounts(recipe_id), {
+            one.pk: 1, two.pk: 5, five.pk: 2, six.pk: 3,
+        })
+        with self.assertNumQueries(1):
+            serializer.update_ingredients(recipe, [
+                {'id': one, 'amount': 1}, {'id': two, 'amount': 5},
+                {'id': five, 'amount': 2}, {'id': six, 'amount': 3},
+            ])
+        # Через API число запросов не растёт с числом удалённых строк.
+        self.assertEqual(
+            self.count_queries(self.update, recipe_id, [
+                (one, 2), (two, 5), (five, 2), (three, 1),
+            ]),
+            self.count_queries(self.update, recipe_id, [
+                (four, 3), (one, 2), (six, 1), (two, 4),
+            ]),
+        )
+        self.assertEqual(self.get_amounts(recipe_id), {
+            four.pk: 3, one.pk: 2, six.pk: 1, two.pk: 4,
+        })
+
+    def test_create_rolls_back(self):
+        recipes = Recipe.objects.count()
+        with mock.patch.object(
+            RecipeCreateUpdateSerializer, 'add_ingredients',
+            side_effect=RuntimeError,
+        ), self.assertRaises(RuntimeError):
+            self.create([(self.ingredients[0], 1)])
+        self.assertEqual(Recipe.objects.count(), recipes)
+
+    def test_update_rolls_back(self):
+        one, two = self.ingredients[:2]
+        recipe_id = self.create([(one, 1)])
+        with mock.patch.object(
+            AmountIngredient.objects, 'bulk_create',
+            side_effect=RuntimeError,
+        ), self.assertRaises(RuntimeError):
+            self.update(recipe_id, [(two, 3)], name='Новое название')
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe_id).name, 'Рецепт'
+        )
+        self.assertEqual(self.get_amounts(recipe_id), {one.pk: 1})
+
+
+class IngredientSearchTests(GeneratedDataTestCase):
+    """
+    Подсказки ингредиентов (?name=) из индекса в памяти: порядок
+    совпадений и обновление индекса при изменении ингредиентов.
+    """
+
+    def setUp(self):
+        super().setUp()
+        ingredient_index.invalidate()
+        self.addCleanup(ingredient_index.invalidate)
+
+    def found(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def create(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ingredient.objects.create(
+                name=name, measurument_unit='г'
+            )
+
+    def test_blank_query(self):
+        self.assertEqual(self.found(' '), [])
+        self.assertEqual(ingredient_index.search('  \t'), [])
+
+    def test_ranking(self):
+        for name in ('козий шафран', 'Шафран молотый', 'шафран'):
+            self.create(name)
+        names = sorted(
+            Ingredient.objects.values_list('name', flat=True),
+            key=str.lower,
+        )
+        expected = [
+            name for name in names if name.lower().startswith('шафран')
+        ] + [
+            name for name in names
+            if 'шафран' in name.lower()
+            and not name.lower().startswith('шафран')
+        ]
+        self.assertEqual(
+            expected, ['шафран', 'Шафран молотый', 'козий шафран']
+        )
+        self.assertEqual(self.found('ШАФРАН '), expected)
+        with override_settings(INGREDIENT_SEARCH_LIMIT=2):
+            self.assertEqual(self.found('шафран'), expected[:2])
+
+    def test_index_follows_ingredients(self):
+        self.assertEqual(self.found('шафран'), [])
+        ingredient = self.create('шафран')
+        self.assertEqual(self.found('шафран'), ['шафран'])
+        ingredient.name = 'куркума'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        self.assertEqual(self.found('шафран'), [])
+        self.assertEqual(self.found('курк'), ['куркума'])
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+        self.assertEqual(self.found('курк'), [])
+
+    def test_ttl(self):
+        ingredient = self.create('шафран')
+        self.assertEqual(len(ingredient_index.search('шафран')), 1)
+        # Другой процесс: сигналы текущего не сработают.
+        Ingredient.objects.filter(pk=ingredient.pk).update(name='куркума')
+        self.assertEqual(len(ingredient_index.search('шафран')), 1)
+        with mock.patch(
+            'recipes.autocomplete.time.monotonic',
+            return_value=time.monotonic() + settings.INGREDIENT_INDEX_TTL + 1,
+        ):
+            self.assertEqual(ingredient_index.search('шафран'), [])
+            self.assertEqual(len(ingredient_index.search('куркума')), 1)
+
+
+class CountersTests(GeneratedDataTestCase):
+    """
+    Денормализованные счётчики: сигналы меняют их выражениями F(),
+    обычное сохранение не затирает, reconcile_counters исправляет.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+
+    def get_counters(self):
+        self.author.refresh_from_db(
+            fields=('recipes_count', 'followers_count')
+        )
+        return self.author.recipes_count, self.author.followers_count
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image=self.recipe.image.name, cooking_time=10,
+        )
+
+    def test_signals(self):
+        recipe = self.create_recipe()
+        Subscribe.objects.create(follower=self.reader, following=self.author)
+        self.assertEqual(self.get_counters(), (1, 1))
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).favorites_count, 1
+        )
+        Favorite.objects.filter(recipe=recipe).delete()
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).favorites_count, 0
+        )
+        Subscribe.objects.filter(following=self.author).delete()
+        recipe.delete()
+        self.assertEqual(self.get_counters(), (0, 0))
+        # Ниже нуля счётчик не опускается.
+        User.change_counter(self.author.pk, 'followers_count', -1)
+        self.assertEqual(self.get_counters(), (0, 0))
+
+    def test_save_keeps_counters(self):
+        stale = User.objects.get(pk=self.author.pk)
+        self.create_recipe()
+        Subscribe.objects.create(follower=self.reader, following=self.author)
+        saved = []
+
+        def receiver(sender, instance, update_fields, **kwargs):
+            saved.append(update_fields)
+
+        post_save.connect(receiver, sender=User)
+        self.addCleanup(post_save.disconnect, receiver, sender=User)
+        stale.first_name = 'Новое имя'
+        stale.save()
+        self.assertEqual(saved, [None])
+        self.assertEqual(self.get_counters(), (1, 1))
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).first_name, 'Новое имя'
+        )
+        # Явно перечисленный счётчик записывается.
+        stale.save(update_fields=['followers_count'])
+        self.assertEqual(self.get_counters(), (1, 0))
+
+    def test_save_inserts_missing_row(self):
+        stale = User.objects.get(pk=self.author.pk)
+        User.objects.filter(pk=self.author.pk).delete()
+        stale.save()
+        self.assertTrue(User.objects.filter(pk=self.author.pk).exists())
+
+    def test_reconcile_counters(self):
+        recipe = self.create_recipe()
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        Subscribe.objects.create(follower=self.reader, following=self.author)
+        User.objects.filter(pk=self.author.pk).update(
+            recipes_count=5, followers_count=0
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=3)
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=7, stdout=out)
+        self.assertEqual(self.get_counters(), (1, 1))
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).favorites_count, 1
+        )
+        self.assertIn('recipes.Recipe.favorites_count: исправлено 1', (
+            out.getvalue()
+        ))
+        for model, counter, related, field in COUNTERS:
+            self.assertFalse(model.objects.exclude(**{
+                counter: actual_count(related, field)
+            }).exists())
+
+
+class JSONFormatTests(SimpleTestCase):
+    """
+    FastJSONRenderer и FastJSONParser дают те же байты и те же объекты,
+    что JSONRenderer и JSONParser DRF, с orjson и без него.
+    """
+    # orjson записывает эти данные сам, типы без поддержки в orjson
+    # переводит кодировщик DRF.
+    DATA = {
+        'decimals': [
+            Decimal('1.50'), Decimal('-2.5'), Decimal('0'),
+            Decimal('123.456789'),
+        ],
+        'datetimes': [
+            datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone(
+                timedelta(hours=3)
+            )),
+            datetime(2024, 5, 1, 12, 30), date(2024, 5, 1),
+            dt_time(12, 30), timedelta(minutes=90),
+        ],
+        'lazy': gettext_lazy('Пользователь'),
+        'uuid': UUID(int=1),
+        'strings': ['ёжик', 'строка\u2028и\u2029абзац', '"\\/\t'],
+        'numbers': [1, -1, 2 ** 63 - 1, 1.5, 0.1, None, True],
+        'ordered': OrderedDict([('b', 1), ('a', [])]),
+    }
+    # Их orjson записал бы иначе или не записал бы вовсе.
+    FALLBACK_DATA = (
+        {'id': 2 ** 70}, {'amount': Decimal('1E+20')},
+        {'amount': Decimal('0.00001')},
+    )
+    BODIES = (
+        b'{"a": 1.5, "b": [1, -2, null, true], "c": "\\u0451"}',
+        '{"name": "ёжик"}'.encode(),
+        b'{"id": 123456789012345678901234}',
+        b'[1e400, -1e400]',
+        b'["\\ud800"]',
+        b'  [] ',
+    )
+    INVALID_BODIES = (b'{', b'', b'{"a": 1,}', b'[NaN]', b'\xff')
+
+    def assert_same_rendering(self):
+        for data in (self.DATA, *self.FALLBACK_DATA):
+            for args in (
+                (), ('application/json',),
+                ('application/json; indent=4',),
+                ('application/json', {'indent': 2}),
+            ):
+                with self.subTest(data=data, args=args):
+                    self.assertEqual(
+                        FastJSONRenderer().render(data, *args),
+                        JSONRenderer().render(data, *args),
+                    )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def parse(self, parser, body):
+        return parser.parse(BytesIO(body), 'application/json', {})
+
+    def assert_same_parsing(self):
+        for body in self.BODIES:
+            with self.subTest(body=body):
+                self.assertEqual(
+                    repr(self.parse(FastJSONParser(), body)),
+                    repr(self.parse(JSONParser(), body)),
+                )
+        for body in self.INVALID_BODIES:
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as expected:
+                    self.parse(JSONParser(), body)
+                with self.assertRaises(ParseError) as error:
+                    self.parse(FastJSONParser(), body)
+                self.assertEqual(
+                    str(error.exception.detail),
+                    str(expected.exception.detail),
+                )
+
+    def test_orjson(self):
+        self.assertIsNotNone(renderers.orjson)
+        expected = JSONRenderer().render(self.DATA)
+        with mock.patch.object(
+            JSONRenderer, 'render', side_effect=AssertionError
+        ):
+            self.assertEqual(FastJSONRenderer().render(self.DATA), expected)
+        self.assert_same_rendering()
+        self.assert_same_parsing()
+
+    def test_without_orjson(self):
+        with mock.patch('api.renderers.orjson', None), \
+                mock.patch('api.parsers.orjson', None):
+            self.assert_same_rendering()
+            self.assert_same_parsing()
+
+
+class RecipeRenditionsTests(GeneratedDataTestCase):
+    """
+    Уменьшенные копии фото: поле images в ответах, файлы копий и их
+    удаление вместе с фото или рецептом. IMAGE_RENDITION_WORKERS=0,
+    копии строятся сразу после коммита.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def get_data(self, size, **fields):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 100, 50)).save(buffer, 'PNG')
+        return {
+            'ingredients': [{
+                'id': Ingredient.objects.order_by('pk').first().pk,
+                'amount': 1,
+            }],
+            'tags': [Tag.objects.order_by('pk').first().pk],
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                buffer.getvalue()
+            ).decode(),
+            'name': 'Рецепт с фото',
+            'text': 'Описание',
+            'cooking_time': 10,
+            **fields,
+        }
+
+    def create(self, size=(2000, 1000)):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.get_data(size), format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def get_files(self, recipe):
+        return [recipe.renditions[label] for label in RENDITION_LABELS]
+
+    def test_renditions(self):
+        recipe = self.create()
+        self.assertEqual(recipe.renditions['source'], recipe.image.name)
+        for label, size in RENDITIONS.items():
+            for suffix, image_format, _ in RENDITION_FORMATS:
+                name = recipe.renditions[f'{label}{suffix}']
+                with default_storage.open(name) as file:
+                    image = Image.open(file)
+                    self.assertEqual(image.format, image_format)
+                    self.assertEqual(image.size, (size, size // 2))
+
+    def test_images(self):
+        recipe = self.create()
+        expected = {
+            label: default_storage.url(name)
+            for label, name in zip(RENDITION_LABELS, self.get_files(recipe))
+        }
+        detail = self.client.get(f'/api/recipes/{recipe.pk}/').data
+        self.assertEqual(detail['images'], expected)
+        page = self.client.get('/api/recipes/', {'limit': 1}).data
+        self.assertEqual(page['results'][0]['id'], recipe.pk)
+        self.assertEqual(page['results'][0]['images'], expected)
+        # Пока копий нет, все URL ведут на оригинал.
+        Recipe.objects.filter(pk=recipe.pk).update(renditions={})
+        cache.clear()
+        detail = self.client.get(f'/api/recipes/{recipe.pk}/').data
+        self.assertEqual(
+            detail['images'], dict.fromkeys(RENDITION_LABELS, detail['image'])
+        )
+
+    def test_replaced_image(self):
+        recipe = self.create()
+        old_files = self.get_files(recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                self.get_data((300, 300)), format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.renditions['source'], recipe.image.name)
+        self.assertFalse(any(map(default_storage.exists, old_files)))
+        self.assertTrue(all(map(default_storage.exists, self.get_files(
+            recipe
+        ))))
+
+    def test_replaced_while_building(self):
+        recipe = self.create()
+        renditions = build_renditions(recipe.image.name)
+        Recipe.objects.filter(pk=recipe.pk).update(image='recipes/other.png')
+        save_renditions(recipe.pk, renditions)
+        self.assertFalse(any(
+            default_storage.exists(renditions[label])
+            for label in RENDITION_LABELS
+        ))
+
+    def test_deleted_recipe(self):
+        recipe = self.create()
+        files = self.get_files(recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(
+                self.client.delete(f'/api/recipes/{recipe.pk}/').status_code,
+                204,
+            )
+        self.assertFalse(any(map(default_storage.exists, files)))
+
+    def test_shared_renditions_are_kept(self):
+        # Рецепты generate_data делят копии одного фото.
+        files = self.get_files(self.recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertTrue(all(map(default_storage.exists, files)))
+
+
+class CursorPaginationTests(GeneratedDataTestCase):
+    """Курсорный режим ?cursor=: страницы по id и предел limit."""
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages(self):
+        ids = []
+        page = self.get('/api/recipes/', {'cursor': '', 'limit': 7})
+        while True:
+            self.assertNotIn('count', page)
+            ids += [recipe['id'] for recipe in page['results']]
+            if page['next'] is None:
+                break
+            page = self.get(page['next'])
+        self.assertEqual(ids, list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)
+        ))
+
+    def test_max_page_size(self):
+        page = self.get('/api/recipes/', {'cursor': '', 'limit': 1000})
+        self.assertEqual(
+            len(page['results']),
+            min(Recipe.objects.count(), LimitCursorPagination.max_page_size),
+        )
+        cache.clear()
+        with mock.patch.object(LimitCursorPagination, 'max_page_size', 3):
+            page = self.get('/api/recipes/', {'cursor': '', 'limit': 1000})
+            self.assertEqual(len(page['results']), 3)
+            self.login()
+            page = self.get('/api/recipes/feed/', {'limit': 1000})
+            self.assertEqual(len(page['results']), 3)
+            page = self.get(
+                '/api/users/subscriptions/', {'cursor': '', 'limit': 1000}
+            )
+            follows = Subscribe.objects.filter(follower=self.reader).count()
+            self.assertEqual(len(page['results']), min(3, follows))
+            # Без cursor - прежняя пагинация страницами без предела.
+            page = self.get('/api/recipes/', {'page': 1, 'limit': 1000})
+            self.assertEqual(len(page['results']), Recipe.objects.count())
+
+
+class RecipeQueryBudgetTests(GeneratedDataTestCase):
+    """
+    Список и страница рецепта читаются фиксированным числом запросов,
+    сколько бы рецептов, тегов и ингредиентов ни было на странице.
+    """
+    # Версия справочников, подсчёт, страница, теги, ингредиенты; с
+    # токеном - ещё токен и авторы, на которых подписан читатель.
+    LIST_QUERIES = 5
+    LIST_QUERIES_AUTHENTICATED = 7
+    # Без подсчёта страниц.
+    DETAIL_QUERIES = 3
+    DETAIL_QUERIES_AUTHENTICATED = 5
+
+    def assert_list_budget(self, queries):
+        for limit in (1, 6, 50):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def assert_detail_budget(self, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.recipe.pk)
+
+    def test_list_anonymous(self):
+        self.assert_list_budget(self.LIST_QUERIES)
+
+    def test_list_authenticated(self):
+        self.login()
+        self.assert_list_budget(self.LIST_QUERIES_AUTHENTICATED)
+
+    def test_detail_anonymous(self):
+        self.assert_detail_budget(self.DETAIL_QUERIES)
+
+    def test_detail_authenticated(self):
+        self.login()
+        self.assert_detail_budget(self.DETAIL_QUERIES_AUTHENTICATED)
+
+
+class SubscriptionTests(GeneratedDataTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.newcomer = User.objects.create_user(
+            username='newcomer', email='newcomer@example.com',
+            password='password',
+        )
+        cls.author = Recipe.objects.order_by('pk').first().author
+
+    def login_newcomer(self):
+        self.client.force_authenticate(self.newcomer)
+
+    def test_subscriptions_without_authors(self):
+        self.login_newcomer()
+        response = self.client.get(
+            '/api/users/subscriptions/', {'limit': 6, 'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_recipes_limit_does_not_subscribe(self):
+        self.login_newcomer()
+        response = self.client.post(
+            f'/api/users/{self.author.pk}/subscribe/?recipes_limit=abc'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subscribe.objects.filter(
+            follower=self.newcomer, following=self.author
+        ).exists())
+        response = self.client.post(
+            f'/api/users/{self.author.pk}/subscribe/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertLessEqual(len(response.data['recipes']), 1)
+
+
+class ImageUploadTests(GeneratedDataTestCase):
+
+    @staticmethod
+    def png(size, mode='RGB'):
+        buffer = BytesIO()
+        Image.new(mode, size).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def upload(self, content):
+        self.login()
+        return self.client.post(
+            '/api/recipes/images/', content, content_type='image/png',
+            HTTP_CONTENT_DISPOSITION='attachment; filename=image.png',
+        )
+
+    def test_upload(self):
+        response = self.upload(self.png((64, 48)))
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(RecipeImageUpload.objects.filter(
+            pk=response.data['id'], owner=self.reader
+        ).exists())
+
+    def test_decompression_bomb_is_rejected(self):
+        # Несколько десятков килобайт, заявляющих 400 млн пикселей.
+        response = self.upload(self.png((20000, 20000), mode='1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_SIDE=1000)
+    def test_side_limit(self):
+        response = self.upload(self.png((1001, 10)))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+
+    def test_recipe_from_upload(self):
+        upload_id = self.upload(self.png((64, 48))).data['id']
+        ingredient = Ingredient.objects.order_by('pk').first()
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [{'id': ingredient.pk, 'amount': 1}],
+            'tags': [Tag.objects.order_by('pk').first().pk],
+            'image_id': upload_id,
+            'name': 'Из загрузки',
+            'text': 'Текст',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+        image = Recipe.objects.get(pk=response.data['id']).image
+        self.assertTrue(image.storage.exists(image.name))
+
+    def test_purge_expired_uploads(self):
+        expired, fresh = (
+            RecipeImageUpload.objects.get(
+                pk=self.upload(self.png((64, 48))).data['id']
+            )
+            for _ in range(2)
+        )
+        RecipeImageUpload.objects.filter(pk=expired.pk).update(
+            created=timezone.now() - timedelta(hours=25)
+        )
+        call_command('purge_image_uploads', hours=24, stdout=StringIO())
+        self.assertEqual(
+            list(RecipeImageUpload.objects.values_list('pk', flat=True)),
+            [fresh.pk],
+        )
+        storage = expired.image.storage
+        self.assertFalse(storage.exists(expired.image.name))
+        self.assertTrue(storage.exists(fresh.image.name))
+
+
+class UserListTests(GeneratedDataTestCase):
+
+    def test_pages_are_ordered(self):
+        self.login()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            pages = [
+                self.client.get(
+                    '/api/users/', {'limit': 4, 'page': page}
+                ).data['results']
+                for page in (1, 2)
+            ]
+        ids = [user['id'] for page in pages for user in page]
+        self.assertEqual(ids, sorted(set(ids)))
+
+
+class FeedThresholdTests(GeneratedDataTestCase):
+    """
+    Ленты сходятся с порогом FEED_FANOUT_MAX_FOLLOWERS, даже когда
+    несколько подписок или отписок коммитятся разом и обработчики после
+    коммита видят уже общий итог счётчика.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.author = User.objects.filter(
+            recipes__isnull=False, followers_count__gt=0
+        ).order_by('-followers_count', 'pk').first()
+        cls.followers = [
+            User.objects.create_user(
+                username=f'follower{number}',
+                email=f'follower{number}@example.com',
+                password='password',
+            )
+            for number in range(2)
+        ]
+
+    def author_items(self):
+        return FeedItem.objects.filter(recipe__author=self.author)
+
+    def subscribe(self):
+        for follower in self.followers:
+            Subscribe.objects.create(follower=follower, following=self.author)
+        # Обе подписки закоммичены до первого обработчика.
+        for follower in self.followers:
+            follow(follower.pk, self.author.pk)
+
+    def unsubscribe(self):
+        Subscribe.objects.filter(follower__in=self.followers).delete()
+        for follower in self.followers:
+            unfollow(follower.pk, self.author.pk)
+
+    def test_crossing_up(self):
+        threshold = self.author.followers_count + 1
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=threshold):
+            self.subscribe()
+        self.assertFalse(self.author_items().exists())
+
+    def test_crossing_down(self):
+        threshold = self.author.followers_count + 2
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=threshold):
+            self.subscribe()
+            self.assertFalse(self.author_items().exists())
+            self.unsubscribe()
+        self.assertEqual(
+            self.author_items().count(),
+            self.author.followers_count * self.author.recipes.count(),
+        )
+
+
+class SearchIndexTests(GeneratedDataTestCase):
+    """
+    Поисковый индекс на месте после всех миграций и следует за
+    рецептами: в SQLite его ведут триггеры, которые теряются, когда
+    миграция пересоздаёт таблицу рецептов.
+    """
+    SQLITE_TRIGGERS = {
+        f'recipes_recipe_search_{event}'
+        for event in ('insert', 'delete', 'update')
+    }
+
+    def test_index_exists(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                    "AND tbl_name = 'recipes_recipe'"
+                )
+                triggers = {name for name, in cursor.fetchall()}
+                self.assertLessEqual(self.SQLITE_TRIGGERS, triggers)
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT 1 FROM information_schema.columns WHERE '
+                    "table_name = 'recipes_recipe' "
+                    "AND column_name = 'search_vector'"
+                )
+                self.assertIsNotNone(cursor.fetchone())
+
+    def found(self, query):
+        cache.clear()
+        response = self.client.get('/api/recipes/', {'search': query})
+        return [recipe['id'] for recipe in get_results(response.data)]
+
+    def test_index_follows_recipes(self):
+        self.recipe.name = 'Ёжики из брокколи'
+        self.recipe.save()
+        self.assertEqual(self.found('ежики брокколи'), [self.recipe.pk])
+        self.recipe.delete()
+        self.assertEqual(self.found('ежики брокколи'), [])
+
+    def test_ranking(self):
+        def create(name, text):
+            return Recipe.objects.create(
+                author=self.reader, name=name, text=text,
+                image=self.recipe.image.name, cooking_time=10,
+            ).pk
+
+        in_text = create('Запеканка', 'Рис с шафраном')
+        in_name = create('Рис с шафраном', 'Описание')
+        newer_in_name = create('Рис с шафраном', 'Описание')
+        # Название весит больше описания, при равном ранге - новые первыми.
+        self.assertEqual(
+            self.found('шафран'), [newer_in_name, in_name, in_text]
+        )
+
+
+class RecipeProjectionTests(GeneratedDataTestCase):
+    """
+    Рецепты из values() (api.projections) в ответах API совпадают байт в
+    байт с RecipeSerializer - и с первого запроса, и из кэша страниц.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # generate_data даёт копии фото всем рецептам: у части их убираем.
+        ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        Recipe.objects.filter(pk__in=list(ids[::2])).update(renditions={})
+
+    def get_urls(self):
+        tag = Tag.objects.order_by('pk').first()
+        return (
+            '/api/recipes/',
+            '/api/recipes/?limit=100',
+            '/api/recipes/?limit=6&page=3',
+            '/api/recipes/?limit=6&cursor=',
+            '/api/recipes/?' + urlencode({'tags': tag.slug, 'limit': 50}),
+            f'/api/recipes/?author={self.recipe.author_id}&limit=50',
+            '/api/recipes/?' + urlencode({'search': 'котлеты с сыром'}),
+            '/api/recipes/?is_favorited=1&limit=50',
+            '/api/recipes/?is_in_shopping_cart=1&limit=50',
+            f'/api/recipes/{self.recipe.pk}/',
+        )
+
+    def expected(self, ids, user):
+        """Рецепты ids, как их отдаёт RecipeSerializer, в порядке ids."""
+        recipes = recipes_with_related().annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user.id, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user.id, recipe=OuterRef('pk')
+            )),
+        ).in_bulk(ids)
+        request = RequestFactory().get('/api/recipes/')
+        request.user = user
+        return RecipeSerializer(
+            [recipes[pk] for pk in ids], many=True,
+            context={'request': request},
+        ).data
+
+    def assert_same_as_serializer(self, user):
+        renderer = JSONRenderer()
+        for url in self.get_urls():
+            cache.clear()
+            # Второй запрос того же списка приходит из кэша страниц.
+            for attempt in ('', 'кэш'):
+                with self.subTest(url=url, attempt=attempt):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    if 'ingredients' in response.data:
+                        results = [response.data]
+                    else:
+                        results = get_results(response.data)
+                    expected = self.expected(
+                        [recipe['id'] for recipe in results], user
+                    )
+                    self.assertEqual(
+                        renderer.render(results).decode(),
+                        renderer.render(expected).decode(),
+                    )
+
+    def test_anonymous(self):
+        self.assert_same_as_serializer(AnonymousUser())
+
+    def test_reader(self):
+        self.login()
+        self.assert_same_as_serializer(self.reader)
+
+
+def asgi_get(url, headers=()):
+    """
+    GET через ASGIHandler, как под uvicorn: тело ответа перебирается в
+    цикле событий. Статус и тело ответа.
+    """
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), *headers],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async_to_sync(ASGIHandler())(scope, receive, send)
+    return messages[0]['status'], b''.join(
+        message.get('body', b'') for message in messages[1:]
+    )
+
+
+class ShoppingCartTests(GeneratedDataTestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    def get_expected(self):
+        """Сумма каждого ингредиента корзины, по названию и единице."""
+        totals = defaultdict(int)
+        for amount in AmountIngredient.objects.filter(
+            recipe__cart__user=self.reader
+        ).select_related('ingredient'):
+            ingredient = amount.ingredient
+            totals[ingredient.name, ingredient.measurument_unit] += (
+                amount.amount
+            )
+        return sorted(
+            (name, unit, total) for (name, unit), total in totals.items()
+        )
+
+    def download(self, **query):
+        self.login()
+        return self.client.get(self.URL, query)
+
+    def assert_attachment(self, response, content_type, extension):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        self.assertIn(
+            f'{self.reader.username}_shopping_cart.{extension}',
+            response['Content-Disposition'],
+        )
+
+    def test_txt(self):
+        for query in ({}, {'format': 'txt'}):
+            with self.subTest(query=query):
+                response = self.download(**query)
+                self.assert_attachment(
+                    response, 'text/plain; charset=utf-8', 'txt'
+                )
+                lines = b''.join(
+                    response.streaming_content
+                ).decode().split('\n')
+                self.assertEqual(
+                    lines[0], f'Список покупок для: {self.reader.first_name}'
+                )
+                self.assertEqual(lines[2:-1], [
+                    f'{name.capitalize()}({unit}): - {amount} '
+                    for name, unit, amount in self.get_expected()
+                ])
+
+    def test_csv(self):
+        response = self.download(format='csv')
+        self.assert_attachment(response, 'text/csv; charset=utf-8', 'csv')
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.reader(StringIO(content[1:])))
+        self.assertEqual(
+            rows[0], ['Ингредиент', 'Единица измерения', 'Количество']
+        )
+        self.assertEqual(rows[1:], [
+            [name.capitalize(), unit, str(amount)]
+            for name, unit, amount in self.get_expected()
+        ])
+
+    def test_pdf(self):
+        response = self.download(format='pdf')
+        self.assert_attachment(response, 'application/pdf', 'pdf')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+    def test_invalid_format(self):
+        self.assertEqual(self.download(format='xlsx').status_code, 404)
+
+    def test_empty_cart(self):
+        ShoppingCart.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.download().status_code, 400)
+
+    def test_asgi(self):
+        expected = b''.join(self.download(format='csv').streaming_content)
+        status, content = asgi_get(
+            f'{self.URL}?format=csv',
+            [(b'authorization', f'Token {self.token}'.encode())],
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(content, expected)
+
+
+def pool_connection(shared):
+    """
+    Соединение для потока пула: свой DatabaseWrapper со своими обёртками
+    и журналом запросов, как у настоящего потока, но поверх соединения
+    sqlite3, в транзакции которого живёт тестовая база.
+    """
+    pooled = copy.copy(shared)
+    pooled.execute_wrappers = []
+    pooled.queries_log = deque(maxlen=shared.queries_limit)
+    return pooled
+
+
+def share_connection(shared):
+    connections[shared.alias] = shared
+
+
+class AsyncUrls:
+    """Маршруты с асинхронными view на чтение, как под foodgram.asgi."""
+    urlpatterns = [path('api/', include((get_urls(True), 'api')))]
+
+
+class AsyncViewTestCase(GeneratedDataTestCase):
+    """Запросы к асинхронным view с пулом из одного потока."""
+
+    def setUp(self):
+        super().setUp()
+        # Тестовая база живёт в транзакции этого соединения: поток пула
+        # асинхронных view работает через него же.
+        connection.inc_thread_sharing()
+        self.addCleanup(connection.dec_thread_sharing)
+        self.pool_connection = pool_connection(connections[connection.alias])
+        executor = ThreadPoolExecutor(
+            1, initializer=share_connection,
+            initargs=(self.pool_connection,),
+        )
+        self.addCleanup(executor.shutdown)
+        patcher = mock.patch.object(async_views, 'executor', executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_async(self, url, headers):
+        with override_settings(ROOT_URLCONF=AsyncUrls):
+            return async_to_sync(self.async_client.get)(url, **headers)
+
+
+class AsyncReadViewTests(AsyncViewTestCase):
+    """
+    Асинхронные view отвечают так же, как синхронные: статус, тип и
+    тело ответа совпадают и с пустым кэшем, и со страницей из кэша.
+    """
+
+    def get_urls(self, authenticated):
+        tag = Tag.objects.order_by('pk').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        urls = [
+            '/api/recipes/',
+            '/api/recipes/?limit=6',
+            '/api/recipes/?limit=6&page=2',
+            '/api/recipes/?limit=6&cursor=',
+            f'/api/recipes/?limit=6&tags={tag.slug}',
+            f'/api/recipes/?limit=6&author={self.recipe.author_id}',
+            '/api/recipes/?limit=bad',
+            f'/api/recipes/{self.recipe.pk}/',
+            '/api/recipes/0/',
+            f'/api/recipes/{self.recipe.pk}/similar/',
+            '/api/tags/',
+            f'/api/tags/{tag.pk}/',
+            '/api/ingredients/',
+            '/api/ingredients/?' + urlencode(
+                {'name': ingredient.name[:2]}
+            ),
+            f'/api/ingredients/{ingredient.pk}/',
+            '/api/recipes/feed/?limit=6',
+            '/api/users/subscriptions/?limit=6',
+        ]
+        if authenticated:
+            urls += [
+                '/api/recipes/?limit=6&is_favorited=1',
+                '/api/recipes/?limit=6&is_in_shopping_cart=1',
+            ]
+        return urls
+
+    def assert_same_responses(self, authenticated):
+        headers = {}
+        if authenticated:
+            self.login()
+            headers['authorization'] = f'Token {self.token}'
+        for url in self.get_urls(authenticated):
+            with self.subTest(url=url):
+                cache.clear()
+                expected = self.client.get(url)
+                cache.clear()
+                cold = self.get_async(url, headers)
+                # Второй запрос списка приходит из кэша страниц.
+                warm = self.get_async(url, headers)
+                for response in (cold, warm):
+                    self.assertEqual(
+                        response.status_code, expected.status_code
+                    )
+                    self.assertEqual(
+                        response['Content-Type'], expected['Content-Type']
+                    )
+                    self.assertEqual(response.content, expected.content)
+
+    def test_anonymous(self):
+        self.assert_same_responses(authenticated=False)
+
+    def test_authenticated(self):
+        self.assert_same_responses(authenticated=True)
+
+    @override_settings(SQL_INSTRUMENTATION=True)
+    def test_server_timing_counts_pool_queries(self):
+        for url in ('/api/recipes/?limit=6', '/api/tags/'):
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as own, \
+                        CaptureQueriesContext(self.pool_connection) as pool, \
+                        self.assertLogs('api.sql', 'INFO'):
+                    response = self.get_async(url, {})
+                self.assertGreater(len(pool), 0)
+                self.assertIn(
+                    f'desc="{len(own) + len(pool)} SQL"',
+                    response['Server-Timing'],
+                )
+
+
+def profiled_functions(path):
+    return {name for _, _, name in pstats.Stats(path).stats}
+
+
+class ProfilerTests(AsyncViewTestCase):
+    """
+    Профиль запроса сотрудника: SQL-запросы, cProfile и стеки включают
+    работу потоков пула асинхронных view.
+    """
+
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.reader.pk).update(is_staff=True)
+        profiler_dir = tempfile.mkdtemp(prefix='foodgram-profiles-')
+        self.addCleanup(shutil.rmtree, profiler_dir, ignore_errors=True)
+        settings = override_settings(PROFILER_DIR=profiler_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get_profile(self, response):
+        self.assertEqual(response.status_code, 200)
+        return RequestProfile.objects.get(pk=response['X-Profile-Id'])
+
+    def test_sync_view(self):
+        self.login()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/recipes/?limit=6', HTTP_X_PROFILE='1'
+            )
+        profile = self.get_profile(response)
+        # Кроме запросов view - токен сотрудника и запись профиля.
+        self.assertEqual(profile.query_count, len(queries) - 2)
+        self.assertIn('recipe_tags', profiled_functions(
+            profile.pstats_path
+        ))
+
+    def test_async_view(self):
+        headers = {'authorization': f'Token {self.token}', 'x-profile': '1'}
+        with CaptureQueriesContext(connection) as own, \
+                CaptureQueriesContext(self.pool_connection) as pool:
+            response = self.get_async('/api/recipes/?limit=6', headers)
+        profile = self.get_profile(response)
+        self.assertEqual(profile.query_count, len(own) - 2 + len(pool))
+        self.assertGreater(len(pool), 0)
+        self.assertLessEqual(
+            {'recipe_tags', 'recipe_ingredients', 'get_personal_flags'},
+            profiled_functions(profile.pstats_path),
+        )
+
+    def test_not_staff(self):
+        User.objects.filter(pk=self.reader.pk).update(is_staff=False)
+        self.login()
+        response = self.client.get('/api/recipes/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_sampler_watches_other_threads(self):
+        sampler = StackSampler(threading.get_ident(), 0.001)
+        watched = threading.Event()
+
+        def pool_call():
+            with sampler.watch():
+                watched.set()
+                time.sleep(0.05)
+
+        sampler.start()
+        thread = threading.Thread(target=pool_call)
+        thread.start()
+        thread.join()
+        sampler.stop()
+        self.assertTrue(watched.is_set())
+        self.assertTrue(any(
+            stack.split(';')[-1].startswith('pool_call ')
+            for stack in sampler.stacks
+        ))
+        self.assertEqual(sampler.thread_ids, {threading.get_ident()})
+
+
+# Таблицы, полный просмотр которых в запросах API считается регрессией.
+CHECKED_TABLES = {
+    model._meta.db_table for model in (
+        AmountIngredient, Favorite, FeedItem, Ingredient, Recipe,
+        RecipeSimilarity, ShoppingCart, Subscribe, User,
+    )
+}
+
+# LIMIT всего запроса, а не подзапроса EXISTS(... LIMIT 1).
+OUTER_LIMIT = re.compile(r'\sLIMIT\s+\S+(\s+OFFSET\s+\S+)?\s*$')
+
+
+def sqlite_problems(sql, plan):
+    """
+    Полные просмотры и сортировки из EXPLAIN QUERY PLAN. Подзапросы
+    Django называет таблицы псевдонимами (U0), они заменяются именами.
+    """
+    aliases = dict(
+        (alias, table) for table, alias in re.findall(r'"(\w+)" (U\d+)', sql)
+    )
+    for number, (*_, detail) in enumerate(plan):
+        words = detail.split()
+        # И полный просмотр индекса (SCAN ... USING INDEX) - тоже полный.
+        if words[0] == 'SCAN':
+            yield 'scan', aliases.get(words[1], words[1]), number == 0
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            yield 'sort', None, False
+
+
+def postgresql_problems(sql, plan):
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [(plan[0]['Plan'], True)]
+    while nodes:
+        node, outer = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            yield 'scan', node['Relation Name'], outer
+        elif node['Node Type'] == 'Sort':
+            yield 'sort', None, False
+        outer = outer and node['Node Type'] == 'Limit'
+        nodes.extend((child, outer) for child in node.get('Plans', ()))
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # На сотне строк планировщик и так выбрал бы Seq Scan: с
+            # выключенным он остаётся, только если индекса нет.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            return plan, list(postgresql_problems(sql, plan))
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan = cursor.fetchall()
+        return plan, list(sqlite_problems(sql, plan))
+
+
+def full_scans(sql, problems):
+    """
+    Полные просмотры проверяемых таблиц. Допустимы только просмотр
+    основной таблицы страницы с LIMIT без сортировки (чтение по
+    первичному ключу останавливается на размере страницы) и COUNT(*)
+    пагинации по номерам страниц, который считает все строки по
+    определению.
+    """
+    if sql.startswith('SELECT COUNT(*) '):
+        return []
+    paginated = OUTER_LIMIT.search(sql) and not any(
+        kind == 'sort' for kind, _, _ in problems
+    )
+    return sorted(
+        table for kind, table, outer in problems
+        if kind == 'scan' and table in CHECKED_TABLES
+        and not (paginated and outer)
+    )
+
+
+class QueryPlanTests(GeneratedDataTestCase):
+    """
+    Запросы, которые выполняют представления API, читают проверяемые
+    таблицы по индексам. SQL берётся из самих запросов к API, так что
+    изменение представлений проверяется тоже.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        call_command('build_similar_recipes', stdout=StringIO())
+        cls.author = Recipe.objects.order_by('pk').first().author
+        cls.tag = Tag.objects.order_by('pk').first()
+        cls.ingredients = ','.join(map(str, Ingredient.objects.order_by(
+            'pk'
+        ).values_list('pk', flat=True)[:3]))
+
+    def get_urls(self, authenticated):
+        recipe = self.recipe.pk
+        # Без limit список не делится на страницы и читается целиком.
+        urls = [
+            '/api/recipes/?limit=6',
+            '/api/recipes/?limit=6&page=3',
+            '/api/recipes/?limit=6&cursor=',
+            f'/api/recipes/?tags={self.tag.slug}',
+            f'/api/recipes/?author={self.author.pk}',
+            '/api/recipes/?search=котлеты с сыром',
+            f'/api/recipes/?have={self.ingredients}',
+            f'/api/recipes/{recipe}/',
+            f'/api/recipes/{recipe}/similar/',
+            '/api/ingredients/?name=ингредиент 1',
+        ]
+        if authenticated:
+            urls += [
+                '/api/recipes/?is_favorited=1',
+                '/api/recipes/?is_in_shopping_cart=1',
+                '/api/recipes/feed/',
+                '/api/recipes/download_shopping_cart/',
+                '/api/users/?limit=6',
+                f'/api/users/{self.author.pk}/',
+                '/api/users/me/',
+                '/api/users/subscriptions/?recipes_limit=3',
+            ]
+        return urls
+
+    def capture(self, url):
+        """SQL и параметры всех запросов к базе при GET url."""
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        # Первый запрос строит индексы в памяти процесса (ингредиенты,
+        # ?have=), в ответах они не участвуют.
+        self.client.get(url)
+        cache.clear()
+        with connection.execute_wrapper(record):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [
+            (sql, params) for sql, params in statements
+            if sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))
+        ]
+
+    def assert_no_full_scans(self, authenticated):
+        for url in self.get_urls(authenticated):
+            for sql, params in self.capture(url):
+                plan, problems = explain(sql, params)
+                with self.subTest(url=url, sql=sql):
+                    self.assertEqual(full_scans(sql, problems), [], plan)
+
+    def test_anonymous(self):
+        self.assert_no_full_scans(authenticated=False)
+
+    def test_authenticated(self):
+        self.login()
+        self.assert_no_full_scans(authenticated=True)
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, UnidentifiedImageError
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.parsers import FileUploadParser
+from rest_framework.status import HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+
+class ImageTooLarge(APIException):
+    status_code = HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл изображения слишком большой.'
+    default_code = 'image_too_large'
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемый файл кусками во временный файл на диске и
+    прерывает загрузку, как только превышен RECIPE_IMAGE_MAX_SIZE.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length and content_length > (
+                settings.RECIPE_IMAGE_MAX_SIZE + 64 * 1024):
+            raise ImageTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ImageTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class RawImageUploadParser(FileUploadParser):
+    """Тело запроса целиком - файл изображения (Content-Type: image/*)."""
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(
+            stream, media_type, parser_context
+        ) or 'image.{}'.format(media_type.split('/')[-1].split(';')[0])
+
+
+def validate_image_file(file):
+    """
+    Проверяет формат и размер в пикселях по заголовку файла,
+    не декодируя изображение целиком.
+    """
+    try:
+        with Image.open(file.temporary_file_path()) as image:
+            width, height = image.size
+            image_format = image.format
+            if image_format not in ALLOWED_FORMATS:
+                raise ValidationError(
+                    'Поддерживаются только JPEG, PNG, WebP и GIF.'
+                )
+            if (
+                max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE
+                or width * height > settings.RECIPE_IMAGE_MAX_PIXELS
+            ):
+                raise ValidationError(
+                    'Изображение больше допустимого '
+                    f'({width}x{height} пикселей).'
+                )
+            image.verify()
+    except Image.DecompressionBombError:
+        # Pillow сам отказывается открывать файл, заявивший в заголовке
+        # больше 2 * Image.MAX_IMAGE_PIXELS пикселей.
+        raise ValidationError('Изображение больше допустимого.')
+    except (UnidentifiedImageError, SyntaxError, OSError):
+        raise ValidationError('Загруженный файл не является изображением.')
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_read_urls
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
 
 
@@ -13,9 +15,16 @@ router.register('recipes', RecipeViewSet, 'recipes')
 router.register('users', UserViewSet, 'users')
 
 
+def get_urls(async_views):
+    """
+    Маршруты роутера. Под ASGI читающие маршруты обслуживают асинхронные
+    view: они выполняют GET, остальные методы передают синхронным
+    viewset'ам.
+    """
+    return async_read_urls(router.urls) if async_views else router.urls
+
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(get_urls(settings.ASYNC_READ_ENDPOINTS))),
     path('auth/', include('djoser.urls.authtoken')),
 ]
-
-
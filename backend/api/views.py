@@ -1,12 +1,18 @@
+from collections import defaultdict
+from functools import partial
+
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, F, OuterRef, Sum, Value
-from django.http import HttpResponse
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import DjangoModelPermissions, IsAuthenticated
 from .permissions import AdminOrReadOnly, AuthorStaffOrReadOnly
 from rest_framework.response import Response
@@ -15,20 +21,79 @@ from rest_framework.status import (HTTP_200_OK, HTTP_201_CREATED,
                                    HTTP_400_BAD_REQUEST)
 
 from .filters import IngredientFilter, RecipeFilter
+from recipes.autocomplete import ingredient_index
+from recipes.feed import feed_recipe_ids
 from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
-                            ShoppingCart, Tag)
+                            RecipeImageUpload, ShoppingCart, Tag)
 from users.models import Subscribe
 
-from .paginators import PageLimitPagination
+from .cache import RecipeListCacheMixin, ReferenceDataCacheMixin
+from .paginators import FeedCursorPagination, PageLimitPagination
+from .projections import RecipeProjectionSerializer, recipe_values
+from .renderers import (CsvRenderer, PdfRenderer,
+                        ShoppingCartContentNegotiation, TxtRenderer)
 from .serializers import (CartRecipeSerializer, FavoriteRecipeSerializer,
                           IngredientSerializer, RecipeSerializer,
                           RecipeCreateUpdateSerializer,
+                          RecipeImageUploadSerializer,
                           SubscribeAddDeleteSerializer, TagSerializer,
                           UserCreateSerializer, UserRecipeSerializer,
-                          UserSerializer, UserSubscribtionsSerializer)
+                          UserSerializer, UserSubscribtionsSerializer,
+                          get_recipes_limit)
+from .shopping_cart import shopping_cart_response
+from .uploads import (LimitedUploadHandler, RawImageUploadParser,
+                      validate_image_file)
 
 User = get_user_model()
 
+# Действия RecipeViewSet, которые отдают рецепты из строк values().
+PROJECTION_ACTIONS = ('list', 'retrieve', 'feed', 'similar')
+
+
+def prefetch_recent_recipes(authors, limit):
+    """
+    Одним запросом загружает не более limit последних рецептов каждого
+    автора (ROW_NUMBER() по автору) и кладёт их в author.recent_recipes.
+    """
+    if not authors:
+        # Пустой IN не компилируется в SQL для окна ниже.
+        return
+    recipes = Recipe.objects.filter(
+        author__in=authors
+    ).only('id', 'name', 'image', 'cooking_time', 'author_id')
+    if limit is not None:
+        ranked = Recipe.objects.filter(author__in=authors).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=F('id').desc(),
+            )
+        ).values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        recipes = recipes.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.row_number <= %s',
+            (*params, limit),
+        ))
+    recent_recipes = defaultdict(list)
+    for recipe in recipes.order_by('-id'):
+        recent_recipes[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recent_recipes = recent_recipes[author.id]
+
+
+def recipes_with_related():
+    """Рецепты со всем, что выводит RecipeSerializer, новые первыми."""
+    return Recipe.objects.select_related('author').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.order_by('pk')),
+        Prefetch(
+            'recipe',
+            queryset=AmountIngredient.objects.select_related(
+                'ingredient'
+            ).order_by('pk')
+        ),
+    ).order_by('-id')
+
 
 class UserViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
@@ -43,9 +108,10 @@ class UserViewSet(DjoserUserViewSet):
             following=OuterRef('pk'),
             follower=user
         )
-        return (User.objects.annotate(is_subscribed=Exists(is_subscribed))
+        users = User.objects.order_by('id')
+        return (users.annotate(is_subscribed=Exists(is_subscribed))
                 if self.request.user.is_authenticated
-                else User.objects.annotate(
+                else users.annotate(
                 is_subscribed=Value(False)))
 
     # Лучше использовать словарь
@@ -68,13 +134,19 @@ class UserViewSet(DjoserUserViewSet):
     @action(detail=False)
     def subscriptions(self, request):
         user = self.request.user
-        subscribes = User.objects.filter(subscribing__follower=user)
+        recipes_limit = get_recipes_limit(request)
+        subscribes = self.get_queryset().filter(
+            subscribing__follower=user
+        ).order_by('-id')
         page = self.paginate_queryset(subscribes)
-        context = {'request': request}
+        context = {'request': request, 'recipes_limit': recipes_limit}
         if page is not None:
+            prefetch_recent_recipes(page, recipes_limit)
             return self.get_paginated_response(
                 self.get_serializer(page, many=True, context=context).data
             )
+        subscribes = list(subscribes)
+        prefetch_recent_recipes(subscribes, recipes_limit)
         return Response(self.get_serializer(
             subscribes,
             many=True, context=context).data
@@ -91,10 +163,14 @@ class UserViewSet(DjoserUserViewSet):
             'follower': user.id,
             'following': id,
         }
+        # Параметр проверяется до подписки: ошибка в нём не должна
+        # оставлять созданную подписку.
+        recipes_limit = get_recipes_limit(request)
         serializer = self.get_serializer(data=data, context=context)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         queryset = self.get_queryset().get(id=id)
+        context['recipes_limit'] = recipes_limit
         instance_serializer = UserSubscribtionsSerializer(
             queryset, context=context)
         return Response(instance_serializer.data, HTTP_201_CREATED)
@@ -115,7 +191,7 @@ class UserViewSet(DjoserUserViewSet):
         return Response(HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceDataCacheMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
@@ -123,15 +199,21 @@ class IngredientViewSet(viewsets.ModelViewSet):
     permission_classes = (AdminOrReadOnly,)
     http_method_names = ['get']
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ReferenceDataCacheMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AdminOrReadOnly,)
     http_method_names = ['get']
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RecipeListCacheMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
@@ -150,12 +232,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
             recipe=OuterRef('pk'),
             user=user
         )
-        return Recipe.objects.annotate(
+        if self.action in PROJECTION_ACTIONS:
+            return recipe_values(
+                Recipe.objects.order_by('-id'),
+                is_favorited=Exists(is_favorite),
+                is_in_shopping_cart=Exists(is_in_shopping_cart),
+            )
+        return recipes_with_related().annotate(
             is_favorited=Exists(is_favorite),
             is_in_shopping_cart=Exists(is_in_shopping_cart)
         )
 
     def get_serializer_class(self):
+        if self.action in PROJECTION_ACTIONS:
+            return RecipeProjectionSerializer
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeCreateUpdateSerializer
         if self.action == 'favorite':
@@ -165,6 +255,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeSerializer
 
     def create_update_repr(self, instanse, status):
+        instanse = self.get_queryset().get(pk=instanse.pk)
         instance_serializer = RecipeSerializer(
             instanse, context={'request': self.request})
         return Response(instance_serializer.data, status)
@@ -211,31 +302,74 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk=None):
         return self.cart_favorite_add_delete(request, ShoppingCart, pk)
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """
+        Рецепты авторов, на которых подписан пользователь, новые
+        первыми, с курсорной пагинацией (?cursor=&limit=).
+        """
+        paginator = FeedCursorPagination()
+        recipe_ids = paginator.paginate_feed(
+            partial(feed_recipe_ids, request.user.id), request
+        )
+        rows = self.get_queryset().filter(id__in=recipe_ids)
+        return paginator.get_paginated_response(
+            self.get_serializer(rows, many=True).data
+        )
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """
+        Похожие по ингредиентам рецепты, самые похожие первыми. Соседи
+        заранее посчитаны командой build_similar_recipes.
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise NotFound
+        rows = self.get_queryset().filter(
+            similar_to__recipe=pk
+        ).order_by('-similar_to__score', '-similar_to__similar')
+        data = self.get_serializer(rows, many=True).data
+        if not data and not Recipe.objects.filter(pk=pk).exists():
+            raise NotFound
+        return Response(data)
+
+    @action(methods=['post'], detail=False,
+            permission_classes=[IsAuthenticated],
+            parser_classes=(MultiPartParser, RawImageUploadParser))
+    def images(self, request):
+        """
+        Загрузка фото без base64: multipart-поле image (или file) либо
+        тело запроса с Content-Type: image/*. Файл пишется на диск
+        кусками, id ответа передаётся в image_id при создании рецепта.
+        """
+        request._request.upload_handlers = [
+            LimitedUploadHandler(request._request)
+        ]
+        file = request.FILES.get('image') or request.FILES.get('file')
+        if file is None:
+            raise ValidationError({'image': 'Файл не передан.'})
+        try:
+            validate_image_file(file)
+            upload = RecipeImageUpload.objects.create(
+                owner=request.user, image=file
+            )
+        finally:
+            # Хранилище переносит временный файл, а не копирует: закрытие
+            # убирает его, если файл остался на месте.
+            file.close()
+        serializer = RecipeImageUploadSerializer(
+            upload, context={'request': request}
+        )
+        return Response(serializer.data, status=HTTP_201_CREATED)
+
     @action(methods=['get'], detail=False,
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=(TxtRenderer, CsvRenderer, PdfRenderer),
+            content_negotiation_class=ShoppingCartContentNegotiation)
     def download_shopping_cart(self, request):
         user = self.request.user
         if not user.shoppingcart_set.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
-        ingredients = AmountIngredient.objects.filter(
-            recipe__cart__user=user
-        ).values(
-            ingridient=F('ingredient__name'),
-            measure=F('ingredient__measurment_unit'),
-        ).annotate(amount=Sum('amount'))
-
-        filename = f'{user.username}_shopping_cart.txt'
-        shopping_list = (
-            f'Список покупок для: {user.first_name}\n\n'
-        )
-        for ing in ingredients:
-            shopping_list += (
-                f'{ing["ingridient"].capitalize()}'
-                f'({ing["measure"]}): - {ing["amount"]} \n'
-            )
-
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
-        )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        return response
+        return shopping_cart_response(user, request.accepted_renderer.format)
@@ -0,0 +1,19 @@
+"""
+ASGI config for foodgram project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# Под ASGI синхронные view выполняются в потоках и медленнее, чем под
+# WSGI, поэтому читающие маршруты обслуживают асинхронные view.
+os.environ.setdefault('ASYNC_READ_ENDPOINTS', 'True')
+
+application = get_asgi_application()
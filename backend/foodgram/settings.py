@@ -27,7 +27,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.getenv('SECRET_KEY', 'v^zhhao480jq5o_m9_ue-%mrcsw-r+pxt^n2rdd20qpdk5i0^1')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = ['*', 'backend', '127.0.0.1']
 
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
+    'profiler.apps.ProfilerConfig',
     'rest_framework',
     'djoser',
     'django_filters',
@@ -67,6 +68,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 MIDDLEWARE = [
+    'api.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +76,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'profiler.middleware.ProfilerMiddleware',
 ]
 
 REST_FRAMEWORK = {
@@ -82,8 +85,48 @@ REST_FRAMEWORK = {
 
     'DEFAULT_PERMISSION_CLASSES':
     ['rest_framework.permissions.IsAuthenticatedOrReadOnly', ],
+
+    # JSON через orjson, если он установлен, с тем же результатом, что и
+    # у стандартных JSONRenderer и JSONParser.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
 }
 
+# Сколько секунд хранить отрендеренные теги и ингредиенты. Изменения
+# справочников сбрасывают кэш сразу, меняя версию в ключе.
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', 86400))
+
+# Общие для всех пользователей страницы списка рецептов. Каждая
+# проверяется по базе, поэтому срок хранения только ограничивает память.
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+
+# Асинхронные view для читающих маршрутов (рецепты, теги, ингредиенты,
+# подписки). Имеет смысл при запуске под ASGI: foodgram.asgi включает их
+# сам, под WSGI (по умолчанию) они выключены.
+ASYNC_READ_ENDPOINTS = os.getenv('ASYNC_READ_ENDPOINTS', 'False') == 'True'
+
+# Потоки для запросов к базе из асинхронных view, у каждого своё
+# соединение: не больше, чем база выдержит на один процесс.
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 16))
+
 
 ROOT_URLCONF = 'foodgram.urls'
 
@@ -109,10 +152,17 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Сколько секунд держать соединение с базой открытым между запросами.
+# Потоки асинхронных view (ASYNC_DB_THREADS) обращаются к базе по
+# нескольку раз на запрос: без постоянных соединений каждое обращение
+# открывало бы новое.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
     }
 }
 
@@ -123,7 +173,8 @@ DATABASES = {
 #         'USER': os.getenv('POSTGRES_USER', default='postgres'),
 #         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='pete3015'),
 #         'HOST': os.getenv('DB_HOST', default='127.0.0.1'),
-#         'PORT': os.getenv('DB_PORT', default='5432')
+#         'PORT': os.getenv('DB_PORT', default='5432'),
+#         'CONN_MAX_AGE': DB_CONN_MAX_AGE,
 #     }
 # }
 
@@ -168,3 +219,100 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Поиск ингредиентов по индексу в памяти процесса
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+# Поиск рецептов по имеющимся ингредиентам (?have=): какая доля
+# ингредиентов рецепта должна быть у пользователя и сколько лучших
+# рецептов отдавать.
+RECIPE_COVERAGE_MIN = float(os.getenv('RECIPE_COVERAGE_MIN', 0.5))
+RECIPE_COVERAGE_LIMIT = int(os.getenv('RECIPE_COVERAGE_LIMIT', 500))
+# Журнал изменений этого индекса в кэше: сколько секунд хранить записи
+# и после скольких пропущенных записей проще построить индекс заново.
+RECIPE_COVERAGE_CHANGES_TIMEOUT = int(
+    os.getenv('RECIPE_COVERAGE_CHANGES_TIMEOUT', 86400)
+)
+RECIPE_COVERAGE_MAX_REPLAY = int(
+    os.getenv('RECIPE_COVERAGE_MAX_REPLAY', 1000)
+)
+# Сколько секунд индекс служит без полной перестройки: столько могут
+# быть не видны изменения других процессов, если кэш у каждого свой.
+RECIPE_COVERAGE_TTL = int(os.getenv('RECIPE_COVERAGE_TTL', 300))
+
+# Рецепты авторов, у которых столько подписчиков или больше, не
+# копируются в ленты подписок, а подмешиваются при чтении. После
+# изменения порога нужно выполнить manage.py rebuild_feeds.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+
+# Сколько похожих рецептов хранить для каждого рецепта и учитывать ли
+# при сходстве теги вместе с ингредиентами. После изменения нужно
+# выполнить manage.py build_similar_recipes --full.
+RECIPE_SIMILAR_COUNT = int(os.getenv('RECIPE_SIMILAR_COUNT', 10))
+RECIPE_SIMILARITY_TAGS = os.getenv('RECIPE_SIMILARITY_TAGS', 'False') == 'True'
+
+# Ограничения для загрузки фото рецептов файлом
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 2 ** 20))
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+RECIPE_IMAGE_MAX_SIDE = int(os.getenv('RECIPE_IMAGE_MAX_SIDE', 10_000))
+# Через сколько часов фото, загруженное файлом и не привязанное к
+# рецепту, удаляет команда purge_image_uploads.
+RECIPE_IMAGE_UPLOAD_TTL = float(os.getenv('RECIPE_IMAGE_UPLOAD_TTL', 24))
+
+# Число процессов для построения копий фото рецептов; 0 - строить
+# синхронно в процессе запроса.
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
+
+# TTF-шрифт с кириллицей для выгрузки списка покупок в PDF
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+# Сколько страниц PDF со списком покупок собирать не больше: reportlab
+# держит все страницы в памяти до конца выгрузки. Остаток списка есть в
+# txt и CSV.
+SHOPPING_CART_PDF_MAX_PAGES = int(
+    os.getenv('SHOPPING_CART_PDF_MAX_PAGES', 100)
+)
+
+# Замер SQL-запросов каждого запроса с заголовком Server-Timing и
+# строкой в логгер api.sql. Выключенный middleware ничего не стоит.
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'False') == 'True'
+# Допустимое число SQL-запросов вместе с проверкой токена: по имени view
+# или "МЕТОД имя view", для остальных view - SQL_QUERY_BUDGET.
+SQL_QUERY_BUDGET = int(os.getenv('SQL_QUERY_BUDGET', 10))
+SQL_QUERY_BUDGETS = {
+    'api:recipes-list': 7,
+    'api:recipes-detail': 5,
+    'POST api:recipes-list': 16,
+    'PATCH api:recipes-detail': 16,
+    'api:users-subscriptions': 4,
+    'api:ingredients-list': 3,
+    'api:tags-list': 3,
+}
+
+# Профили запросов, которые сотрудники включают заголовком X-Profile
+# или параметром ?profile=1, и период снятия стеков в секундах.
+PROFILER_DIR = os.getenv(
+    'PROFILER_DIR', os.path.join(BASE_DIR, 'profiles')
+)
+PROFILER_SAMPLE_INTERVAL = float(
+    os.getenv('PROFILER_SAMPLE_INTERVAL', 0.005)
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
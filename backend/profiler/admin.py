@@ -0,0 +1,20 @@
+from django.contrib import admin
+
+from .models import RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'created', 'method', 'view_name', 'path', 'status', 'duration',
+        'query_count', 'user'
+    )
+    list_filter = ('view_name', 'method')
+    search_fields = ('path', 'view_name')
+    list_select_related = ('user',)
+    readonly_fields = [
+        field.name for field in RequestProfile._meta.fields
+    ]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ProfilerConfig(AppConfig):
+    name = 'profiler'
+    verbose_name = 'Профилирование'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,163 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import async_to_sync, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.middleware import RequestQueries, thread_hook, wrap_connections
+
+from .models import RequestProfile
+from .sampling import StackSampler
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_PARAM = 'profile'
+
+
+def get_staff_user(request):
+    """
+    Сотрудник, от имени которого выполняется запрос. API авторизует
+    по токену уже во view, поэтому токен проверяется здесь отдельно.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        if authenticated is None:
+            return None
+        user, _ = authenticated
+    return user if user.is_staff else None
+
+
+class ThreadProfiles:
+    """
+    Профиль запроса в потоках пула асинхронных view (api.async_views):
+    каждый вызов in_thread получает свой cProfile, его SQL-запросы
+    считаются, а стеки потока снимает общий StackSampler.
+    """
+
+    def __init__(self, queries, sampler):
+        self.queries = queries
+        self.sampler = sampler
+        self.profilers = []
+
+    @contextmanager
+    def __call__(self):
+        profiler = cProfile.Profile()
+        with wrap_connections(self.queries), self.sampler.watch():
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self.profilers.append(profiler)
+
+
+class ProfilerMiddleware:
+    """
+    Профилирует один запрос, если сотрудник прислал заголовок
+    X-Profile: 1 или параметр ?profile=1. cProfile сохраняет pstats,
+    параллельный поток снимает стеки для flamegraph. Файлы пишутся в
+    PROFILER_DIR, запись о профиле видна в админке. Для остальных
+    запросов это одна проверка заголовка и параметра.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Под ASGI обычный запрос проходит без перехода в поток.
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def is_requested(request):
+        requested = (
+            request.META.get(PROFILE_HEADER)
+            or request.GET.get(PROFILE_QUERY_PARAM)
+        )
+        return requested not in (None, '', '0')
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.is_requested(request):
+            return self.get_response(request)
+        user = get_staff_user(request)
+        if user is None:
+            return self.get_response(request)
+        return self.profile(request, user, self.get_response)
+
+    async def __acall__(self, request):
+        if not self.is_requested(request):
+            return await self.get_response(request)
+        user = await sync_to_async(get_staff_user)(request)
+        if user is None:
+            return await self.get_response(request)
+        # Синхронные view выполнятся в потоке профилировщика, запросы
+        # асинхронных к базе - в потоках пула, их профилирует
+        # ThreadProfiles.
+        return await sync_to_async(self.profile)(
+            request, user, async_to_sync(self.get_response)
+        )
+
+    def profile(self, request, user, get_response):
+        queries = RequestQueries()
+        profiler = cProfile.Profile()
+        sampler = StackSampler(
+            threading.get_ident(), settings.PROFILER_SAMPLE_INTERVAL
+        )
+        threads = ThreadProfiles(queries, sampler)
+        started = time.perf_counter()
+        sampler.start()
+        with ExitStack() as stack:
+            stack.enter_context(wrap_connections(queries))
+            stack.enter_context(thread_hook(threads))
+            profiler.enable()
+            try:
+                response = get_response(request)
+                if response.streaming:
+                    # Потоковый ответ формирует тело уже после view:
+                    # читаем его сразу, чтобы оно попало в профиль.
+                    response.streaming_content = [
+                        b''.join(response.streaming_content)
+                    ]
+            finally:
+                profiler.disable()
+                sampler.stop()
+        duration = (time.perf_counter() - started) * 1000
+
+        os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+        name = os.path.join(
+            settings.PROFILER_DIR,
+            f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        )
+        stats = pstats.Stats(profiler)
+        for thread_profiler in threads.profilers:
+            stats.add(thread_profiler)
+        stats.dump_stats(f'{name}.prof')
+        sampler.write(f'{name}.collapsed')
+        match = request.resolver_match
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            view_name=match.view_name if match else '',
+            status=response.status_code,
+            duration=duration,
+            query_count=queries.count,
+            pstats_path=f'{name}.prof',
+            collapsed_path=f'{name}.collapsed',
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
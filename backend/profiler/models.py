@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='request_profiles',
+        verbose_name='Пользователь'
+    )
+    method = models.CharField(
+        max_length=10,
+        verbose_name='Метод'
+    )
+    path = models.CharField(
+        max_length=2000,
+        verbose_name='Адрес'
+    )
+    view_name = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='View'
+    )
+    status = models.PositiveSmallIntegerField(
+        verbose_name='Статус ответа'
+    )
+    duration = models.FloatField(
+        verbose_name='Длительность, мс'
+    )
+    query_count = models.PositiveIntegerField(
+        verbose_name='SQL-запросов'
+    )
+    pstats_path = models.CharField(
+        max_length=500,
+        verbose_name='Файл pstats'
+    )
+    collapsed_path = models.CharField(
+        max_length=500,
+        verbose_name='Файл стеков для flamegraph'
+    )
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration:.0f} мс)'
@@ -0,0 +1,62 @@
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+class StackSampler(threading.Thread):
+    """
+    Раз в interval секунд снимает стеки вызовов потока thread_id и
+    потоков, добавленных через watch(), и считает одинаковые стеки.
+    Результат в формате collapsed stacks (flamegraph.pl, speedscope):
+    "корень;...;лист количество".
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @contextmanager
+    def watch(self):
+        """Пока блок выполняется, снимать и стек текущего потока."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self.thread_ids.add(thread_id)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.thread_ids.discard(thread_id)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = list(self.thread_ids)
+            for thread_id in thread_ids:
+                self.sample(frames.get(thread_id))
+
+    def sample(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(
+                f'{code.co_name} '
+                f'({code.co_filename}:{code.co_firstlineno})'
+            )
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
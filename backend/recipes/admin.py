@@ -9,19 +9,15 @@ class IngredientInRecipeAdmin(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorite_count')
+    list_display = ('name', 'author', 'favorites_count')
     list_filter = ('name', 'author', 'tags')
     search_fields = ('name',)
 
+    readonly_fields = ('favorites_count',)
     inlines = [
         IngredientInRecipeAdmin,
     ]
 
-    def favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj.id).count()
-
-    favorite_count.short_description = 'В избранном'
-
 
 class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
@@ -0,0 +1,115 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+INGREDIENT_FIELDS = ('id', 'name', 'measurument_unit')
+
+
+class IngredientIndex:
+    """
+    Префиксный индекс названий ингредиентов в памяти процесса.
+
+    Строится лениво при первом поиске и перестраивается раз в
+    INGREDIENT_INDEX_TTL секунд, чтобы подхватить изменения из других
+    процессов. Изменения в текущем процессе вносятся сигналами сразу.
+    Поиск регистронезависимый и не обращается к базе данных.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._built_at = 0
+
+    @staticmethod
+    def _key(name):
+        return name.lower()
+
+    def build(self):
+        from .models import Ingredient
+
+        items = {
+            item['id']: item
+            for item in Ingredient.objects.values(*INGREDIENT_FIELDS)
+        }
+        keys = sorted(
+            (self._key(item['name']), item['id']) for item in items.values()
+        )
+        with self._lock:
+            self._keys, self._items = keys, items
+            self._built_at = time.monotonic()
+        return keys, items
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = self._items = None
+
+    def _snapshot(self):
+        # Пара читается под блокировкой: update() и remove() заменяют её
+        # целиком, и ключи одной версии не должны встретиться со
+        # словарём другой.
+        with self._lock:
+            keys, items = self._keys, self._items
+            expired = (
+                time.monotonic() - self._built_at
+                > settings.INGREDIENT_INDEX_TTL
+            )
+        if keys is None or expired:
+            keys, items = self.build()
+        return keys, items
+
+    def search(self, query, limit=None):
+        """
+        Ингредиенты, в названии которых встречается query: сначала точное
+        совпадение, затем совпадения по началу, затем по вхождению.
+        Пустой запрос (или из одних пробелов) ничего не находит.
+        """
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = self._key(query.strip())
+        if not query:
+            return []
+        keys, items = self._snapshot()
+        found = []
+        position = bisect_left(keys, (query,))
+        while position < len(keys) and len(found) < limit:
+            key, pk = keys[position]
+            if not key.startswith(query):
+                break
+            found.append(pk)
+            position += 1
+        if len(found) < limit:
+            for key, pk in keys:
+                if query in key and not key.startswith(query):
+                    found.append(pk)
+                    if len(found) == limit:
+                        break
+        return [items[pk] for pk in found]
+
+    def update(self, ingredient):
+        """Добавляет или заменяет ингредиент в уже построенном индексе."""
+        with self._lock:
+            if self._keys is None:
+                return
+            keys, items = list(self._keys), dict(self._items)
+            previous = items.get(ingredient.pk)
+            if previous is not None:
+                keys.remove((self._key(previous['name']), ingredient.pk))
+            items[ingredient.pk] = {
+                field: getattr(ingredient, field)
+                for field in INGREDIENT_FIELDS
+            }
+            insort(keys, (self._key(ingredient.name), ingredient.pk))
+            self._keys, self._items = keys, items
+
+    def remove(self, pk):
+        with self._lock:
+            if self._keys is None or pk not in self._items:
+                return
+            keys, items = list(self._keys), dict(self._items)
+            keys.remove((self._key(items.pop(pk)['name']), pk))
+            self._keys, self._items = keys, items
+
+
+ingredient_index = IngredientIndex()
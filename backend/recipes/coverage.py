@@ -0,0 +1,324 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CHANGES_VERSION_KEY = 'recipe-coverage-version'
+# Пометка в журнале изменений: перестроить индекс целиком.
+REBUILD = 0
+
+
+def change_key(version):
+    return f'recipe-coverage-change:{version}'
+
+
+class RecipeCoverageIndex:
+    """
+    Обратный индекс ингредиент -> рецепты в памяти процесса для поиска
+    "что приготовить из того, что есть".
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов
+    (array('i'), 4 байта на строку AmountIngredient). Для частых
+    ингредиентов, у которых битовая карта (бит на id рецепта) короче
+    массива, хранится и она, а рецепты сгруппированы картами по числу
+    ингредиентов. Поиск складывает карты имеющихся ингредиентов
+    поразрядно (двоичный счётчик из карт: бит j числа совпадений
+    каждого рецепта) и выбирает рецепты с нужным числом совпадений
+    операциями над целыми Python, не перебирая рецепты по одному.
+
+    Индекс строится целиком из базы при первом поиске, изменения
+    рецептов текущего процесса вносятся сигналами после коммита. Другие
+    процессы узнают о них из журнала в кэше: номер последнего изменения
+    и id изменённых рецептов под ключами по номерам. Если журнал прерван
+    (записи истекли или кэш очищен), индекс строится заново. Журнал
+    работает только с общим кэшем (Redis, Memcached): с кэшем в памяти
+    процесса изменения других процессов видны не позже, чем через
+    RECIPE_COVERAGE_TTL секунд, - тогда индекс строится заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._bitmaps = None
+        self._sizes = None
+        self._size_bitmaps = None
+        self._version = 0
+        self._built = 0
+        self._pending = threading.local()
+
+    def build(self):
+        from .models import AmountIngredient
+
+        version = cache.get(CHANGES_VERSION_KEY, 0)
+        built = time.monotonic()
+        postings = defaultdict(list)
+        sizes = array('H')
+        for recipe_id, ingredient_id in AmountIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by().iterator(chunk_size=10000):
+            postings[ingredient_id].append(recipe_id)
+            grow(sizes, recipe_id + 1)
+            sizes[recipe_id] += 1
+        postings = {
+            ingredient_id: array('i', sorted(recipe_ids))
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        # Карта выгоднее массива, если в ней хотя бы каждый 32-й бит
+        # занят: 4 байта на id против бита на каждый возможный id.
+        bitmaps = {
+            ingredient_id: bitmap_of(recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+            if len(recipe_ids) * 32 >= len(sizes)
+        }
+        by_size = defaultdict(list)
+        for recipe_id, size in enumerate(sizes):
+            if size:
+                by_size[size].append(recipe_id)
+        size_bitmaps = {
+            size: bitmap_of(recipe_ids)
+            for size, recipe_ids in by_size.items()
+        }
+        with self._lock:
+            self._postings, self._bitmaps = postings, bitmaps
+            self._sizes, self._size_bitmaps = sizes, size_bitmaps
+            self._version = version
+            self._built = built
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = self._bitmaps = None
+            self._sizes = self._size_bitmaps = None
+
+    def _snapshot(self):
+        if self._postings is None or (
+            time.monotonic() - self._built > settings.RECIPE_COVERAGE_TTL
+        ):
+            self.build()
+        else:
+            self._sync()
+        with self._lock:
+            return self._postings, self._bitmaps, self._size_bitmaps
+
+    def _sync(self):
+        """Применяет изменения других процессов из журнала в кэше."""
+        version = cache.get(CHANGES_VERSION_KEY, 0)
+        if version == self._version:
+            return
+        if version < self._version or (
+            version - self._version > settings.RECIPE_COVERAGE_MAX_REPLAY
+        ):
+            self.build()
+            return
+        changes = cache.get_many([
+            change_key(number)
+            for number in range(self._version + 1, version + 1)
+        ])
+        recipe_ids = set()
+        for ids in changes.values():
+            recipe_ids.update(ids)
+        if len(changes) < version - self._version or REBUILD in recipe_ids:
+            self.build()
+            return
+        self.refresh(recipe_ids)
+        self._version = version
+
+    def refresh(self, recipe_ids):
+        """Перечитывает из базы ингредиенты рецептов recipe_ids."""
+        from .models import AmountIngredient
+
+        if self._postings is None:
+            return
+        current = defaultdict(list)
+        for recipe_id, ingredient_id in AmountIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[ingredient_id].append(recipe_id)
+        recipe_ids = set(recipe_ids)
+        changed = bitmap_of(recipe_ids)
+        with self._lock:
+            if self._postings is None:
+                return
+            # Всё меняется копиями: поиск в другом потоке дочитает
+            # прежнее состояние.
+            postings, bitmaps = dict(self._postings), dict(self._bitmaps)
+            sizes = array('H', self._sizes)
+            size_bitmaps = dict(self._size_bitmaps)
+            for ingredient_id in set(postings) | set(current):
+                previous = postings.get(ingredient_id, ())
+                added = current.get(ingredient_id, [])
+                if not added and not any(
+                    contains(previous, pk) for pk in recipe_ids
+                ):
+                    continue
+                postings[ingredient_id] = array('i', sorted(
+                    [pk for pk in previous if pk not in recipe_ids] + added
+                ))
+                if ingredient_id in bitmaps:
+                    bitmaps[ingredient_id] = (
+                        bitmaps[ingredient_id] & ~changed | bitmap_of(added)
+                    )
+            grow(sizes, max(recipe_ids) + 1)
+            for recipe_id in recipe_ids:
+                size = sizes[recipe_id]
+                if size:
+                    size_bitmaps[size] &= ~changed
+                sizes[recipe_id] = 0
+            for added in current.values():
+                for recipe_id in added:
+                    sizes[recipe_id] += 1
+            by_size = defaultdict(list)
+            for recipe_id in recipe_ids:
+                if sizes[recipe_id]:
+                    by_size[sizes[recipe_id]].append(recipe_id)
+            for size, ids in by_size.items():
+                size_bitmaps[size] = (
+                    size_bitmaps.get(size, 0) | bitmap_of(ids)
+                )
+            self._postings, self._bitmaps = postings, bitmaps
+            self._sizes, self._size_bitmaps = sizes, size_bitmaps
+
+    def changed(self, recipe_id):
+        """
+        Отмечает изменение ингредиентов рецепта в текущей транзакции.
+        После коммита индекс процесса перечитывает рецепт, а другие
+        процессы узнают о нём из журнала; несколько сигналов одной
+        транзакции (удаление рецепта со всеми строками) дают одно
+        изменение.
+        """
+        if not hasattr(self._pending, 'recipe_ids'):
+            self._pending.recipe_ids = set()
+        self._pending.recipe_ids.add(recipe_id)
+        transaction.on_commit(self._flush)
+
+    def _flush(self):
+        recipe_ids = getattr(self._pending, 'recipe_ids', None)
+        if not recipe_ids:
+            return
+        self._pending.recipe_ids = set()
+        version = publish(recipe_ids)
+        self.refresh(recipe_ids)
+        if version == self._version + 1:
+            # Своё изменение из журнала перечитывать не нужно.
+            self._version = version
+
+    def reload(self):
+        """Массовая загрузка рецептов: индекс строится заново везде."""
+        publish({REBUILD})
+        self.invalidate()
+
+    def search(self, ingredient_ids, min_coverage=None, limit=None):
+        """
+        Рецепты, ингредиенты которых хотя бы на min_coverage есть среди
+        ingredient_ids: список (доля, id) по убыванию доли, при равной
+        доле - новые первыми.
+        """
+        if min_coverage is None:
+            min_coverage = settings.RECIPE_COVERAGE_MIN
+        limit = limit or settings.RECIPE_COVERAGE_LIMIT
+        postings, bitmaps, size_bitmaps = self._snapshot()
+        counter = []
+        for ingredient_id in set(ingredient_ids):
+            bitmap = bitmaps.get(ingredient_id)
+            if bitmap is None:
+                bitmap = bitmap_of(postings.get(ingredient_id, ()))
+            add_bitmap(counter, bitmap)
+        # Уровни (доля, число ингредиентов, совпадений) по убыванию доли.
+        levels = sorted((
+            (count / size, size, count)
+            for size in size_bitmaps
+            for count in range(1, min(size, 2 ** len(counter) - 1) + 1)
+            if count >= min_coverage * size
+        ), reverse=True)
+        return list(islice(ranked(counter, size_bitmaps, levels), limit))
+
+
+def grow(sizes, length):
+    if len(sizes) < length:
+        sizes.frombytes(bytes((length - len(sizes)) * sizes.itemsize))
+
+
+def contains(posting, recipe_id):
+    position = bisect_left(posting, recipe_id)
+    return position < len(posting) and posting[position] == recipe_id
+
+
+def bitmap_of(recipe_ids):
+    """Целое, в котором установлены биты с номерами recipe_ids."""
+    if not recipe_ids:
+        return 0
+    bits = bytearray(max(recipe_ids) // 8 + 1)
+    for recipe_id in recipe_ids:
+        bits[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def add_bitmap(counter, bitmap):
+    """
+    Прибавляет по единице к счётчикам рецептов из bitmap. counter[j] -
+    карта рецептов, у которых бит j числа совпадений равен 1.
+    """
+    for position, digit in enumerate(counter):
+        counter[position], bitmap = digit ^ bitmap, digit & bitmap
+        if not bitmap:
+            return
+    if bitmap:
+        counter.append(bitmap)
+
+
+def count_equals(counter, count, bitmap):
+    """Рецепты из bitmap, у которых ровно count совпадений."""
+    if count >> len(counter):
+        return 0
+    for position, digit in enumerate(counter):
+        bitmap &= digit if count >> position & 1 else ~digit
+    return bitmap
+
+
+def ranked(counter, size_bitmaps, levels):
+    """
+    Пары (оценка, id) по убыванию оценки, при равной - по убыванию id.
+    levels - (оценка, размер, совпадений) по убыванию оценки: рецепты
+    из size_bitmaps[размер] ровно с таким числом совпадений в counter.
+    """
+    for score, group in groupby(levels, key=itemgetter(0)):
+        bitmap = 0
+        for _, size, count in group:
+            bitmap |= count_equals(counter, count, size_bitmaps[size])
+        for recipe_id in bits_descending(bitmap):
+            yield score, recipe_id
+
+
+def bits_descending(bitmap):
+    """Номера установленных битов от старшего к младшему."""
+    digits = bin(bitmap)
+    top = len(digits) - 3
+    position = digits.find('1', 2)
+    while position != -1:
+        yield top - (position - 2)
+        position = digits.find('1', position + 1)
+
+
+def publish(recipe_ids):
+    """Записывает изменение в журнал кэша для других процессов."""
+    try:
+        version = cache.incr(CHANGES_VERSION_KEY)
+    except ValueError:
+        # Журнала нет: с версии 1 процессы со старой версией
+        # перестроят индекс.
+        cache.add(CHANGES_VERSION_KEY, 1, None)
+        version = cache.get(CHANGES_VERSION_KEY, 1)
+    cache.set(
+        change_key(version), list(recipe_ids),
+        settings.RECIPE_COVERAGE_CHANGES_TIMEOUT,
+    )
+    return version
+
+
+recipe_coverage_index = RecipeCoverageIndex()
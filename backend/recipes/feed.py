@@ -0,0 +1,136 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Для обычных авторов лента строится при записи: новый рецепт сразу
+добавляется строками FeedItem всем подписчикам, подписка добавляет в
+ленту рецепты автора, отписка убирает их. Страница ленты - диапазон по
+индексу (user, recipe), сколько бы авторов ни читал пользователь.
+
+Рецепты авторов, у которых не меньше FEED_FANOUT_MAX_FOLLOWERS
+подписчиков, в ленты не копируются: один их рецепт стоил бы такого же
+числа строк. При чтении они берутся из рецептов по индексу (author, id)
+и сливаются с лентой. Когда автор переходит порог, его строки удаляются
+из лент или добавляются в них обратно. Если ленты всё же разошлись с
+подписками (сбой после коммита, смена порога), их строит заново команда
+rebuild_feeds.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from users.models import Subscribe
+
+from .models import FeedItem, Recipe
+
+User = get_user_model()
+
+FEED_TABLE = FeedItem._meta.db_table
+RECIPE_TABLE = Recipe._meta.db_table
+SUBSCRIBE_TABLE = Subscribe._meta.db_table
+USER_TABLE = User._meta.db_table
+
+
+def insert_timelines(where, params=(), using=DEFAULT_DB_ALIAS):
+    """
+    Добавляет в ленты рецепты по подпискам, отобранным условием where
+    (псевдонимы s - подписка, r - рецепт), кроме рецептов авторов с
+    лентой при чтении. Уже добавленные строки пропускаются.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FEED_TABLE} (user_id, recipe_id) '
+            f'SELECT s.follower_id, r.id FROM {SUBSCRIBE_TABLE} s '
+            f'JOIN {RECIPE_TABLE} r ON r.author_id = s.following_id '
+            f'JOIN {USER_TABLE} a ON a.id = s.following_id '
+            f'WHERE a.followers_count < %s AND {where} '
+            f'ON CONFLICT DO NOTHING',
+            (settings.FEED_FANOUT_MAX_FOLLOWERS, *params),
+        )
+
+
+def fan_out(recipe_id):
+    """Новый рецепт - в ленты подписчиков автора."""
+    insert_timelines('r.id = %s', (recipe_id,))
+
+
+def followers_count(author_id):
+    return User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def follow(follower_id, author_id):
+    """Подписка: рецепты автора - в ленту подписчика."""
+    # Порог сверяется с текущим счётчиком, а не ловится равенством:
+    # подписки, закоммиченные одновременно, видят уже общий итог.
+    if followers_count(author_id) >= settings.FEED_FANOUT_MAX_FOLLOWERS:
+        # Автор на ленте при чтении: его строк в лентах быть не должно.
+        FeedItem.objects.filter(recipe__author=author_id).delete()
+        return
+    insert_timelines(
+        's.follower_id = %s AND s.following_id = %s',
+        (follower_id, author_id),
+    )
+
+
+def unfollow(follower_id, author_id):
+    """Отписка: рецепты автора - из ленты подписчика."""
+    FeedItem.objects.filter(
+        user=follower_id, recipe__author=author_id
+    ).delete()
+    if (
+        followers_count(author_id) < settings.FEED_FANOUT_MAX_FOLLOWERS
+        and not FeedItem.objects.filter(recipe__author=author_id).exists()
+    ):
+        # Автор под порогом, а его строк в лентах нет: он вернулся с
+        # ленты при чтении, рецепты снова идут в ленты. Если строк нет,
+        # потому что нет рецептов или подписчиков, вставка ничего не
+        # добавит.
+        insert_timelines('s.following_id = %s', (author_id,))
+
+
+def rebuild_timelines(using=DEFAULT_DB_ALIAS):
+    FeedItem.objects.using(using).all().delete()
+    insert_timelines('1 = 1', using=using)
+
+
+def latest(table, column, key, value, limit, before):
+    """Подзапрос: не больше limit последних column строк с key = value."""
+    sql = f'SELECT {column} FROM {table} WHERE {key} = %s'
+    params = [value]
+    if before is not None:
+        sql += f' AND {column} < %s'
+        params.append(before)
+    return f'{sql} ORDER BY {column} DESC LIMIT %s', params + [limit]
+
+
+def feed_recipe_ids(user_id, limit, before=None):
+    """
+    Не больше limit id рецептов ленты пользователя, меньших before, по
+    убыванию. Строки ленты и последние рецепты каждого автора с лентой
+    при чтении выбираются по своим индексам не больше чем по limit и
+    сливаются одним запросом: UNION убирает повторы, пока строки автора,
+    перешедшего порог, ещё не удалены из лент.
+    """
+    streams = [
+        latest(FEED_TABLE, 'recipe_id', 'user_id', user_id, limit, before)
+    ]
+    for author_id in Subscribe.objects.filter(
+        follower=user_id,
+        following__followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('following_id', flat=True):
+        streams.append(
+            latest(RECIPE_TABLE, 'id', 'author_id', author_id, limit, before)
+        )
+    # Каждая выборка - подзапрос: в SQLite у частей UNION не может быть
+    # своих ORDER BY и LIMIT.
+    sql = ' UNION '.join(
+        f'SELECT * FROM ({stream}) stream{number}'
+        for number, (stream, _) in enumerate(streams)
+    )
+    with connections[FeedItem.objects.db].cursor() as cursor:
+        cursor.execute(
+            f'{sql} ORDER BY 1 DESC LIMIT %s',
+            [param for _, params in streams for param in params] + [limit],
+        )
+        return [recipe_id for recipe_id, in cursor.fetchall()]
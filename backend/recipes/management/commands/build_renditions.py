@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.renditions import (build_renditions, has_renditions,
+                                save_renditions)
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные копии фото для рецептов, у которых их нет или '
+        'они устарели.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        pending = (
+            recipe for recipe in Recipe.objects.only(
+                'id', 'image', 'renditions'
+            ).iterator() if recipe.image and not has_renditions(recipe)
+        )
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                batch = list(islice(pending, options['batch_size']))
+                if not batch:
+                    break
+                futures = {
+                    pool.submit(build_renditions, recipe.image.name):
+                        recipe.pk
+                    for recipe in batch
+                }
+                for future in as_completed(futures):
+                    try:
+                        save_renditions(futures[future], future.result())
+                        done += 1
+                    except Exception as error:
+                        failed += 1
+                        self.stderr.write(
+                            f'Рецепт {futures[future]}: {error}'
+                        )
+                self.stdout.write(f'Обработано {done}, с ошибками {failed}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: обработано {done}, с ошибками {failed}.'
+        ))
@@ -0,0 +1,118 @@
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeSimilarity
+from recipes.similarity import RecipeMatrix
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает похожие рецепты по ингредиентам. Без --full - только для '
+        'рецептов, изменённых после прошлого запуска, и тех, чьих соседей '
+        'эти изменения затрагивают.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать соседей всех рецептов.'
+        )
+        parser.add_argument(
+            '--count', type=int, default=settings.RECIPE_SIMILAR_COUNT
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        computed = timezone.now()
+        last_run = RecipeSimilarity.objects.aggregate(
+            last_run=Max('computed')
+        )['last_run']
+        matrix = RecipeMatrix.load(settings.RECIPE_SIMILARITY_TAGS)
+        full = options['full'] or last_run is None
+        if full:
+            targets = set(matrix.features)
+        else:
+            targets = self.affected(matrix, last_run, options['count'])
+        targets = iter(sorted(targets))
+        done = 0
+        while True:
+            batch = list(islice(targets, options['batch_size']))
+            if not batch:
+                break
+            self.save(matrix, batch, options['count'], computed)
+            done += len(batch)
+            self.stdout.write(f'Обработано {done}')
+        if full:
+            # Соседи рецептов, у которых не осталось ингредиентов.
+            RecipeSimilarity.objects.filter(computed__lt=computed).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: пересчитано {done} рецептов за '
+            f'{time.monotonic() - started:.1f} с.'
+        ))
+
+    @staticmethod
+    def affected(matrix, last_run, count):
+        """
+        Рецепты, соседей которых нужно пересчитать: изменённые после
+        last_run, те, у кого изменённый рецепт среди соседей или мог бы
+        в них войти (сходство с ним не ниже, чем у последнего соседа: при
+        равном сходстве новый рецепт вытесняет старый), и те, у кого
+        соседей меньше count (соседа удалили).
+        """
+        changed = set(Recipe.objects.filter(
+            modified__gte=last_run
+        ).values_list('id', flat=True))
+        targets = set(changed)
+        targets.update(RecipeSimilarity.objects.filter(
+            similar__in=changed
+        ).values_list('recipe_id', flat=True))
+        weakest = {}
+        for recipe_id, score, neighbours in RecipeSimilarity.objects.values(
+            'recipe_id'
+        ).annotate(
+            score=Min('score'), neighbours=Count('id')
+        ).values_list('recipe_id', 'score', 'neighbours'):
+            if neighbours < count:
+                targets.add(recipe_id)
+            else:
+                weakest[recipe_id] = score
+        # У рецептов без полного списка соседей в него войдёт любой.
+        floor = min(weakest.values()) if weakest else 0
+        if len(weakest) < len(matrix.features):
+            floor = 0
+        for recipe_id in changed:
+            for score, similar_id in matrix.scores(recipe_id, floor):
+                if score >= weakest.get(similar_id, 0):
+                    targets.add(similar_id)
+        return targets
+
+    @staticmethod
+    def save(matrix, batch, count, computed):
+        nearest = {
+            recipe_id: matrix.nearest(recipe_id, count)
+            for recipe_id in batch
+        }
+        # Рецепты, удалённые после загрузки матрицы, пропускаются.
+        existing = set(Recipe.objects.filter(id__in={
+            similar_id for neighbours in nearest.values()
+            for _, similar_id in neighbours
+        } | set(batch)).values_list('id', flat=True))
+        with transaction.atomic():
+            RecipeSimilarity.objects.filter(recipe__in=batch).delete()
+            RecipeSimilarity.objects.bulk_create(
+                RecipeSimilarity(
+                    recipe_id=recipe_id, similar_id=similar_id,
+                    score=score, computed=computed,
+                )
+                for recipe_id, neighbours in nearest.items()
+                if recipe_id in existing
+                for score, similar_id in neighbours
+                if similar_id in existing
+            )
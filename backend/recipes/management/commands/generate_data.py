@@ -0,0 +1,367 @@
+import math
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from recipes.renditions import UPLOAD_TO, build_renditions
+from recipes.signals import catalogue_loaded
+from users.models import Subscribe
+
+User = get_user_model()
+
+# Размеры данных при --scale 1. Ингредиентов нужно меньше, чем
+# рецептов, поэтому их число растёт как корень из масштаба.
+SCALE_UNIT = {
+    'users': 1000,
+    'recipes': 10000,
+    'ingredients': 2000,
+}
+TAGS = (
+    ('Завтрак', 'breakfast'), ('Обед', 'lunch'), ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'), ('Выпечка', 'baking'), ('Суп', 'soup'),
+    ('Салат', 'salad'), ('Закуска', 'snack'), ('Напиток', 'drink'),
+    ('Вегетарианское', 'vegetarian'), ('Быстро', 'quick'),
+    ('Праздничное', 'festive'),
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'каша', 'омлет', 'рагу', 'запеканка', 'паста',
+    'плов', 'блины', 'котлеты', 'жаркое', 'соус', 'кекс', 'оладьи',
+)
+WORDS = (
+    'нарезать', 'обжарить', 'добавить', 'посолить', 'перемешать', 'варить',
+    'запекать', 'тушить', 'подавать', 'горячим', 'охладить', 'взбить',
+    'луком', 'морковью', 'сливками', 'сыром', 'зеленью', 'чесноком',
+    'минут', 'духовке', 'сковороде', 'кастрюле', 'медленном', 'огне',
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей')
+LAST_NAMES = ('Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова')
+PLACEHOLDER_IMAGE = 'recipes/images/placeholder.jpg'
+# Простое число для перестановки номеров: популярность по Ципфу не
+# должна совпадать с порядком первичных ключей.
+SCATTER_PRIME = 1000003
+# Даты регистрации отсчитываются от фиксированного момента, а не от
+# текущего времени, чтобы результат не зависел от дня запуска.
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def zipf_cum_weights(size, exponent):
+    """Накопленные веса рангов 1..size для random.choices."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def scatter(rank, size):
+    """Взаимно однозначно переставляет номер 0..size-1."""
+    if math.gcd(SCATTER_PRIME, size) != 1:
+        return rank
+    return rank * SCATTER_PRIME % size
+
+
+def distinct_choices(rnd, cum_weights, k):
+    """
+    k разных номеров по весам. Редкие номера из хвоста распределения
+    добираются равномерно, чтобы не крутить выборку бесконечно.
+    """
+    size = len(cum_weights)
+    k = min(k, size)
+    chosen = set()
+    for _ in range(3):
+        chosen.update(rnd.choices(
+            range(size), cum_weights=cum_weights, k=k - len(chosen)
+        ))
+        if len(chosen) == k:
+            break
+    while len(chosen) < k:
+        chosen.add(rnd.randrange(size))
+    return sorted(chosen)
+
+
+def placeholder_renditions():
+    """
+    Одно фото и его копии на все рецепты: рецепты ссылаются на файл по
+    имени, поэтому новые файлы не пишутся и копии не перестраиваются.
+    Копии прошлого запуска удаляются, чтобы имена файлов не получали
+    случайный суффикс и результат не зависел от запуска.
+    """
+    if not default_storage.exists(PLACEHOLDER_IMAGE):
+        buffer = BytesIO()
+        Image.new('RGB', (640, 480), (230, 180, 120)).save(buffer, 'JPEG')
+        default_storage.save(
+            PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue())
+        )
+    stem = os.path.splitext(os.path.basename(PLACEHOLDER_IMAGE))[0]
+    if default_storage.exists(UPLOAD_TO):
+        for name in default_storage.listdir(UPLOAD_TO)[1]:
+            if name.startswith(f'{stem}_'):
+                default_storage.delete(f'{UPLOAD_TO}/{name}')
+    return build_renditions(PLACEHOLDER_IMAGE)
+
+
+@contextmanager
+def deferred_indexes(models):
+    """
+    На PostgreSQL снимает индексы и ограничения из Meta на время
+    загрузки и строит их заново одним проходом по готовой таблице.
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    with connection.schema_editor() as editor:
+        for model in models:
+            for constraint in model._meta.constraints:
+                editor.remove_constraint(model, constraint)
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+                for constraint in model._meta.constraints:
+                    editor.add_constraint(model, constraint)
+
+
+class Generator:
+    """
+    Строит синтетические данные с перекосом, как в продакшене: немногие
+    авторы пишут большую часть рецептов, немногие рецепты собирают
+    большую часть избранного, ингредиенты имеют длинный хвост редких,
+    а у части пользователей огромные корзины. Каждая таблица берёт
+    случайные числа из своего генератора, поэтому при том же seed
+    результат одинаков.
+    """
+
+    def __init__(self, scale, seed, batch_size, password, stdout):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.password = password
+        self.stdout = stdout
+        self.users = max(2, round(SCALE_UNIT['users'] * scale))
+        self.recipes = max(1, round(SCALE_UNIT['recipes'] * scale))
+        self.ingredients = max(
+            20, round(SCALE_UNIT['ingredients'] * math.sqrt(scale))
+        )
+        # Первичные ключи задаются явно и продолжают существующие.
+        self.user_start = self.next_pk(User)
+        self.recipe_start = self.next_pk(Recipe)
+        self.ingredient_start = self.next_pk(Ingredient)
+        self.tag_start = self.next_pk(Tag)
+
+    @staticmethod
+    def next_pk(model):
+        return (model.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+    def random(self, table):
+        return random.Random(f'{self.seed}:{table}')
+
+    def user_pk(self, rank):
+        return self.user_start + scatter(rank, self.users)
+
+    def recipe_pk(self, rank):
+        return self.recipe_start + scatter(rank, self.recipes)
+
+    def insert(self, model, objects, label=None):
+        label = label or model._meta.verbose_name_plural
+        started = time.monotonic()
+        total = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            total += len(batch)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{label}: {total} строк за '
+            f'{elapsed:.1f} с ({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
+    def generate(self):
+        with deferred_indexes(
+            (Ingredient, AmountIngredient, Favorite, ShoppingCart, Subscribe)
+        ):
+            self.insert(User, self.iter_users())
+            self.insert(Tag, self.iter_tags())
+            self.insert(Ingredient, self.iter_ingredients())
+            self.insert(Recipe, self.iter_recipes())
+            # У автоматической промежуточной модели английское имя.
+            self.insert(
+                Recipe.tags.through, self.iter_recipe_tags(), 'Теги рецептов'
+            )
+            self.insert(AmountIngredient, self.iter_amounts())
+            self.insert(Favorite, self.iter_favorites())
+            self.insert(ShoppingCart, self.iter_carts())
+            self.insert(Subscribe, self.iter_subscriptions())
+        self.reset_sequences((User, Tag, Ingredient, Recipe))
+
+    @staticmethod
+    def reset_sequences(models):
+        """
+        Ключи вставлены явно, мимо последовательностей PostgreSQL:
+        без сброса следующий обычный INSERT получит занятый id. SQLite
+        продолжает счётчик сам, для него команд нет.
+        """
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def iter_users(self):
+        rnd = self.random('users')
+        # Хэш пароля считается один раз: make_password намеренно медленный.
+        # Соль фиксирована, чтобы при том же seed данные совпадали.
+        password = make_password(self.password, salt=f'generated{self.seed}')
+        for pk in range(self.user_start, self.user_start + self.users):
+            yield User(
+                id=pk,
+                username=f'user{pk}',
+                email=f'user{pk}@example.com',
+                first_name=rnd.choice(FIRST_NAMES),
+                last_name=rnd.choice(LAST_NAMES),
+                password=password,
+                date_joined=EPOCH + timedelta(minutes=pk),
+            )
+
+    def iter_tags(self):
+        for offset, (name, slug) in enumerate(TAGS):
+            pk = self.tag_start + offset
+            yield Tag(
+                id=pk,
+                name=name,
+                slug=f'{slug}-{pk}',
+                color=f'#{pk * 2654435761 % 0xFFFFFF:06X}',
+            )
+
+    def iter_ingredients(self):
+        rnd = self.random('ingredients')
+        for pk in range(
+            self.ingredient_start, self.ingredient_start + self.ingredients
+        ):
+            yield Ingredient(
+                id=pk,
+                name=f'ингредиент {pk}',
+                measurument_unit=rnd.choice(UNITS),
+            )
+
+    def iter_recipes(self):
+        rnd = self.random('recipes')
+        authors = zipf_cum_weights(self.users, 1.1)
+        renditions = placeholder_renditions()
+        for pk in range(self.recipe_start, self.recipe_start + self.recipes):
+            rank, = rnd.choices(range(self.users), cum_weights=authors)
+            yield Recipe(
+                id=pk,
+                author_id=self.user_pk(rank),
+                name=f'{rnd.choice(DISHES).capitalize()} {pk}',
+                text=' '.join(rnd.choices(WORDS, k=rnd.randint(8, 30))),
+                image=PLACEHOLDER_IMAGE,
+                renditions=renditions,
+                cooking_time=rnd.randint(5, 180),
+            )
+
+    def iter_recipe_tags(self):
+        rnd = self.random('recipe_tags')
+        tags = range(self.tag_start, self.tag_start + len(TAGS))
+        for pk in range(self.recipe_start, self.recipe_start + self.recipes):
+            for tag in sorted(rnd.sample(tags, rnd.randint(1, 3))):
+                yield Recipe.tags.through(recipe_id=pk, tag_id=tag)
+
+    def iter_amounts(self):
+        rnd = self.random('amounts')
+        ingredients = zipf_cum_weights(self.ingredients, 1.05)
+        for pk in range(self.recipe_start, self.recipe_start + self.recipes):
+            for rank in distinct_choices(
+                    rnd, ingredients, rnd.randint(3, 12)):
+                yield AmountIngredient(
+                    recipe_id=pk,
+                    ingredient_id=self.ingredient_start + rank,
+                    amount=rnd.randint(1, 500),
+                )
+
+    def iter_user_recipes(self, model, table, sizes):
+        rnd = self.random(table)
+        popularity = zipf_cum_weights(self.recipes, 0.9)
+        for pk in range(self.user_start, self.user_start + self.users):
+            for rank in distinct_choices(rnd, popularity, sizes(rnd)):
+                yield model(user_id=pk, recipe_id=self.recipe_pk(rank))
+
+    def iter_favorites(self):
+        return self.iter_user_recipes(
+            Favorite, 'favorites',
+            lambda rnd: min(500, int(rnd.paretovariate(1.3) * 4) - 4)
+        )
+
+    def iter_carts(self):
+        # У каждого двадцатого пользователя корзина на десятки рецептов.
+        return self.iter_user_recipes(
+            ShoppingCart, 'carts',
+            lambda rnd: (
+                rnd.randint(20, 150) if rnd.random() < 0.05
+                else rnd.randint(0, 4)
+            )
+        )
+
+    def iter_subscriptions(self):
+        rnd = self.random('subscriptions')
+        authors = zipf_cum_weights(self.users, 1.1)
+        for pk in range(self.user_start, self.user_start + self.users):
+            size = min(200, int(rnd.paretovariate(1.2) * 3) - 3)
+            for rank in distinct_choices(rnd, authors, size):
+                following = self.user_pk(rank)
+                if following != pk:
+                    yield Subscribe(follower_id=pk, following_id=following)
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетические пользователей, рецепты, избранное, '
+        'корзины и подписки. --scale 1 - 10 тысяч рецептов, --scale 100 - '
+        'миллион. При одном и том же --seed данные совпадают.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--password', default='password',
+            help='Общий пароль всех созданных пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        generator = Generator(
+            options['scale'], options['seed'], options['batch_size'],
+            options['password'], self.stdout
+        )
+        generator.generate()
+        # bulk_create не вызывает сигналы, которые ведут счётчики и
+        # сбрасывают кэши и индекс ингредиентов.
+        call_command('reconcile_counters', stdout=self.stdout)
+        for model in (Tag, Ingredient, Recipe):
+            catalogue_loaded.send(sender=model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с.'
+        ))
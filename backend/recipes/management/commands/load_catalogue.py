@@ -0,0 +1,154 @@
+import csv
+import json
+import re
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import Ingredient, Tag
+from recipes.signals import catalogue_loaded
+
+CSV_COLUMNS = {
+    'ingredient': ('name', 'measurument_unit'),
+    'tag': ('name', 'color', 'slug'),
+}
+WHITESPACE = re.compile(r'[\s,]*')
+
+
+def iter_json_array(stream, chunk_size=64 * 1024):
+    """Читает элементы JSON-массива по одному, не загружая весь файл."""
+    decoder = json.JSONDecoder()
+    buffer = stream.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив объектов.')
+    position = 1
+    eof = False
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON.')
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield obj
+        position = end
+
+
+def iter_json_rows(stream, model_name):
+    for obj in iter_json_array(stream):
+        if 'fields' in obj:
+            if obj.get('model', f'recipes.{model_name}') != (
+                    f'recipes.{model_name}'):
+                continue
+            obj = obj['fields']
+        yield obj
+
+
+def iter_csv_rows(stream, model_name):
+    columns = CSV_COLUMNS[model_name]
+    for row in csv.reader(stream):
+        if row:
+            yield dict(zip(columns, (value.strip() for value in row)))
+
+
+def upsert_ingredients(rows):
+    """
+    Добавляет ингредиенты, которых ещё нет. Ключ - пара название и
+    единица измерения, так что повторная загрузка ничего не меняет.
+    """
+    batch = {
+        (row['name'], row['measurument_unit']): row for row in rows
+    }
+    existing = set(
+        Ingredient.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list('name', 'measurument_unit')
+    )
+    created = Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurument_unit=unit)
+        for name, unit in batch.keys() - existing
+    )
+    return len(created), 0
+
+
+def upsert_tags(rows):
+    """Добавляет новые теги и обновляет название и цвет по slug."""
+    batch = {row['slug']: row for row in rows}
+    existing = Tag.objects.in_bulk(batch.keys(), field_name='slug')
+    changed = []
+    for slug, tag in existing.items():
+        row = batch[slug]
+        if (tag.name, tag.color) != (row['name'], row.get('color')):
+            tag.name, tag.color = row['name'], row.get('color')
+            changed.append(tag)
+    Tag.objects.bulk_update(changed, ('name', 'color'))
+    created = Tag.objects.bulk_create(
+        Tag(slug=slug, name=row['name'], color=row.get('color'))
+        for slug, row in batch.items() if slug not in existing
+    )
+    return len(created), len(changed)
+
+
+UPSERTS = {
+    'ingredient': (Ingredient, upsert_ingredients),
+    'tag': (Tag, upsert_tags),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты или теги из CSV или JSON-фикстуры пачками. '
+        'Существующие записи не дублируются, первичные ключи из фикстуры '
+        'не используются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--model', choices=UPSERTS.keys(), default='ingredient'
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='По умолчанию определяется по расширению файла.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        model_name = options['model']
+        file_format = options['format'] or options['path'].rsplit('.')[-1]
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Поддерживаются только CSV и JSON.')
+        iter_rows = iter_csv_rows if file_format == 'csv' else iter_json_rows
+        model, upsert = UPSERTS[model_name]
+        total = created = updated = 0
+        started = time.monotonic()
+        with open(options['path'], encoding='utf-8', newline='') as stream:
+            rows = iter_rows(stream, model_name)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    batch_created, batch_updated = upsert(batch)
+                total += len(batch)
+                created += batch_created
+                updated += batch_updated
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Обработано {total} строк, добавлено {created}, '
+                    f'обновлено {updated} ({total / elapsed:.0f} строк/с)'
+                )
+        catalogue_loaded.send(sender=model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {total} строк за {time.monotonic() - started:.2f} с, '
+            f'добавлено {created}, обновлено {updated}.'
+        ))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import RecipeImageUpload
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет фото, загруженные через /api/recipes/images/ и не '
+        'привязанные к рецепту дольше RECIPE_IMAGE_UPLOAD_TTL часов, '
+        'вместе с файлами. Запускается по расписанию.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=settings.RECIPE_IMAGE_UPLOAD_TTL
+        )
+
+    def handle(self, *args, **options):
+        expired = RecipeImageUpload.objects.filter(
+            created__lt=timezone.now() - timedelta(hours=options['hours'])
+        )
+        deleted = 0
+        for upload in list(expired):
+            # Фото могли привязать к рецепту после выборки: тогда строки
+            # уже нет, а файл принадлежит рецепту.
+            if RecipeImageUpload.objects.filter(pk=upload.pk).delete()[0]:
+                upload.image.delete(save=False)
+                deleted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено неиспользованных фото: {deleted}.'
+        ))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import rebuild_timelines
+from recipes.models import FeedItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит ленты подписок заново по подпискам и рецептам: после '
+        'изменения FEED_FANOUT_MAX_FOLLOWERS или сбоя при их обновлении.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            rebuild_timelines()
+        self.stdout.write(
+            f'Строк в лентах: {FeedItem.objects.count()} за '
+            f'{time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Subscribe
+
+User = get_user_model()
+
+# Счётчик: (модель, поле счётчика, связанная модель, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'following'),
+)
+
+
+def actual_count(related, field):
+    count = related.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(count), 0)
+
+
+def reconcile(model, counter, related, field, batch_size):
+    """
+    Пересчитывает счётчик диапазонами первичных ключей. Каждая пачка -
+    один UPDATE в своей транзакции, который трогает только строки с
+    расхождением, поэтому таблица не блокируется целиком.
+    """
+    last_pk = model.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    repaired = 0
+    for start in range(0, last_pk + 1, batch_size):
+        with transaction.atomic():
+            repaired += model.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).exclude(
+                **{counter: actual_count(related, field)}
+            ).update(**{counter: actual_count(related, field)})
+    return repaired
+
+
+class Command(BaseCommand):
+    help = (
+        'Исправляет расхождения денормализованных счётчиков: избранного у '
+        'рецептов, рецептов и подписчиков у пользователей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for model, counter, related, field in COUNTERS:
+            repaired = reconcile(
+                model, counter, related, field, options['batch_size']
+            )
+            self.stdout.write(
+                f'{model._meta.label}.{counter}: исправлено {repaired}'
+            )
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.16 on 2026-10-16 23:55
+
+from django.db import migrations, models
+from django.db.models import Min
+
+UNIQUE_FIELDS = {
+    'AmountIngredient': ('recipe', 'ingredient'),
+    'Favorite': ('user', 'recipe'),
+    'ShoppingCart': ('user', 'recipe'),
+}
+
+
+def remove_duplicates(apps, schema_editor):
+    """Оставляет по одной (первой) строке для каждой уникальной пары."""
+    for model_name, fields in UNIQUE_FIELDS.items():
+        model = apps.get_model('recipes', model_name)
+        first_ids = model.objects.values(*fields).annotate(
+            first_id=Min('id')
+        ).values('first_id')
+        model.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipeimageupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_prefix_idx', opclasses=('varchar_pattern_ops',)),
+        ),
+        migrations.AddConstraint(
+            model_name='amountingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
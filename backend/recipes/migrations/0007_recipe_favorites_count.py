@@ -0,0 +1,39 @@
+# Generated by Django 3.2.16 on 2026-10-16 23:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Счётчик: (модель, поле счётчика, связанная модель, поле связи).
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('users.CustomUser', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.CustomUser', 'followers_count', 'users.Subscribe', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, counter, related_name, field in COUNTERS:
+        count = apps.get_model(related_name).objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(count=Count('pk')).values('count')
+        apps.get_model(model_name).objects.update(
+            **{counter: Coalesce(Subquery(count), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_counters'),
+        ('recipes', '0006_lookup_indexes_and_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.16 on 2026-10-17 10:12
+
+from django.db import migrations
+
+# DDL записан прямо в миграции: она должна создавать ту же схему, как бы
+# ни менялся recipes.search. Строка индекса SQLite - id, название и
+# описание с ё, заменённой на е: unicode61 их не отождествляет.
+SQLITE_ROW = (
+    "{0}.id, replace(replace({0}.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace({0}.text, 'ё', 'е'), 'Ё', 'Е')"
+)
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_search USING fts5("
+    "name, text, content='', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_insert '
+    'AFTER INSERT ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_search(rowid, name, text) '
+    'VALUES ({new}); END',
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_delete '
+    'AFTER DELETE ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_search('
+    'recipes_recipe_search, rowid, name, text) '
+    "VALUES ('delete', {old}); END",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_search('
+    'recipes_recipe_search, rowid, name, text) '
+    "VALUES ('delete', {old}); "
+    'INSERT INTO recipes_recipe_search(rowid, name, text) '
+    'VALUES ({new}); END',
+    'INSERT INTO recipes_recipe_search(rowid, name, text) '
+    'SELECT {recipe} FROM recipes_recipe',
+)
+SQLITE_DROP = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_update',
+    'DROP TABLE IF EXISTS recipes_recipe_search',
+)
+POSTGRESQL_CREATE = (
+    'ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector '
+    'tsvector GENERATED ALWAYS AS ('
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')) STORED",
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx ON recipes_recipe '
+    'USING GIN (search_vector)',
+)
+POSTGRESQL_DROP = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+
+def run(schema_editor, statements):
+    rows = {
+        'new': SQLITE_ROW.format('new'),
+        'old': SQLITE_ROW.format('old'),
+        'recipe': SQLITE_ROW.format('recipes_recipe'),
+    }
+    for sql in statements.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql.format(**rows), params=None)
+
+
+def create_index(apps, schema_editor):
+    run(schema_editor, {
+        'postgresql': POSTGRESQL_CREATE, 'sqlite': SQLITE_CREATE,
+    })
+
+
+def drop_index(apps, schema_editor):
+    run(schema_editor, {
+        'postgresql': POSTGRESQL_DROP, 'sqlite': SQLITE_DROP,
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.16 on 2026-10-17 00:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    # Копия recipes.feed.rebuild_timelines на исторических моделях:
+    # миграция не должна зависеть от того, как модуль выглядит сейчас.
+    tables = {
+        name: apps.get_model(model)._meta.db_table
+        for name, model in (
+            ('feed', 'recipes.FeedItem'),
+            ('subscribe', 'users.Subscribe'),
+            ('recipe', 'recipes.Recipe'),
+            ('user', settings.AUTH_USER_MODEL),
+        )
+    }
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {feed} (user_id, recipe_id) '
+            'SELECT s.follower_id, r.id FROM {subscribe} s '
+            'JOIN {recipe} r ON r.author_id = s.following_id '
+            'JOIN {user} a ON a.id = s.following_id '
+            'WHERE a.followers_count < %s'.format(**tables),
+            [settings.FEED_FANOUT_MAX_FOLLOWERS],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в ленте',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='feeditem',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='feeditem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
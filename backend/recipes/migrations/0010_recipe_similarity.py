@@ -0,0 +1,81 @@
+# Generated by Django 3.2.16 on 2026-10-17 01:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Триггеры поискового индекса из 0008, записанные здесь же, чтобы
+# миграция не зависела от recipes.search.
+SQLITE_ROW = (
+    "{0}.id, replace(replace({0}.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace({0}.text, 'ё', 'е'), 'Ё', 'Е')"
+)
+SQLITE_TRIGGERS = (
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_insert '
+    'AFTER INSERT ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_search(rowid, name, text) '
+    'VALUES ({new}); END',
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_delete '
+    'AFTER DELETE ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_search('
+    'recipes_recipe_search, rowid, name, text) '
+    "VALUES ('delete', {old}); END",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_search_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+    'INSERT INTO recipes_recipe_search('
+    'recipes_recipe_search, rowid, name, text) '
+    "VALUES ('delete', {old}); "
+    'INSERT INTO recipes_recipe_search(rowid, name, text) '
+    'VALUES ({new}); END',
+)
+
+
+def restore_search_index(apps, schema_editor):
+    # В SQLite добавление поля пересоздаёт таблицу рецептов без триггеров
+    # поискового индекса. Строки индекса остаются: id рецептов те же.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    rows = {
+        'new': SQLITE_ROW.format('new'), 'old': SQLITE_ROW.format('old'),
+    }
+    for sql in SQLITE_TRIGGERS:
+        schema_editor.execute(sql.format(**rows), params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменён'),
+        ),
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('computed', models.DateTimeField(verbose_name='Рассчитано')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='recipes.recipe', verbose_name='Рецепт')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='recipes.recipe', verbose_name='Похожий рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipesimilarity',
+            index=models.Index(fields=['recipe', '-score', '-similar'], name='recipe_similarity_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipesimilarity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'similar'), name='unique_recipe_similarity'),
+        ),
+        migrations.RunPython(
+            restore_search_index, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.16 on 2026-10-17 02:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearch',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_row', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Строка поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+                'db_table': 'recipes_recipe_search',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,6 +1,14 @@
+import uuid
+from datetime import timedelta
+
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from users.models import CountersMixin
 
 User = get_user_model()
 
@@ -18,6 +26,15 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингридиент'
         verbose_name_plural = 'Ингридиенты'
+        indexes = (
+            # На PostgreSQL varchar_pattern_ops позволяет искать по началу
+            # названия (LIKE 'абв%') по индексу при любой локали.
+            models.Index(
+                fields=('name',),
+                name='ingredient_name_prefix_idx',
+                opclasses=('varchar_pattern_ops',)
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -49,7 +66,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     tags = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -78,6 +95,21 @@ class Recipe(models.Model):
     text = models.TextField(
         verbose_name='Описание рецепта'
     )
+    renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии фото'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменён'
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления в минутах',
         validators=(
@@ -88,9 +120,19 @@ class Recipe(models.Model):
         )
     )
 
+    counter_fields = ('favorites_count',)
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            # Последние рецепты автора для ленты без сортировки всех его
+            # рецептов.
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_id_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -112,6 +154,12 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избраные рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} добавил в избранное {self.recipe}'
@@ -133,11 +181,117 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепты в корзине'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} добавил в корзину {self.recipe}'
 
 
+class FeedItem(models.Model):
+    """
+    Рецепт в ленте подписчика. Строки создаются при публикации рецепта
+    и при подписке (recipes.feed), читаются по (user, recipe).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Похожий рецепт. Соседей каждого рецепта заранее считает команда
+    build_similar_recipes (recipes.similarity).
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarities',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+    computed = models.DateTimeField(
+        verbose_name='Рассчитано'
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_recipe_similarity'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score', '-similar'),
+                name='recipe_similarity_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class RecipeSearch(models.Model):
+    """
+    Строка полнотекстового индекса рецептов в SQLite: таблица FTS5,
+    которую создаёт миграция 0008_recipe_search и ведут триггеры.
+    Модель нужна, чтобы recipes.search соединял индекс с рецептами;
+    таблицей Django не управляет, в PostgreSQL её нет.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_row',
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_search'
+        verbose_name = 'Строка поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+
+
 class AmountIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -164,3 +318,93 @@ class AmountIngredient(models.Model):
     class Meta:
         verbose_name = 'Количество Ингридиентa'
         verbose_name_plural = 'Количество Ингридиентов'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            ),
+        )
+
+
+class RecipeImageUpload(models.Model):
+    """Фото, загруженное заранее, чтобы сослаться на него по id."""
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Владелец'
+    )
+    image = models.ImageField(
+        upload_to='recipes/images',
+        verbose_name='Фото рецепта'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата загрузки'
+    )
+
+    class Meta:
+        verbose_name = 'Загруженное фото'
+        verbose_name_plural = 'Загруженные фото'
+
+    def __str__(self):
+        return f'{self.owner} загрузил {self.image.name}'
+
+
+class DataVersion(models.Model):
+    """
+    Версия набора данных для кэшей, общих для всех процессов. Номер
+    растёт в одной транзакции с изменением, время изменения служит
+    Last-Modified и не повторяется, даже если изменений несколько в
+    одну секунду.
+    """
+    REFERENCE = 'reference'
+
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name='Набор данных'
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+    modified = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Изменён'
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+    @classmethod
+    def current(cls, name):
+        version, _ = cls.objects.get_or_create(name=name)
+        return version
+
+    @classmethod
+    def bump(cls, name):
+        """Новая версия: номер на 1 больше, время - хотя бы на секунду."""
+        queryset = cls.objects.filter(name=name)
+        changes = {
+            'version': F('version') + 1,
+            'modified': Greatest(
+                Value(timezone.now().replace(microsecond=0)),
+                ExpressionWrapper(
+                    F('modified') + timedelta(seconds=1),
+                    output_field=models.DateTimeField(),
+                ),
+            ),
+        }
+        if not queryset.update(**changes):
+            cls.objects.get_or_create(name=name)
+            queryset.update(**changes)
@@ -0,0 +1,148 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumb': 160,
+    'card': 480,
+    'full': 1280,
+}
+FORMATS = (
+    ('', 'JPEG', 'jpg'),
+    ('_webp', 'WEBP', 'webp'),
+)
+RENDITION_LABELS = tuple(
+    f'{label}{suffix}' for label in RENDITIONS for suffix, _, _ in FORMATS
+)
+UPLOAD_TO = 'recipes/renditions'
+
+_executor = None
+
+
+def build_renditions(name):
+    """
+    Строит уменьшенные копии фото рецепта в JPEG и WebP. Выполняется в
+    отдельном процессе и не обращается к базе данных.
+    """
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+    renditions = {'source': name}
+    for label, size in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for suffix, image_format, extension in FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=82)
+            renditions[f'{label}{suffix}'] = default_storage.save(
+                f'{UPLOAD_TO}/{stem}_{label}.{extension}',
+                ContentFile(buffer.getvalue()),
+            )
+    return renditions
+
+
+def save_renditions(recipe_id, renditions):
+    from .models import Recipe
+    from .signals import renditions_ready
+
+    # Фото могли заменить, пока строились копии: тогда они не нужны.
+    # Новый modified сбрасывает страницы списка с рецептом в кэше.
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=renditions['source']
+    ).update(renditions=renditions, modified=timezone.now())
+    if updated:
+        renditions_ready.send(sender=Recipe, recipe_id=recipe_id)
+    else:
+        delete_renditions(renditions)
+
+
+def delete_renditions(renditions):
+    """
+    Удаляет файлы копий, если на них не ссылается ни один рецепт:
+    рецепты generate_data делят одно фото и одни копии.
+    """
+    from .models import Recipe
+
+    label = RENDITION_LABELS[0]
+    if not renditions.get(label) or Recipe.objects.filter(
+        **{f'renditions__{label}': renditions[label]}
+    ).exists():
+        return
+    for label in RENDITION_LABELS:
+        if renditions.get(label):
+            default_storage.delete(renditions[label])
+
+
+def discard_renditions(recipe_id, renditions):
+    """Копии прежнего фото рецепта: убирает их из рецепта и удаляет."""
+    from .models import Recipe
+
+    Recipe.objects.filter(
+        pk=recipe_id, renditions__source=renditions['source']
+    ).update(renditions={})
+    delete_renditions(renditions)
+
+
+def _on_built(recipe_id, future):
+    try:
+        save_renditions(recipe_id, future.result())
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS
+        )
+    return _executor
+
+
+def schedule_renditions(recipe):
+    """
+    Отправляет фото рецепта на обработку в пул процессов. Результат
+    сохраняется в Recipe.renditions, когда копии готовы.
+    """
+    if not settings.IMAGE_RENDITION_WORKERS:
+        save_renditions(recipe.pk, build_renditions(recipe.image.name))
+        return
+    future = get_executor().submit(build_renditions, recipe.image.name)
+    future.add_done_callback(partial(_on_built, recipe.pk))
+
+
+def has_renditions(recipe):
+    return bool(recipe.image) and (
+        recipe.renditions.get('source') == recipe.image.name
+    )
+
+
+def get_rendition_urls(recipe):
+    """URL копий фото; пока копии не готовы - URL оригинала."""
+    return rendition_urls(
+        recipe.image.url, recipe.image.name, recipe.renditions
+    )
+
+
+def rendition_urls(image_url, image_name, renditions):
+    """get_rendition_urls по URL и имени файла фото и полю renditions."""
+    if not image_name or renditions.get('source') != image_name:
+        return dict.fromkeys(RENDITION_LABELS, image_url)
+    return {
+        label: default_storage.url(renditions[label])
+        for label in RENDITION_LABELS
+    }
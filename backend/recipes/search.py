@@ -0,0 +1,102 @@
+"""
+Полнотекстовый поиск рецептов по названию и описанию.
+
+В PostgreSQL - вычисляемый столбец tsvector с конфигурацией russian
+(название с весом A, описание - B) и GIN-индекс по нему. В SQLite для
+локальной работы - таблица FTS5, которую ведут триггеры. Морфологии в
+FTS5 нет, поэтому слова запроса грубо очищаются от русских окончаний
+и ищутся по префиксу, а ё заменяется на е и в индексе, и в запросе.
+Индексы создаёт миграция 0008_recipe_search, обновляет сама база.
+Миграции, которые в SQLite пересоздают таблицу рецептов, теряют её
+триггеры и создают их заново, как 0010_recipe_similarity; что они на
+месте, проверяет api.tests.SearchIndexTests.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, RecipeSearch
+
+RECIPE_TABLE = Recipe._meta.db_table
+SEARCH_TABLE = RecipeSearch._meta.db_table
+SEARCH_COLUMN = 'search_vector'
+SEARCH_CONFIG = 'russian'
+# Веса bm25 в SQLite для столбцов name и text: название важнее, как
+# вес A против B в PostgreSQL.
+SQLITE_WEIGHTS = (10.0, 1.0)
+# Окончания русских слов, длинные первыми. Грубая замена стеммера
+# snowball для SQLite: после отрезания должно остаться не меньше
+# MIN_STEM букв.
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ией', 'иях', 'ием', 'ать', 'ять', 'ить', 'еть', 'ешь', 'ишь',
+    'ете', 'ите', 'ает', 'яет', 'ует', 'ают', 'яют', 'уют', 'ала',
+    'ила', 'ыла', 'ено', 'ена', 'ены', 'ая', 'яя', 'ое', 'ее', 'ые',
+    'ие', 'ый', 'ий', 'ой', 'ей', 'ым', 'им', 'ом', 'ем', 'ам', 'ям',
+    'ах', 'ях', 'ых', 'их', 'ую', 'юю', 'ою', 'ею', 'ов', 'ев', 'ия',
+    'ья', 'ию', 'ью', 'ть', 'ет', 'ит', 'ут', 'ют', 'ат', 'ят', 'ла',
+    'ли', 'ло', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+# Предлоги и союзы: в PostgreSQL их отбрасывает словарь russian, а
+# в SQLite по префиксу они совпали бы почти с каждым рецептом.
+STOP_WORDS = frozenset((
+    'а', 'без', 'в', 'во', 'для', 'до', 'за', 'и', 'из', 'или', 'к',
+    'на', 'о', 'об', 'от', 'по', 'под', 'с', 'со', 'у',
+))
+WORD = re.compile(r'\w+')
+
+
+def stem(word):
+    """Слово без окончания, если после него остаётся основа."""
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def sqlite_match(query):
+    """Запрос FTS5: все слова запроса, каждое по префиксу основы."""
+    return ' '.join(
+        '"{}"*'.format(stem(word))
+        for word in WORD.findall(query.lower().replace('ё', 'е'))
+        if word not in STOP_WORDS
+    )
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты queryset, подходящие под запрос, самые релевантные первыми,
+    при равной релевантности - новые. В других СУБД - поиск подстроки
+    без ранжирования.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        column = f'{RECIPE_TABLE}.{SEARCH_COLUMN}'
+        return queryset.filter(RawSQL(
+            f'{column} @@ {tsquery}', (query,), output_field=BooleanField()
+        )).alias(search_rank=RawSQL(
+            f'ts_rank({column}, {tsquery})', (query,),
+            output_field=FloatField(),
+        )).order_by('-search_rank', '-id')
+    if vendor == 'sqlite':
+        match = sqlite_match(query)
+        if not match:
+            return queryset.none()
+        # Соединение, а не подзапрос по id: bm25 считается один раз для
+        # каждой найденной строки. Таблица индекса в запросе под своим
+        # именем, MATCH и bm25 обращаются к ней по нему.
+        return queryset.filter(
+            search_row__isnull=False,
+        ).filter(RawSQL(
+            f'{SEARCH_TABLE} MATCH %s', (match,), output_field=BooleanField()
+        )).alias(search_rank=RawSQL(
+            f'bm25({SEARCH_TABLE}, %s, %s)', SQLITE_WEIGHTS,
+            output_field=FloatField(),
+        )).order_by('search_rank', '-id')
+    return queryset.filter(
+        Q(name__icontains=query) | Q(text__icontains=query)
+    )
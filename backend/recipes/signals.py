@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from users import signals as users_signals  # noqa: F401
+from users.models import Subscribe
+
+from .autocomplete import ingredient_index
+from .coverage import recipe_coverage_index
+from .feed import fan_out, follow, rebuild_timelines, unfollow
+from .models import AmountIngredient, Favorite, Ingredient, Recipe
+from .renditions import (delete_renditions, discard_renditions,
+                         has_renditions, schedule_renditions)
+
+User = get_user_model()
+
+# Отправляется после массовой загрузки справочников или рецептов, которая
+# не вызывает post_save для каждой строки. sender - загруженная модель.
+catalogue_loaded = Signal()
+# Отправляется, когда готовы уменьшенные копии фото рецепта recipe_id.
+renditions_ready = Signal()
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient(sender, instance, **kwargs):
+    transaction.on_commit(lambda: ingredient_index.update(instance))
+
+
+@receiver(post_delete, sender=Ingredient)
+def unindex_ingredient(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: ingredient_index.remove(pk))
+
+
+@receiver(catalogue_loaded, sender=Ingredient)
+def reindex_ingredients(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+# Ингредиенты рецепта сохраняются через bulk_create без сигналов, но
+# всегда в одной транзакции с рецептом.
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=AmountIngredient)
+@receiver(post_delete, sender=AmountIngredient)
+def reindex_recipe_ingredients(sender, instance, **kwargs):
+    recipe_coverage_index.changed(
+        instance.pk if sender is Recipe else instance.recipe_id
+    )
+
+
+@receiver(catalogue_loaded, sender=Recipe)
+def reindex_recipes(sender, **kwargs):
+    recipe_coverage_index.reload()
+    rebuild_timelines()
+
+
+# Ленты меняются после коммита и смотрят на followers_count автора.
+# users.signals импортирован выше, поэтому его обработчики подключены
+# раньше и счётчик уже пересчитан, даже если коммит происходит сразу.
+@receiver(post_save, sender=Recipe)
+def add_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: fan_out(instance.pk))
+
+
+@receiver(post_save, sender=Subscribe)
+def add_author_to_feed(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: follow(instance.follower_id, instance.following_id)
+        )
+
+
+@receiver(post_delete, sender=Subscribe)
+def remove_author_from_feed(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: unfollow(instance.follower_id, instance.following_id)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    if instance.image and not has_renditions(instance):
+        transaction.on_commit(lambda: schedule_renditions(instance))
+    # Фото заменили: копии прежнего больше не нужны.
+    stale = instance.renditions
+    if stale.get('source') not in (None, instance.image.name):
+        transaction.on_commit(
+            lambda: discard_renditions(instance.pk, stale)
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_renditions(sender, instance, **kwargs):
+    renditions = instance.renditions
+    if renditions:
+        transaction.on_commit(lambda: delete_renditions(renditions))
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        User.change_counter(instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    User.change_counter(instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        Recipe.change_counter(instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    Recipe.change_counter(instance.recipe_id, 'favorites_count', -1)
@@ -0,0 +1,78 @@
+"""
+Похожие рецепты: косинусная мера над разреженной матрицей рецепт ×
+ингредиент (и теги, если RECIPE_SIMILARITY_TAGS) из нулей и единиц.
+Для рецепта с n признаками и рецепта с s признаками, c из которых общие,
+сходство - c / sqrt(n * s).
+
+Столбцы матрицы хранятся битовыми картами рецептов, как в
+recipes.coverage: сложив карты признаков рецепта, получаем число общих
+признаков сразу со всеми рецептами, а лучших соседей выбираем по
+уровням (s, c) в порядке убывания сходства, не перебирая рецепты.
+Соседей заранее считает команда build_similar_recipes.
+"""
+import math
+from collections import defaultdict
+from itertools import islice
+
+from .coverage import add_bitmap, bitmap_of, ranked
+from .models import AmountIngredient, Recipe
+
+
+class RecipeMatrix:
+    """Матрица рецепт × признак в памяти команды."""
+
+    def __init__(self, features):
+        # features: id рецепта -> признаки (('ingredient', id), ...).
+        self.features = features
+        postings = defaultdict(list)
+        by_size = defaultdict(list)
+        for recipe_id, recipe_features in features.items():
+            by_size[len(recipe_features)].append(recipe_id)
+            for feature in recipe_features:
+                postings[feature].append(recipe_id)
+        self.bitmaps = {
+            feature: bitmap_of(recipe_ids)
+            for feature, recipe_ids in postings.items()
+        }
+        self.size_bitmaps = {
+            size: bitmap_of(recipe_ids)
+            for size, recipe_ids in by_size.items()
+        }
+
+    @classmethod
+    def load(cls, with_tags=False):
+        features = defaultdict(list)
+        for recipe_id, ingredient_id in AmountIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by().iterator(chunk_size=10000):
+            features[recipe_id].append(('ingredient', ingredient_id))
+        if with_tags:
+            for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+                'recipe_id', 'tag_id'
+            ).order_by().iterator(chunk_size=10000):
+                features[recipe_id].append(('tag', tag_id))
+        return cls(features)
+
+    def scores(self, recipe_id, floor=0):
+        """
+        Пары (сходство, id) рецептов с общими признаками по убыванию
+        сходства, при равном - новые первыми, пока сходство не меньше
+        floor. Сам рецепт пропускается.
+        """
+        recipe_features = self.features.get(recipe_id, ())
+        counter = []
+        for feature in recipe_features:
+            add_bitmap(counter, self.bitmaps[feature])
+        total = len(recipe_features)
+        levels = sorted((
+            (common / math.sqrt(total * size), size, common)
+            for size in self.size_bitmaps
+            for common in range(1, min(total, size) + 1)
+        ), reverse=True)
+        levels = [level for level in levels if level[0] >= floor]
+        for score, similar_id in ranked(counter, self.size_bitmaps, levels):
+            if similar_id != recipe_id:
+                yield score, similar_id
+
+    def nearest(self, recipe_id, count):
+        return list(islice(self.scores(recipe_id), count))
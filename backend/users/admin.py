@@ -5,7 +5,10 @@ from .models import CustomUser, Subscribe
 
 @admin.register(CustomUser)
 class AdminCustomUser(admin.ModelAdmin):
-    list_display = ('username', 'id', 'first_name', 'last_name')
+    list_display = (
+        'username', 'id', 'first_name', 'last_name', 'recipes_count',
+        'followers_count'
+    )
     fields = (
         ('username', 'email', ),
         ('first_name', 'last_name',)
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-16 23:55
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """Оставляет по одной (первой) подписке для каждой пары."""
+    Subscribe = apps.get_model('users', 'Subscribe')
+    first_ids = Subscribe.objects.values('follower', 'following').annotate(
+        first_id=Min('id')
+    ).values('first_id')
+    Subscribe.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscribe',
+            constraint=models.UniqueConstraint(fields=('follower', 'following'), name='unique_subscribe'),
+        ),
+    ]
@@ -1,8 +1,40 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F
 
 
-class CustomUser(AbstractUser):
+class CountersMixin:
+    """
+    Денормализованные счётчики меняются только выражениями F() в
+    сигналах. Обычное сохранение объекта их не записывает, чтобы не
+    затереть устаревшим значением, прочитанным до сохранения: из UPDATE
+    выпадают только они, а update_fields, сигналы и вставка новой строки
+    остаются такими же, как у любой модели. Явно перечисленные в
+    update_fields счётчики записываются.
+    """
+    counter_fields = ()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        if update_fields is None:
+            values = [
+                value for value in values
+                if value[0].name not in self.counter_fields
+            ]
+        return super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+
+    @classmethod
+    def change_counter(cls, pk, field, delta):
+        """Атомарно меняет счётчик, не опуская его ниже нуля."""
+        queryset = cls.objects.filter(pk=pk)
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**{field: F(field) + delta})
+
+
+class CustomUser(CountersMixin, AbstractUser):
     email = models.EmailField(
         max_length=254,
         verbose_name='Почта',
@@ -31,6 +63,18 @@ class CustomUser(AbstractUser):
             "unique": "Пользователь с таким именем уже существует",
         },
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -57,6 +101,12 @@ class Subscribe(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('follower', 'following'),
+                name='unique_subscribe'
+            ),
+        )
 
     def __str__(self):
         return f'{self.follower} подписался на {self.following}'
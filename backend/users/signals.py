@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser, Subscribe
+
+
+@receiver(post_save, sender=Subscribe)
+def increment_followers_count(sender, instance, created, **kwargs):
+    if created:
+        CustomUser.change_counter(
+            instance.following_id, 'followers_count', 1
+        )
+
+
+@receiver(post_delete, sender=Subscribe)
+def decrement_followers_count(sender, instance, **kwargs):
+    CustomUser.change_counter(instance.following_id, 'followers_count', -1)